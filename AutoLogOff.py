@@ -1,113 +1,106 @@
+from __future__ import annotations
 import os
-import json
-import smtplib
+import sys
+import shutil
+import argparse
 import platform
 import traceback
+import metrics
 import subprocess
-from time import sleep
+from time import sleep, monotonic, perf_counter
 from xml_logging import XML_Logger
-from email.mime.text import MIMEText
-from cryptography.fernet import Fernet
+from email_outbox import Email_Outbox
+from configuration import Configuration, Configuration_Source, get_source, invalid_keys, DEFAULTS
+from session_scheduler import Deadline_Scheduler, run_in_tk, schedule_session
+from typing import Callable, TYPE_CHECKING
 from datetime import datetime,timedelta
-from email.mime.multipart import MIMEMultipart
-from tkinter import Tk, messagebox, simpledialog, Toplevel, Label 
+# tkinter, cryptography, smtplib and email.mime are imported by the functions that use them. This program starts
+# at every login, see benchmarks/bench_startup.py
+if TYPE_CHECKING:
+    from tkinter import Tk
 
 def block_alt_f4(event):
     return 'break'
 
-def get_configuration() -> dict[str,str|bool|int]|None:
+def get_configuration(path:str="Config.encrypted", key_path:str="secret.key") -> Configuration|None:
     """
-    Get the configuration from corresponding Config.json.
+    Get the configuration from corresponding Config.encrypted, decrypted with the key(s) in secret.key.
+    Decrypted once and cached until the file changes, see configuration.Configuration_Source.
 
-    Returns a configuration made as a dictionary.
+    Returns a configuration usable as a dictionary or through attributes.
     """
     try:
-        # Load encryption key
-        with open("secret.key", "rb") as key_file:
-            key = key_file.read()
-
-        fernet = Fernet(key)
-
-        # Decrypt the config file
-        with open("Config.encrypted", "rb") as encrypted_file:
-            decrypted_data:bytes = fernet.decrypt(encrypted_file.read())
-        
-        configuration = json.loads(decrypted_data.decode(errors="ignore"))
-        return configuration
+        return get_source(path, key_path=key_path).current()
     except Exception as e:
         traceback.print_exc()
         return None
     
-def get_configuration_without_encryption() -> dict[str,str|bool|int]|None:
+def get_configuration_without_encryption(path:str="Config.json") -> Configuration|None:
     """
-    Get the configuration from corresponding Config.json.
+    Get the configuration from corresponding Config.json, or the file at path. Cached until the file changes.
 
-    Returns a configuration made as a dictionary.
+    Returns a configuration usable as a dictionary or through attributes.
     """
     try:
-        # Load encryption key
-        with open("Config.json", "rb") as key_file:
-            return json.loads(key_file.read())
+        return get_source(path).current()
     except Exception as e:
         traceback.print_exc()
         return None
 
 def _verify_configuration(configuration:dict[str,str|bool|int], logger:XML_Logger) -> bool:
+    """Checks the configuration against configuration.SETTINGS (compiled once at import) and logs the keys that are missing or invalid."""
     if configuration is None:
         return False
-    required_keys:dict[str,str] =   {
-                                        "Logger_Base_Directory":str,
-                                        "Logger_Filename":str,
-                                        "Logger_Archive_Folder":str,
-                                        "SMTP_SSL_Host":str,
-                                        "SMTP_SSL_Port":int,
-                                        "Sender_Email":str,
-                                        "Sender_Email_Password":str,
-                                        "To_Email":str,
-                                        "CC_Email":str,
-                                        "Warn_User_Of_Logoff":bool,
-                                        "Logoff_Warning_Time_Left":int,
-                                        "DEBUG":bool
-                                    }
-    missing_keys:list[str] = []
-    for key,item in required_keys.items():
-        if(
-            (key not in configuration.keys())or
-            (not(isinstance(configuration[key],item)))or
-            (configuration[key] is None) or
-            (configuration[key] == "")
-          ):
-            missing_keys.append(key)
-        if(
-            (key in configuration.keys())and
-            (key == "Logoff_Warning_Time_Left")and 
-            (configuration[key] < 1)
-          ):
-            missing_keys.append(key)
+    missing_keys:list[str] = invalid_keys(configuration)
     if missing_keys:
         logger.log_to_xml(message=f"Missing required keys in configuration: {missing_keys}. Terminating program.",status="CRITICAL",basepath=logger.base_dir)
         return False
     return True
 
 def get_logger(configuration:dict[str,str|bool|int]) -> XML_Logger:
-    """Get the logger that will be used to log information and errors to developer for future debugging."""
+    """
+    Get the logger that will be used to log information and errors to developer for future debugging.
+    Optional settings with an invalid value fall back to their default, so the logger still starts and can report them.
+    """
+    invalid:list[str] = invalid_keys(configuration)
+    def optional(name:str):
+        return DEFAULTS[name] if name in invalid else configuration.get(name, DEFAULTS[name])
     logger:XML_Logger = XML_Logger(
                                     log_file=configuration["Logger_Filename"], 
                                     archive_folder=configuration["Logger_Archive_Folder"],
                                     log_retention_days=30,
-                                    base_dir=configuration["Logger_Base_Directory"]
+                                    base_dir=configuration["Logger_Base_Directory"],
+                                    asynchronous=optional("Logger_Asynchronous"),
+                                    archive_compression=optional("Logger_Archive_Compression"),
+                                    backend=optional("Logger_Backend"),
+                                    concurrent=optional("Logger_Concurrent")
                                   )
     return logger
 
+def get_outbox(configuration:dict[str,str|bool|int], logger:XML_Logger, source:Configuration_Source|None=None) -> Email_Outbox:
+    """
+    Get the outbox that sends the login and logoff receipts in the background, spooled under the logger's base directory.
+    Given the source of the configuration, the outbox follows changes to the SMTP settings while the session runs.
+    """
+    outbox:Email_Outbox = Email_Outbox(
+                                        configuration=configuration if source is None else source,
+                                        logger=logger,
+                                        spool_directory=os.path.join(logger.base_dir, configuration.get("Email_Outbox_Folder", "outbox"))
+                                      )
+    return outbox
+
+@metrics.timed_calls("dialog_discretion")
 def display_discretion_message() -> None:
     """
     Display a warning message to the user that this is an automated program to shut the computer off after a set period of time.
     Terminating the program early will result in computer privileges revoked.
     """
+    from tkinter import messagebox
     # Display information to the user
     messagebox.showinfo("DISCRETION", """This is the automatic logoff program. It will log the computer off after a pre-designated number of minutes.
 If the program is closed at any point while the computer is logged on, the IT director and the administrator will be notified immediately and you will be asked to leave the computer.""")
 
+@metrics.timed_calls("dialog_minutes")
 def get_number_of_user_minutes() -> int:
     """
     Displays a message for management asking how many total minutes the user will be permitted to use the computer.
@@ -117,6 +110,7 @@ def get_number_of_user_minutes() -> int:
     Returns:
         >>> int representing number of total minutes the user will be permitted to use the computer before it is forcefully logged off.
     """
+    from tkinter import simpledialog
     # Get user input
     logoff_minutes:str = simpledialog.askstring("TIME", "How many total minutes will be permitted until the computer is logged off?\nMinimum 1 minute. Maximum 120 minutes. ")
     if(logoff_minutes is None):
@@ -183,7 +177,7 @@ def get_start_and_end_times(minutes:int) -> tuple[datetime,int,int,int,int,str]:
         end_minute:str = str(end_minute)
     return end_time,start_hour,start_minute,end_hour,end_minute,f"The login time is {start_hour}:{start_minute} {am_pm_start}\nYou will be logged off at {end_hour}:{end_minute} {am_pm_end}"
 
-def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:int, end_minute:int, configuration:dict[str,str|bool|int], logging_in:bool) -> None:
+def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:int, end_minute:int, configuration:dict[str,str|bool|int], logging_in:bool, outbox:Email_Outbox|None=None) -> None:
     """
     Email To and CC any management or developers about when a user logs on or off the computer. This is meant as an external record in case the logs on the 
     computer are corrupted in any way. 
@@ -195,6 +189,7 @@ def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:
         start_minute : int to inform the minute the computer was logged in
         end_hour : int to inform the hour the computer was logged off
         end_minute : int to inform the minute the computer was logged off
+        outbox : Email_Outbox to queue the receipt in instead of sending it on this thread. The outbox sends it in the background and logs the result
 
     Returns:
     --------
@@ -207,6 +202,12 @@ def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:
         else:
             subject = f"Computer {platform.node()} Log Off"
             body = f"Computer {platform.node()} successfully logged off."
+        if outbox is not None:
+            outbox.enqueue(subject=subject, body=body)
+            return
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
         message = MIMEMultipart('alternative')
         rcpt = [configuration["To_Email"],configuration["CC_Email"]]
         message['Subject'] = subject
@@ -215,7 +216,7 @@ def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:
         message['Cc'] = configuration["CC_Email"]
         html_part = MIMEText(body)
         message.attach(html_part)
-        with smtplib.SMTP_SSL(configuration["SMTP_SSL_Host"], configuration["SMTP_SSL_Port"]) as server:
+        with metrics.timed("smtp_receipt"), smtplib.SMTP_SSL(configuration["SMTP_SSL_Host"], configuration["SMTP_SSL_Port"]) as server:
             server.login(configuration["Sender_Email"], configuration["Sender_Email_Password"])
             server.sendmail(configuration["Sender_Email"], rcpt, message.as_string())
         logger.log_to_xml(message=f"Login email successfully sent to {rcpt}.",status="SUCCESS",basepath=logger.base_dir)
@@ -225,10 +226,11 @@ def email_receipt(logger:XML_Logger, start_hour:int, start_minute:int, end_hour:
 def non_blocking_warning(root: Tk, title: str, message: str, duration_ms: int = 10000) -> None:
     """
     Show a non-modal, top-most notification window that auto-destroys after `duration_ms`.
-    This does not block the main thread (provided run_sleep_loop calls root.update()
-    periodically so Tk event callbacks run).
+    This does not block the main thread (run_sleep_loop keeps root.mainloop() running
+    between deadlines so Tk event callbacks run).
     """
     try:
+        from tkinter import Toplevel, Label
         popup = Toplevel(root)
         popup.title(title)
         popup.overrideredirect(True)            # remove window decorations (no close button)
@@ -254,12 +256,45 @@ def non_blocking_warning(root: Tk, title: str, message: str, duration_ms: int =
         # (don't raise — notifications are best-effort)
         pass
 
-def run_sleep_loop(logger: XML_Logger, end_time: datetime, minutes: int, configuration: dict[str, str | bool | int], root: Tk) -> None:
+def schedule_session_events(scheduler:Deadline_Scheduler, logger:XML_Logger, end_time:datetime, minutes:int,
+                            configuration:dict[str,str|bool|int], warn:Callable[[str,str],None]) -> None:
+    """
+    Schedule the minute heartbeats, the optional low time warning and the end of the session on scheduler. The end time
+    is read against the wall clock once, every deadline after that is measured on the scheduler's monotonic clock so
+    changes to the system clock do not shorten or extend the session.
+
+    Arguments
+    ---------
+        scheduler : Deadline_Scheduler the events are added to
+        logger : XML_Logger to log every minute that passes to keep tabs in case user logs off early
+        end_time : datetime the session ends at
+        minutes : int representing the total number of minutes the user has access to the computer
+        configuration : dictionary of how the program is meant to run. Decides if the user is warned about low time, and how many minutes before being logged off
+        warn : function called with a title and a message to warn the user
+    """
+    end_deadline:float = scheduler.clock() + max(0.0, (end_time - datetime.now()).total_seconds())
+
+    def log_minutes_left(seconds_left:float) -> None:
+        minutes_left = round(seconds_left / 60)
+        logger.log_to_xml(message=f"{minutes_left:,.0f}/{minutes} minutes remaining",
+                          status="INFO", basepath=logger.base_dir)
+
+    def warn_user(seconds_left:float) -> None:
+        minutes_left = round(seconds_left / 60)
+        warn("LOGOFF WARNING", f"Logging off in {minutes_left} minute(s). Save your progress!")
+
+    warning_seconds:float|None = None
+    if configuration.get("Warn_User_Of_Logoff") and (configuration.get("Logoff_Warning_Time_Left") is not None):
+        warning_seconds = float(configuration["Logoff_Warning_Time_Left"]) * 60
+    schedule_session(scheduler, end_deadline, on_heartbeat=log_minutes_left,
+                     warning_seconds=warning_seconds, on_warning=warn_user)
+
+def run_sleep_loop(logger: XML_Logger, end_time: datetime, minutes: int, configuration: dict[str, str | bool | int], root: Tk, clock=monotonic) -> None:
     """
-    Silently keep the program running in the background checking every 60 seconds how many minutes are left and logging the information. 
+    Silently keep the program running in the background, logging how many minutes are left every 60 seconds. 
     Logging every minute helps us keep track if a user willingly logs off early, the program will terminate, but the logs will inform
     management that no rules were violated since the logs will inform of the early log off. Also, inform the user when their time is almost
-    out.
+    out. Nothing runs between those events: a single Tk timer is armed for the next deadline, see schedule_session_events.
 
     Arguments
     ---------
@@ -267,32 +302,50 @@ def run_sleep_loop(logger: XML_Logger, end_time: datetime, minutes: int, configu
         end_time : datetime to terminate the loop when the current date surpasses the end time
         minutes : int representing the total number of minutes the user has access to the computer
         configuration : dictionary of how the program is meant to run. Configurations used in this are to decide if the user is warned about low time, and how many minutes the user has left before being logged off
+        root : hidden Tk window that shows the warning popup
+        clock : monotonic clock the deadlines are measured on
     """
-    while datetime.now() < end_time:
-        seconds_left = int((end_time - datetime.now()).total_seconds())
-        minutes_left = round(seconds_left / 60)
+    scheduler:Deadline_Scheduler = Deadline_Scheduler(clock=clock)
+    schedule_session_events(scheduler, logger, end_time, minutes, configuration,
+                            warn=lambda title, message: non_blocking_warning(root, title, message, duration_ms=10000))
+    run_in_tk(scheduler, root)
 
-        logger.log_to_xml(message=f"{minutes_left:,.0f}/{minutes} minutes remaining",
-                          status="INFO", basepath=logger.base_dir)
+def run_headless_loop(logger:XML_Logger, end_time:datetime, minutes:int, configuration:dict[str,str|bool|int],
+                      warn:Callable[[str,str],None], clock=monotonic, wait:Callable[[float],object]=sleep) -> None:
+    """
+    Same events as run_sleep_loop without Tk: the thread sleeps with wait(seconds) until the next deadline and
+    nothing runs in between. Warnings go through warn(title, message).
+    """
+    scheduler:Deadline_Scheduler = Deadline_Scheduler(clock=clock)
+    schedule_session_events(scheduler, logger, end_time, minutes, configuration, warn=warn)
+    scheduler.run(wait=wait)
 
-        # conditional extra warning when configured
-        if (configuration.get("Warn_User_Of_Logoff") and
-                (minutes_left == configuration.get("Logoff_Warning_Time_Left"))):
-            non_blocking_warning(root, "LOGOFF WARNING",
-                                 f"Logging off in {minutes_left} minute(s). Save your progress!",
-                                 duration_ms=10000)
-
-        # Wait up to the next minute but keep Tk events flowing.
-        # Sleep in 1-second increments and call root.update() so that popup.after works.
-        # If there's less than 60 seconds left, loop only for that many seconds.
-        wait_seconds = min(60, max(1, seconds_left))
-        for _ in range(wait_seconds):
-            sleep(1)
-            try:
-                root.update()
-            except Exception:
-                # If root has been destroyed, just continue; we still need to reach end_time.
-                pass
+def send_headless_warning(title:str, message:str, configuration:dict[str,str|bool|int], logger:XML_Logger|None=None) -> None:
+    """
+    Warn the user without a Tk window. Uses the command in Headless_Warning_Command when configured (a list of
+    arguments where {title} and {message} are filled in), otherwise notify-send on a desktop session, wall on a
+    terminal session or msg on Windows, and always prints the warning to stderr. Best-effort, never raises: a command
+    that cannot be built or run is logged to logger when given, printed otherwise.
+    """
+    print(f"{title}: {message}", file=sys.stderr, flush=True)
+    try:
+        command:list[str]|None = None
+        if configuration.get("Headless_Warning_Command"):
+            command = [argument.format(title=title, message=message) for argument in configuration["Headless_Warning_Command"]]
+        elif platform.system() == "Windows":
+            command = ["msg", "*", f"{title}: {message}"]
+        elif (os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")) and shutil.which("notify-send"):
+            command = ["notify-send", "--urgency=critical", title, message]
+        elif shutil.which("wall"):
+            command = ["wall", f"{title}: {message}"]
+        if command is None:
+            return
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+    except Exception:
+        if logger is None:
+            traceback.print_exc()
+        else:
+            logger.log_to_xml(message=f"Warning could not be shown. Official error: {traceback.format_exc()}",status="ERROR",basepath=logger.base_dir)
 
 def logoff_computer(debugging:bool):
     """
@@ -305,12 +358,68 @@ def logoff_computer(debugging:bool):
     else:
         subprocess.run(["pkill", "-SIGTERM", "-u", os.getenv("USER")])
 
-def main() -> None:
-    configuration:dict[str,str|bool|int] = get_configuration_without_encryption()
+def parse_arguments(argv:list[str]|None=None) -> argparse.Namespace:
+    """Command line options. Each one can also be set through its AUTOLOGOFF_ environment variable."""
+    parser = argparse.ArgumentParser(description="Log the computer off after a set number of minutes.")
+    parser.add_argument("--headless", action="store_true", default=os.getenv("AUTOLOGOFF_HEADLESS", "").lower() in ("1", "true", "yes"),
+                        help="Run without Tk, taking the minutes from --minutes and warning through notify-send/wall (AUTOLOGOFF_HEADLESS)")
+    parser.add_argument("--minutes", type=int, default=os.getenv("AUTOLOGOFF_MINUTES"),
+                        help="Total minutes before the computer is logged off, 1-120. Required in headless mode (AUTOLOGOFF_MINUTES)")
+    parser.add_argument("--config", default=os.getenv("AUTOLOGOFF_CONFIG", "Config.json"),
+                        help="Path of the JSON configuration (AUTOLOGOFF_CONFIG)")
+    return parser.parse_args(argv)
+
+def run_session(configuration:dict[str,str|bool|int], logger:XML_Logger, minutes:int, warn:Callable[[str,str],None],
+                wait_for_end:Callable[[datetime],None], source:Configuration_Source|None=None) -> None:
+    """
+    Everything after the number of minutes is known: announce the login and logoff times, send the receipts, wait
+    for the end of the session with wait_for_end(end_time) and log the computer off.
+    """
+    outbox:Email_Outbox = get_outbox(configuration=configuration, logger=logger, source=source)
+    outbox.start() # Also sends receipts left unsent by earlier sessions
+    end_time,start_hour,start_minute,end_hour,end_minute,start_end_time_message = get_start_and_end_times(minutes)
+    warn("LOGOFF TIME", start_end_time_message)
+    logger.log_to_xml(start_end_time_message,basepath=logger.base_dir,status="INFO")
+    email_receipt(logger=logger, start_hour=start_hour, start_minute=start_minute, end_hour=end_hour, end_minute=end_minute, logging_in=True, configuration=configuration, outbox=outbox)
+    wait_for_end(end_time)
+    email_receipt(logger=logger, start_hour=start_hour, start_minute=start_minute, end_hour=end_hour, end_minute=end_minute, logging_in=False, configuration=configuration, outbox=outbox)
+    outbox.close(timeout=configuration.get("Email_Outbox_Grace_Seconds", 5)) # Receipts not sent in time stay in the outbox for the next session
+    logger.close() # Write every queued log entry before the session ends
+    metrics.write_session_metrics(logger.base_dir, configuration)
+    logoff_computer(configuration["DEBUG"])
+
+def main_headless(configuration:dict[str,str|bool|int], logger:XML_Logger, minutes:int|None,
+                  warn:Callable[[str,str],None]|None=None, source:Configuration_Source|None=None) -> None:
+    """
+    Run a session without a display: no Tk, no dialogs, and the process sleeps until the next deadline.
+    warn(title, message) replaces send_headless_warning when given, e.g. to hook the warnings into another program.
+    """
+    if (minutes is None) or (minutes <= 0) or (minutes > 120):
+        logger.log_to_xml(message=f"Headless mode needs --minutes or AUTOLOGOFF_MINUTES between 1 and 120, got {minutes}. Terminating program.",status="CRITICAL",basepath=logger.base_dir)
+        logger.close()
+        return
+    if warn is None:
+        warn = lambda title, message: send_headless_warning(title, message, configuration, logger)
+    run_session(configuration, logger, minutes, warn=warn,
+                wait_for_end=lambda end_time: run_headless_loop(logger, end_time, minutes, configuration, warn=warn), source=source)
+
+def main(argv:list[str]|None=None) -> None:
+    arguments:argparse.Namespace = parse_arguments(argv)
+    config_started:float = perf_counter()
+    configuration:dict[str,str|bool|int] = get_configuration_without_encryption(arguments.config)
+    config_seconds:float = perf_counter() - config_started
+    if metrics.configure(configuration) and (configuration is not None):
+        # Metrics are only switched on by the configuration they would have timed, so the first load is timed here
+        metrics.observe("config_load", config_seconds)
     logger:XML_Logger = get_logger(configuration=configuration)
     if(not(_verify_configuration(configuration=configuration,logger=logger))):
         return
-    root:Tk = Tk()
+    if arguments.headless:
+        main_headless(configuration, logger, arguments.minutes, source=get_source(arguments.config))
+        return
+    from tkinter import Tk, messagebox
+    with metrics.timed("tk_startup"):
+        root:Tk = Tk()
     root.withdraw() # Hide the main window
     root.bind('<Alt-F4>', block_alt_f4)
     root.protocol("WM_DELETE_WINDOW", lambda: None)  # Disable the close button
@@ -320,13 +429,9 @@ def main() -> None:
     minutes:int = get_number_of_user_minutes()
     if(minutes == -1):
         return
-    end_time,start_hour,start_minute,end_hour,end_minute,start_end_time_message = get_start_and_end_times(minutes)
-    non_blocking_warning(root, "LOGOFF TIME", start_end_time_message, duration_ms=10000)
-    logger.log_to_xml(start_end_time_message,basepath=logger.base_dir,status="INFO")
-    email_receipt(logger=logger, start_hour=start_hour, start_minute=start_minute, end_hour=end_hour, end_minute=end_minute, logging_in=True, configuration=configuration)
-    run_sleep_loop(logger, end_time, minutes, configuration, root)
-    email_receipt(logger=logger, start_hour=start_hour, start_minute=start_minute, end_hour=end_hour, end_minute=end_minute, logging_in=False, configuration=configuration)
-    logoff_computer(configuration["DEBUG"])
+    run_session(configuration, logger, minutes,
+                warn=lambda title, message: non_blocking_warning(root, title, message, duration_ms=10000),
+                wait_for_end=lambda end_time: run_sleep_loop(logger, end_time, minutes, configuration, root), source=get_source(arguments.config))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
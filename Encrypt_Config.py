@@ -1,6 +1,31 @@
+"""
+Encrypts Config.json into Config.encrypted with the key in secret.key (created on first use):
+
+    python Encrypt_Config.py
+
+Batch mode for provisioning many machines. SOURCE is a folder of <machine>.json files or a JSON manifest mapping
+machine names to config paths. Every machine gets OUTPUT/<machine>/Config.encrypted and a copy of secret.key:
+
+    python Encrypt_Config.py batch SOURCE --output OUTPUT [--workers N]
+    python Encrypt_Config.py verify --output OUTPUT [--source SOURCE]
+    python Encrypt_Config.py rotate --output OUTPUT [--drop-old-keys]
+
+rotate adds a new key in front of secret.key, re-encrypts every machine with it (MultiFernet.rotate) and verifies
+the results. With --drop-old-keys the old keys are removed once every machine verified. Outputs are always written
+to a temporary file and moved into place, so a machine never reads a half written config.
+"""
 import os
+import sys
 import json
-from cryptography.fernet import Fernet
+import shutil
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet
+from configuration import load_fernet, forget_source
+
+ENCRYPTED_FILENAME:str = "Config.encrypted"
+KEY_FILENAME:str = "secret.key"
 
 def get_key() -> bytes:
     if os.path.exists("secret.key"):
@@ -13,18 +38,182 @@ def get_key() -> bytes:
             return key
 
 def encrypt_configuration():
-    key:bytes = get_key()
-    fernet:Fernet = Fernet(key)
-    with open("Config.encrypted","wb") as encrypted_file:
-        with open("Config.json","r",encoding="utf-8") as original_file:
-            configuration:dict[str,str|int|bool] = json.loads(original_file.read())
-            configuration_str:str = json.dumps(configuration)
-            configuration_bytes:bytes = configuration_str.encode("utf-8")
-            configuration_encrypted:bytes = fernet.encrypt(configuration_bytes)
-            encrypted_file.write(configuration_encrypted)
+    get_key()
+    fernet:MultiFernet = load_fernet("secret.key") # secret.key may hold several keys after a rotation, the newest encrypts
+    with open("Config.json","r",encoding="utf-8") as original_file:
+        configuration:dict[str,str|int|bool] = json.loads(original_file.read())
+    configuration_str:str = json.dumps(configuration)
+    configuration_bytes:bytes = configuration_str.encode("utf-8")
+    configuration_encrypted:bytes = fernet.encrypt(configuration_bytes)
+    write_atomically("Config.encrypted", configuration_encrypted)
+
+def write_atomically(path:str, data:bytes) -> None:
+    with open(f"{path}.tmp","wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(f"{path}.tmp", path)
+
+def read_sources(source:str) -> dict[str,str]:
+    """{machine: config path} from a folder of <machine>.json files or from a JSON manifest {machine: path}."""
+    if os.path.isdir(source):
+        return {filename[:-len(".json")]: os.path.join(source, filename) for filename in sorted(os.listdir(source)) if filename.endswith(".json")}
+    with open(source,"r",encoding="utf-8") as manifest_file:
+        manifest:dict[str,str] = json.load(manifest_file)
+    # Paths in the manifest are relative to the manifest itself
+    return {machine: os.path.join(os.path.dirname(os.path.abspath(source)), path) for machine, path in manifest.items()}
+
+def find_outputs(output:str) -> dict[str,str]:
+    """{machine: Config.encrypted path} for every machine folder under output."""
+    return {machine: os.path.join(output, machine, ENCRYPTED_FILENAME) for machine in sorted(os.listdir(output))
+            if os.path.isfile(os.path.join(output, machine, ENCRYPTED_FILENAME))}
+
+# Each worker process loads the keys once, in _load_keys, instead of once per machine
+_fernet:MultiFernet|None = None
+
+def _load_keys(key_path:str) -> None:
+    global _fernet
+    _fernet = load_fernet(key_path)
+
+def _encrypt_machine(job:tuple[str,str,str,str|None]) -> tuple[str,str|None]:
+    machine, source_path, output_folder, key_path = job
+    try:
+        with open(source_path,"r",encoding="utf-8") as original_file:
+            configuration:dict[str,str|int|bool] = json.load(original_file)
+        os.makedirs(output_folder, exist_ok=True)
+        write_atomically(os.path.join(output_folder, ENCRYPTED_FILENAME), _fernet.encrypt(json.dumps(configuration).encode("utf-8")))
+        if key_path is not None:
+            _copy_key(key_path, output_folder)
+        return machine, None
+    except Exception as e:
+        return machine, repr(e)
+
+def _rotate_machine(job:tuple[str,str,str|None]) -> tuple[str,str|None]:
+    machine, encrypted_path, key_path = job
+    try:
+        with open(encrypted_path,"rb") as encrypted_file:
+            token:bytes = encrypted_file.read()
+        if key_path is not None:
+            _copy_key(key_path, os.path.dirname(encrypted_path)) # Before the config, so the machine always holds a key that decrypts it
+        write_atomically(encrypted_path, _fernet.rotate(token))
+        return machine, None
+    except Exception as e:
+        return machine, repr(e)
+
+def _verify_machine(job:tuple[str,str,str,str|None]) -> tuple[str,str|None]:
+    """Decrypts an output through AutoLogOff.get_configuration, exactly as the machine will, and compares it with its source."""
+    from AutoLogOff import get_configuration
+    machine, encrypted_path, key_path, source_path = job
+    forget_source(encrypted_path, key_path) # A cached copy from before a rotation must not hide a broken output
+    configuration = get_configuration(encrypted_path, key_path=key_path)
+    if configuration is None:
+        return machine, f"{encrypted_path} does not decrypt with {key_path}"
+    if source_path is not None:
+        with open(source_path,"r",encoding="utf-8") as original_file:
+            original:dict[str,str|int|bool] = json.load(original_file)
+        different:list[str] = [key for key, value in original.items() if configuration.get(key) != value]
+        if different:
+            return machine, f"{encrypted_path} differs from {source_path} in {different}"
+    return machine, None
+
+def _copy_key(key_path:str, folder:str) -> None:
+    destination:str = os.path.join(folder, KEY_FILENAME)
+    if os.path.abspath(key_path) != os.path.abspath(destination):
+        shutil.copyfile(key_path, f"{destination}.tmp")
+        os.replace(f"{destination}.tmp", destination)
+
+def _run(function, jobs:list[tuple], key_path:str, workers:int|None) -> dict[str,str]:
+    """Runs function over jobs in a process pool. Returns {machine: error} for the jobs that failed."""
+    workers = workers or os.cpu_count() or 1
+    if (workers == 1) or (len(jobs) <= 1):
+        _load_keys(key_path)
+        results = map(function, jobs)
+        return {machine: error for machine, error in results if error is not None}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_keys, initargs=(key_path,)) as pool:
+        results = pool.map(function, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+        return {machine: error for machine, error in results if error is not None}
+
+def encrypt_batch(source:str, output:str, key_path:str=KEY_FILENAME, workers:int|None=None, copy_key:bool=True) -> dict[str,str]:
+    """Encrypts every config of source into output/<machine>/. Returns {machine: error} for the failures."""
+    if not os.path.exists(key_path):
+        write_atomically(key_path, Fernet.generate_key())
+    sources:dict[str,str] = read_sources(source)
+    jobs:list[tuple] = [(machine, path, os.path.join(output, machine), key_path if copy_key else None) for machine, path in sources.items()]
+    return _run(_encrypt_machine, jobs, key_path, workers)
+
+def verify_batch(output:str, key_path:str=KEY_FILENAME, source:str|None=None, workers:int|None=None) -> dict[str,str]:
+    """Checks that every output decrypts with get_configuration (and matches its source when given). Returns {machine: error}."""
+    sources:dict[str,str] = read_sources(source) if source is not None else {}
+    outputs:dict[str,str] = find_outputs(output)
+    failures:dict[str,str] = {machine: "no output was written" for machine in sources if machine not in outputs}
+    jobs:list[tuple] = []
+    for machine, encrypted_path in outputs.items():
+        machine_key:str = os.path.join(os.path.dirname(encrypted_path), KEY_FILENAME)
+        jobs.append((machine, encrypted_path, machine_key if os.path.exists(machine_key) else key_path, sources.get(machine)))
+    failures.update(_run(_verify_machine, jobs, key_path, workers))
+    return failures
+
+def rotate_keys(output:str, key_path:str=KEY_FILENAME, workers:int|None=None, drop_old_keys:bool=False) -> dict[str,str]:
+    """
+    Puts a new key in front of key_path, re-encrypts every output with it and verifies them. Old keys are kept so
+    machines not yet updated still decrypt, unless drop_old_keys is set and every machine verified.
+    Returns {machine: error} for the failures.
+    """
+    with open(key_path,"rb") as key_file:
+        old_keys:bytes = key_file.read().strip()
+    new_key:bytes = Fernet.generate_key()
+    write_atomically(key_path, new_key + b"\n" + old_keys + b"\n")
+
+    outputs:dict[str,str] = find_outputs(output)
+    copied:set[str] = {machine for machine, path in outputs.items() if os.path.exists(os.path.join(os.path.dirname(path), KEY_FILENAME))}
+    jobs:list[tuple] = [(machine, path, key_path if machine in copied else None) for machine, path in outputs.items()]
+    failures:dict[str,str] = _run(_rotate_machine, jobs, key_path, workers)
+    failures.update(verify_batch(output, key_path, workers=workers))
+    if drop_old_keys and not failures:
+        write_atomically(key_path, new_key + b"\n")
+        for machine in copied:
+            _copy_key(key_path, os.path.join(output, machine))
+    return failures
+
+def report(action:str, machines:int, failures:dict[str,str], started:float) -> None:
+    elapsed:float = perf_counter() - started
+    print(f"{action} {machines - len(failures)}/{machines} machine configuration(s) in {elapsed:.2f}s ({machines / max(elapsed, 1e-9):,.0f}/s)")
+    for machine, error in failures.items():
+        print(f"    {machine}: {error}", file=sys.stderr)
 
 def main():
-    encrypt_configuration()
+    if len(sys.argv) == 1:
+        encrypt_configuration()
+        return
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("batch", "verify", "rotate"):
+        command = commands.add_parser(name)
+        if name == "batch":
+            command.add_argument("source", help="Folder of <machine>.json files or a JSON manifest {machine: path}")
+            command.add_argument("--no-key-copy", action="store_true", help="Do not copy secret.key next to each output")
+        if name == "verify":
+            command.add_argument("--source", help="Also compare every output with its source config")
+        if name == "rotate":
+            command.add_argument("--drop-old-keys", action="store_true", help="Remove the old keys once every machine verified")
+        command.add_argument("--output", required=True, help="Folder holding one <machine> folder per machine")
+        command.add_argument("--key", default=KEY_FILENAME)
+        command.add_argument("--workers", type=int, help="Processes to use, every core by default")
+    args = parser.parse_args()
+
+    started:float = perf_counter()
+    if args.command == "batch":
+        failures:dict[str,str] = encrypt_batch(args.source, args.output, args.key, args.workers, copy_key=not args.no_key_copy)
+        if not failures:
+            failures = verify_batch(args.output, args.key, source=args.source, workers=args.workers)
+        report("Encrypted and verified", len(read_sources(args.source)), failures, started)
+    elif args.command == "verify":
+        failures = verify_batch(args.output, args.key, source=args.source, workers=args.workers)
+        report("Verified", len(find_outputs(args.output)), failures, started)
+    else:
+        failures = rotate_keys(args.output, args.key, args.workers, drop_old_keys=args.drop_old_keys)
+        report("Rotated and verified", len(find_outputs(args.output)), failures, started)
+    sys.exit(1 if failures else 0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,30 @@
+"""Helpers shared by the benchmark scripts. Every benchmark prints its results as a single JSON document."""
+import os
+import sys
+import json
+import platform
+from datetime import datetime
+
+REPO_ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+def emit(benchmark:str, results:dict) -> dict:
+    """Wraps results with the benchmark name and machine details, prints them as JSON and returns the document."""
+    document:dict = {
+                        "benchmark": benchmark,
+                        "timestamp": datetime.now().isoformat(timespec="seconds"),
+                        "python": platform.python_version(),
+                        "machine": platform.node(),
+                        "results": results
+                    }
+    print(json.dumps(document, indent=4))
+    return document
+
+def percentile(values:list[float], fraction:float) -> float:
+    ordered:list[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def summarize(values:list[float]) -> dict[str,float]:
+    """p50, p99 and max of a list of timings, in the unit they were given in."""
+    return {"p50": percentile(values, 0.50), "p99": percentile(values, 0.99), "max": max(values, default=0.0)}
@@ -0,0 +1,57 @@
+"""
+Compares the log backends: bytes on disk per entry, entries written per second through XML_Logger.log_to_xml
+and entries read back per second.
+
+    python benchmarks/bench_backends.py --entries 20000
+"""
+import os
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+
+from _common import emit
+from xml_logging import XML_Logger
+from log_query import iter_log_entries
+from log_backends import LOG_BACKENDS
+
+_MESSAGES:list[tuple[str,str]] = [
+                                    ("INFO", "The login time is 2:15 P.M.\nYou will be logged off at 4:15 P.M."),
+                                    ("INFO", "87/120 minutes remaining"),
+                                    ("SUCCESS", "Login email successfully sent to ['it@example.com', 'admin@example.com']."),
+                                    ("ERROR", "Email failed to send. Official error: Traceback (most recent call last): smtplib.SMTPAuthenticationError: (535, b'5.7.8 Username and Password not accepted')")
+                                 ]
+
+def measure(backend:str, entries:int) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix=f"bench_backend_{backend}_")
+    try:
+        logger:XML_Logger = XML_Logger(log_file="bench", base_dir=base_dir, backend=backend)
+        started:float = perf_counter()
+        for index in range(entries):
+            status, message = _MESSAGES[index % len(_MESSAGES)]
+            logger.log_to_xml(message, basepath=base_dir, status=status)
+        write_seconds:float = perf_counter() - started
+
+        log_path:str = logger.get_current_log_filename(basepath=base_dir)
+        started = perf_counter()
+        read_entries:int = sum(1 for _ in iter_log_entries(log_path, backend=logger.backend))
+        read_seconds:float = perf_counter() - started
+        if read_entries != entries:
+            raise RuntimeError(f"{backend} read back {read_entries} of {entries} entries.")
+
+        return {
+                    "bytes_per_entry": os.path.getsize(log_path) / entries,
+                    "write_entries_per_second": entries / write_seconds,
+                    "read_entries_per_second": entries / read_seconds
+                }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=20000)
+    args = parser.parse_args()
+    emit("backends", {"entries": args.entries, "backends": {backend: measure(backend, args.entries) for backend in LOG_BACKENDS}})
+
+if __name__ == "__main__":
+    main()
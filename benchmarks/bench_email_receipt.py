@@ -0,0 +1,93 @@
+"""
+AutoLogOff.email_receipt against the stand-in SMTP server of local_smtp_server.py, for every --delay (seconds the
+server waits before each reply, to mimic a slow or distant mail server):
+
+    inline   no outbox: the calling thread connects, logs in and sends every receipt itself
+    outbox   receipts are queued to an Email_Outbox whose sender thread delivers them over one connection
+
+For both, caller_ms is how long email_receipt blocks the session, delivery_seconds how long until the server has
+every receipt and connections how many SMTP connections were opened.
+
+The stand-in server speaks plain SMTP, so the inline path (which always uses SMTP_SSL) is run with smtplib.SMTP_SSL
+replaced by smtplib.SMTP for the duration of the benchmark.
+
+    python benchmarks/bench_email_receipt.py --receipts 50 --delay 0 0.02
+"""
+import shutil
+import smtplib
+import argparse
+import tempfile
+from time import perf_counter
+
+from _common import emit, summarize
+from local_smtp_server import Local_SMTP_Server
+from xml_logging import XML_Logger
+from email_outbox import Email_Outbox
+import AutoLogOff
+
+def configuration_for(server:Local_SMTP_Server) -> dict[str,str|bool|int]:
+    host, port = server.server_address[:2]
+    return {
+                "SMTP_SSL_Host": host,
+                "SMTP_SSL_Port": port,
+                "SMTP_Use_SSL": False,
+                "Sender_Email": "sender@example.com",
+                "Sender_Email_Password": "unused",
+                "To_Email": "to@example.com",
+                "CC_Email": "cc@example.com"
+           }
+
+def send_receipts(logger:XML_Logger, configuration:dict[str,str|bool|int], receipts:int, outbox:Email_Outbox|None) -> list[float]:
+    """Milliseconds each email_receipt call blocked for."""
+    caller_ms:list[float] = []
+    for number in range(receipts):
+        started:float = perf_counter()
+        AutoLogOff.email_receipt(logger, 14, "15", 16, "15", configuration, logging_in=(number % 2 == 0), outbox=outbox)
+        caller_ms.append((perf_counter() - started) * 1000)
+    return caller_ms
+
+def measure(mode:str, receipts:int, delay:float) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_email_receipt_")
+    server:Local_SMTP_Server = Local_SMTP_Server(delay=delay).start()
+    logger:XML_Logger = XML_Logger(log_file="email", base_dir=base_dir)
+    configuration:dict[str,str|bool|int] = configuration_for(server)
+    try:
+        started:float = perf_counter()
+        if mode == "outbox":
+            outbox:Email_Outbox = AutoLogOff.get_outbox(configuration, logger)
+            outbox.start()
+            caller_ms:list[float] = send_receipts(logger, configuration, receipts, outbox)
+            if not outbox.close(timeout=60 + receipts * delay * 10):
+                raise RuntimeError(f"{len(outbox.pending())} receipt(s) were not delivered.")
+        else:
+            ssl_factory = smtplib.SMTP_SSL
+            smtplib.SMTP_SSL = smtplib.SMTP
+            try:
+                caller_ms = send_receipts(logger, configuration, receipts, None)
+            finally:
+                smtplib.SMTP_SSL = ssl_factory
+        delivery_seconds:float = perf_counter() - started
+        if len(server.messages) != receipts:
+            raise RuntimeError(f"The server received {len(server.messages)} of {receipts} receipts.")
+        return {
+                    "caller_ms": summarize(caller_ms),
+                    "caller_ms_total": sum(caller_ms),
+                    "delivery_seconds": delivery_seconds,
+                    "connections": server.connections
+               }
+    finally:
+        server.stop()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=50)
+    parser.add_argument("--delay", type=float, nargs="+", default=[0, 0.02], help="Seconds the server waits before each reply")
+    args = parser.parse_args()
+    emit("email_receipt", {
+                                "receipts": args.receipts,
+                                "runs": [{"delay_seconds": delay, "inline": measure("inline", args.receipts, delay), "outbox": measure("outbox", args.receipts, delay)} for delay in args.delay]
+                          })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Scales the fleet controller to many sessions in one process: cost of adding and cancelling a session, memory per
+session, and how late the logoffs fire when thousands of sessions end within a few seconds of each other.
+Logoffs go to Fake_Executor, log entries to an asynchronous logger in a temporary folder.
+
+    python benchmarks/bench_fleet_controller.py --sessions 1000 10000 50000 --spread 3
+"""
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from time import perf_counter, process_time
+from datetime import datetime, timedelta
+
+from _common import emit, percentile
+from xml_logging import XML_Logger
+from fleet_controller import Fleet_Controller, Fake_Executor
+
+_CONFIGURATION:dict[str,str|bool|int] = {"Warn_User_Of_Logoff": True, "Logoff_Warning_Time_Left": 1, "DEBUG": True}
+
+def new_controller(logger:XML_Logger, executor:Fake_Executor) -> Fleet_Controller:
+    return Fleet_Controller(_CONFIGURATION, logger, executor=executor, heartbeat_interval=None)
+
+def add_sessions(controller:Fleet_Controller, sessions:int, first_end:datetime, spread:float) -> list:
+    return [controller.add_session(f"PC-{number:05d}", "student", 1, end_time=first_end + timedelta(seconds=random.uniform(0, spread))) for number in range(sessions)]
+
+def measure(sessions:int, spread:float, cancel_fraction:float) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_fleet_")
+    logger:XML_Logger = XML_Logger(log_file="fleet", base_dir=base_dir, asynchronous=True)
+    try:
+        # Adding and cancelling, with sessions far enough out that none of them ends
+        controller:Fleet_Controller = new_controller(logger, Fake_Executor())
+        started:float = perf_counter()
+        added:list = add_sessions(controller, sessions, datetime.now() + timedelta(hours=1), spread)
+        add_seconds:float = perf_counter() - started
+        cancelled:list = random.sample(added, int(sessions * cancel_fraction))
+        started = perf_counter()
+        for session in cancelled:
+            controller.cancel_session(session)
+        cancel_seconds:float = perf_counter() - started
+
+        tracemalloc.start()
+        before:int = tracemalloc.get_traced_memory()[0]
+        kept:Fleet_Controller = new_controller(logger, Fake_Executor())
+        add_sessions(kept, sessions, datetime.now() + timedelta(hours=1), spread)
+        memory_per_session:float = (tracemalloc.get_traced_memory()[0] - before) / sessions
+        tracemalloc.stop()
+        del kept
+
+        # Running: every session ends within spread seconds, starting once they have all been added
+        executor:Fake_Executor = Fake_Executor()
+        controller = new_controller(logger, executor)
+        added = add_sessions(controller, sessions, datetime.now() + timedelta(seconds=add_seconds * 2 + 0.5), spread)
+        for session in random.sample(added, len(cancelled)):
+            controller.cancel_session(session)
+        cpu_started:float = process_time()
+        started = perf_counter()
+        asyncio.run(controller.run(until_idle=True))
+        run_seconds:float = perf_counter() - started
+        run_cpu_seconds:float = process_time() - cpu_started
+
+        deadlines:dict[str,float] = {session.machine: session.end_deadline for session in added}
+        lateness:list[float] = [(fired - deadlines[machine]) * 1000 for machine, _, fired in executor.logoffs]
+        expected:int = sessions - len(cancelled)
+        if len(executor.logoffs) != expected:
+            raise RuntimeError(f"{len(executor.logoffs)} of {expected} sessions were logged off.")
+        return {
+                    "sessions": sessions,
+                    "add_microseconds_per_session": add_seconds / sessions * 1e6,
+                    "cancel_microseconds_per_session": (cancel_seconds / len(cancelled) * 1e6) if cancelled else None,
+                    "memory_bytes_per_session": memory_per_session,
+                    "run_seconds": run_seconds,
+                    "run_cpu_seconds": run_cpu_seconds,
+                    "logoff_lateness_ms_p50": percentile(lateness, 0.50),
+                    "logoff_lateness_ms_p99": percentile(lateness, 0.99),
+                    "logoff_lateness_ms_max": max(lateness, default=0.0)
+                }
+    finally:
+        logger.close()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--spread", type=float, default=3.0, help="Sessions end at random within this many seconds")
+    parser.add_argument("--cancel-fraction", type=float, default=0.1, help="Share of sessions cancelled before they end")
+    args = parser.parse_args()
+    random.seed(0)
+    emit("fleet_controller", {"spread_seconds": args.spread, "runs": [measure(sessions, args.spread, args.cancel_fraction) for sessions in args.sessions]})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput and latency of XML_Logger.log_to_xml as the day's log file grows. Entries are written one call at a
+time from an empty file up to --entries; every --window entries the latencies of that window are summarized along
+with the size of the file, so a call that gets slower as the file grows shows up as a rising curve.
+
+    python benchmarks/bench_logger_growth.py --entries 100000 --window 10000
+    python benchmarks/bench_logger_growth.py --asynchronous   # caller side of the batched writer, plus the final flush
+"""
+import os
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+
+from _common import emit, summarize
+from xml_logging import XML_Logger
+from log_backends import LOG_BACKENDS
+
+_MESSAGES:list[tuple[str,str]] = [
+                                    ("INFO", "The login time is 2:15 P.M.\nYou will be logged off at 4:15 P.M."),
+                                    ("INFO", "87/120 minutes remaining"),
+                                    ("SUCCESS", "Login email successfully sent to ['it@example.com', 'admin@example.com']."),
+                                    ("ERROR", "Email failed to send. Official error: Traceback (most recent call last): smtplib.SMTPAuthenticationError: (535, b'5.7.8 Username and Password not accepted')")
+                                 ]
+
+def measure(entries:int, window:int, backend:str, asynchronous:bool) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_logger_growth_")
+    logger:XML_Logger = XML_Logger(log_file="growth", base_dir=base_dir, backend=backend, asynchronous=asynchronous)
+    try:
+        log_path:str = logger.get_current_log_filename(basepath=base_dir)
+        windows:list[dict] = []
+        latencies:list[float] = []
+        window_started:float = perf_counter()
+        started:float = window_started
+        for index in range(entries):
+            status, message = _MESSAGES[index % len(_MESSAGES)]
+            call_started:float = perf_counter()
+            logger.log_to_xml(message, basepath=base_dir, status=status)
+            latencies.append((perf_counter() - call_started) * 1e6)
+            if (len(latencies) == window) or (index == entries - 1):
+                window_seconds:float = perf_counter() - window_started
+                windows.append({
+                                    "entries_written": index + 1,
+                                    "file_bytes": os.path.getsize(log_path) if os.path.exists(log_path) else 0,
+                                    "entries_per_second": len(latencies) / window_seconds,
+                                    "latency_us": summarize(latencies)
+                               })
+                latencies = []
+                window_started = perf_counter()
+        logger.flush()
+        total_seconds:float = perf_counter() - started
+
+        first, last = windows[0], windows[-1]
+        return {
+                    "backend": backend,
+                    "asynchronous": asynchronous,
+                    "entries": entries,
+                    "entries_per_second": entries / total_seconds,
+                    "final_file_bytes": os.path.getsize(log_path),
+                    # Close to 1 when the cost of a call does not depend on the size of the file
+                    "p50_latency_growth": last["latency_us"]["p50"] / first["latency_us"]["p50"] if first["latency_us"]["p50"] else None,
+                    "windows": windows
+                }
+    finally:
+        logger.close()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--window", type=int, default=10000, help="Entries summarized together")
+    parser.add_argument("--backend", default="xml", choices=sorted(LOG_BACKENDS))
+    parser.add_argument("--asynchronous", action="store_true", help="Queue entries to the background writer instead of writing them on the calling thread")
+    args = parser.parse_args()
+    emit("logger_growth", measure(args.entries, args.window, args.backend, args.asynchronous))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cost of rotate_logs and delete_old_logs when the archive folder already holds thousands of archived days.
+For every archive size:
+
+    rollover_ms          first rotate_logs of a process with yesterday's log still in base_dir: archives it and prunes
+    prune_ms             delete_old_logs removing --expired-fraction of the archived days
+    prune_noop_ms        delete_old_logs when nothing has expired (the usual case after a rollover)
+    manifest_rebuild_ms  load_manifest on an archive folder written before the manifest existed (scanned once)
+    steady_rotate_ns     rotate_logs between rollovers, paid by every log_to_xml call
+
+Archived files are small placeholders, their contents are never read by these calls. Every figure is the median
+of --repeats runs on a freshly built archive folder.
+
+    python benchmarks/bench_rotation_prune.py --archives 1000 5000 20000
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+from time import perf_counter
+from datetime import datetime, timedelta
+
+from _common import emit
+from xml_logging import XML_Logger
+from log_backends import ARCHIVE_EXTENSIONS
+
+_RETENTION_DAYS:int = 30
+
+def build_archive(base_dir:str, archives:int, expired:int, with_manifest:bool=True) -> XML_Logger:
+    """
+    archives archived days in base_dir/archive, the oldest expired of them past retention, plus yesterday's log in
+    base_dir waiting to be archived. Days are spaced one apart going back from the retention cutoff, and the
+    remaining ones are spread over the retention window so no two share a date.
+    """
+    logger:XML_Logger = XML_Logger(log_file="rotation", base_dir=base_dir, log_retention_days=_RETENTION_DAYS)
+    archive_directory:str = logger.get_archive_directory()
+    os.makedirs(archive_directory, exist_ok=True)
+    today:datetime = datetime.now()
+    cutoff:datetime = today - timedelta(days=_RETENTION_DAYS)
+    kept:int = archives - expired
+    days:list[datetime] = [cutoff - timedelta(days=offset + 1) for offset in range(expired)]
+    # Kept days sit inside the retention window and, beyond it, in the future so they never expire
+    days += [cutoff + timedelta(days=offset + 1) if offset < _RETENTION_DAYS - 2 else today + timedelta(days=offset) for offset in range(kept)]
+    extension:str = ARCHIVE_EXTENSIONS[logger.archive_compression]
+    manifest:dict[str,str] = {}
+    for day in days:
+        filename:str = os.path.basename(logger.get_dated_log_filename(basepath=archive_directory, day=day.strftime("%Y%m%d"))) + extension
+        with open(os.path.join(archive_directory, filename), "wb") as archive_file:
+            archive_file.write(b"\x1f\x8b")
+        manifest[day.strftime("%Y%m%d")] = filename
+    if with_manifest:
+        with open(logger.get_manifest_path(), "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+    yesterday:str = (today - timedelta(days=1)).strftime("%Y%m%d")
+    with open(logger.get_dated_log_filename(basepath=base_dir, day=yesterday), "wb") as log_file:
+        log_file.write(logger.backend.encode(today - timedelta(days=1), "INFO", "87/120 minutes remaining"))
+    return logger
+
+def timed_ms(function, *args) -> float:
+    started:float = perf_counter()
+    function(*args)
+    return (perf_counter() - started) * 1000
+
+def run_on_fresh_archive(archives:int, expired:int, with_manifest:bool, action) -> float:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_rotation_prune_")
+    try:
+        return action(build_archive(base_dir, archives, expired, with_manifest))
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def measure(archives:int, expired_fraction:float, repeats:int) -> dict:
+    expired:int = int(archives * expired_fraction)
+    rollover:list[float] = [run_on_fresh_archive(archives, expired, True, lambda logger: timed_ms(logger.rotate_logs)) for _ in range(repeats)]
+    prune:list[float] = [run_on_fresh_archive(archives, expired, True, lambda logger: timed_ms(logger.delete_old_logs)) for _ in range(repeats)]
+    prune_noop:list[float] = [run_on_fresh_archive(archives, 0, True, lambda logger: timed_ms(logger.delete_old_logs)) for _ in range(repeats)]
+    rebuild:list[float] = [run_on_fresh_archive(archives, 0, False, lambda logger: timed_ms(logger.load_manifest)) for _ in range(repeats)]
+
+    def steady_state(logger:XML_Logger) -> float:
+        logger.rotate_logs()
+        calls:int = 100000
+        started:float = perf_counter()
+        for _ in range(calls):
+            logger.rotate_logs()
+        return (perf_counter() - started) / calls * 1e9
+    steady:float = run_on_fresh_archive(archives, 0, True, steady_state)
+
+    return {
+                "archives": archives,
+                "expired": expired,
+                "rollover_ms": statistics.median(rollover),
+                "prune_ms": statistics.median(prune),
+                "prune_noop_ms": statistics.median(prune_noop),
+                "manifest_rebuild_ms": statistics.median(rebuild),
+                "steady_rotate_ns": steady
+            }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archives", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--expired-fraction", type=float, default=0.5, help="Share of the archived days past retention")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    emit("rotation_prune", {"retention_days": _RETENTION_DAYS, "runs": [measure(archives, args.expired_fraction, args.repeats) for archives in args.archives]})
+
+if __name__ == "__main__":
+    main()
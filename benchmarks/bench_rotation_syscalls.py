@@ -0,0 +1,105 @@
+"""
+Counts the filesystem calls made per log_to_xml call, comparing the original rotate-then-rewrite
+implementation with the current one.
+
+    python benchmarks/bench_rotation_syscalls.py --entries 1000
+"""
+import os
+import shutil
+import argparse
+import builtins
+import tempfile
+from datetime import datetime
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape as xml_sax_escape
+
+from _common import emit
+from xml_logging import XML_Logger
+
+_COUNTED_FUNCTIONS:list[tuple[object,str]] = [(os, "stat"), (os, "lstat"), (os, "listdir"), (os, "scandir"), (os, "rename"), (os, "remove"), (builtins, "open")]
+
+class Syscall_Counter:
+    """Context manager that counts calls to the os functions used by the logger (os.path.* goes through os.stat)."""
+    def __init__(self):
+        self.counts:dict[str,int] = {}
+        self._originals:list[tuple[object,str,object]] = []
+
+    def __enter__(self):
+        for module, name in _COUNTED_FUNCTIONS:
+            original = getattr(module, name)
+            self._originals.append((module, name, original))
+            setattr(module, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for module, name, original in self._originals:
+            setattr(module, name, original)
+        self._originals.clear()
+
+    def _wrap(self, name:str, original):
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return counted
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+def legacy_rotate_logs(logger:XML_Logger) -> None:
+    """The original rotation check: an exists and mtime lookup on the bare log_file name for every entry."""
+    current_date = datetime.now().strftime("%Y%m%d")
+    if os.path.exists(logger.log_file):
+        modified_time = datetime.fromtimestamp(os.path.getmtime(logger.log_file)).strftime("%Y%m%d")
+        if modified_time != current_date:
+            if not os.path.exists(logger.archive_folder):
+                os.makedirs(logger.archive_folder)
+            shutil.move(logger.log_file, f"{logger.archive_folder}/{logger.log_file}_{modified_time}.xml")
+            logger.delete_old_logs()
+
+def legacy_log_to_xml(logger:XML_Logger, message:str, basepath:str, status="INFO") -> None:
+    """The original implementation: legacy_rotate_logs, then a full parse and rewrite of the day's file."""
+    legacy_rotate_logs(logger)
+    current_log_file = logger.get_current_log_filename(basepath=basepath)
+    if not os.path.exists(current_log_file):
+        ET.ElementTree(ET.Element("logs")).write(current_log_file)
+    tree = ET.parse(current_log_file)
+    log_entry = ET.SubElement(tree.getroot(), "log")
+    log_entry.set("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"))
+    log_entry.set("status", status)
+    ET.SubElement(log_entry, "message").text = xml_sax_escape(message)
+    tree.write(current_log_file)
+
+def measure(entries:int, legacy:bool) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_rotation_")
+    try:
+        logger:XML_Logger = XML_Logger(log_file="bench", base_dir=base_dir)
+        logger.log_to_xml("warm up", basepath=base_dir)  # The first call scans base_dir once for days left behind
+        with Syscall_Counter() as counter:
+            for index in range(entries):
+                if legacy:
+                    legacy_log_to_xml(logger, f"entry {index}", basepath=base_dir)
+                else:
+                    logger.log_to_xml(f"entry {index}", basepath=base_dir)
+        with Syscall_Counter() as rotation_counter:
+            for _ in range(entries):
+                if legacy:
+                    legacy_rotate_logs(logger)
+                else:
+                    logger.rotate_logs()
+        return {
+                    "entries": entries,
+                    "filesystem_calls_per_log_call": counter.total() / entries,
+                    "calls_by_function": counter.counts,
+                    "filesystem_calls_per_rotation_check": rotation_counter.total() / entries
+                }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000)
+    args = parser.parse_args()
+    emit("rotation_syscalls", {"before": measure(args.entries, legacy=True), "after": measure(args.entries, legacy=False)})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Wakeups of run_sleep_loop (Tk) and run_headless_loop over simulated sessions, on a fake clock so a two hour session
+takes milliseconds. A wakeup is any time the process is scheduled to run: a Tk timer firing, a root.update() or a
+return from sleep. The original loop, which slept in one second steps to keep Tk responsive, is replayed on the
+same clock for comparison.
+
+    python benchmarks/bench_sleep_loop_wakeups.py --minutes 5 60 120 480
+
+Every run also checks that one heartbeat was logged per minute and that the session ended on time.
+"""
+import heapq
+import argparse
+from time import process_time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from _common import emit
+import AutoLogOff
+
+_CONFIGURATION:dict[str,str|bool|int] = {"Warn_User_Of_Logoff": True, "Logoff_Warning_Time_Left": 5}
+
+class Fake_Clock:
+    def __init__(self):
+        self.now:float = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class Fake_Root:
+    """Stands in for the hidden Tk window: after() timers fire on the fake clock, each one counted as a wakeup."""
+    def __init__(self, clock:Fake_Clock):
+        self.clock = clock
+        self.wakeups:int = 0
+        self._timers:list[tuple[float,int,Callable[[],object]]] = []
+        self._sequence:int = 0
+        self._running:bool = False
+
+    def after(self, milliseconds:int, callback:Callable[[],object]) -> None:
+        self._sequence += 1
+        heapq.heappush(self._timers, (self.clock.now + milliseconds / 1000, self._sequence, callback))
+
+    def mainloop(self) -> None:
+        self._running = True
+        while self._running and self._timers:
+            deadline, _, callback = heapq.heappop(self._timers)
+            self.clock.now = max(self.clock.now, deadline)
+            self.wakeups += 1
+            callback()
+
+    def quit(self) -> None:
+        self._running = False
+
+    def update(self) -> None:
+        self.wakeups += 1
+
+class Counting_Logger:
+    """Only counts heartbeats, so the figures are not dominated by disk writes."""
+    base_dir:str = "."
+
+    def __init__(self, clock:Fake_Clock):
+        self.clock = clock
+        self.heartbeats:list[float] = []
+
+    def log_to_xml(self, message:str, basepath:str, status:str="INFO") -> None:
+        self.heartbeats.append(self.clock.now)
+
+def legacy_sleep_loop(logger:Counting_Logger, seconds:float, clock:Fake_Clock, root:Fake_Root) -> None:
+    """The original run_sleep_loop: log, then sleep(1) and root.update() up to 60 times, until the end time."""
+    end:float = clock.now + seconds
+    while clock.now < end:
+        seconds_left:int = int(end - clock.now)
+        logger.log_to_xml(message=f"{round(seconds_left / 60)} minutes remaining", basepath=logger.base_dir)
+        for _ in range(min(60, max(1, seconds_left))):
+            clock.now += 1  # sleep(1)
+            root.update()
+
+def check(logger:Counting_Logger, minutes:int, clock:Fake_Clock, seconds:float) -> None:
+    if len(logger.heartbeats) != minutes:
+        raise RuntimeError(f"{len(logger.heartbeats)} heartbeats logged for a {minutes} minute session.")
+    if abs(clock.now - seconds) > 1:
+        raise RuntimeError(f"The session ended after {clock.now:.1f} of {seconds:.1f} seconds.")
+
+def simulate(loop:str, minutes:int) -> dict:
+    clock:Fake_Clock = Fake_Clock()
+    logger:Counting_Logger = Counting_Logger(clock)
+    seconds:float = minutes * 60
+    end_time:datetime = datetime.now() + timedelta(seconds=seconds)
+    wakeups:int = 0
+    cpu_started:float = process_time()
+    if loop == "tk":
+        root:Fake_Root = Fake_Root(clock)
+        AutoLogOff.run_sleep_loop(logger, end_time, minutes, _CONFIGURATION, root, clock=clock)
+        wakeups = root.wakeups
+    elif loop == "headless":
+        def wait(delay:float) -> None:
+            nonlocal wakeups
+            wakeups += 1
+            clock.now += delay
+        AutoLogOff.run_headless_loop(logger, end_time, minutes, _CONFIGURATION, warn=lambda title, message: None, clock=clock, wait=wait)
+    else:
+        root = Fake_Root(clock)
+        legacy_sleep_loop(logger, seconds, clock, root)
+        wakeups = root.wakeups
+    cpu_seconds:float = process_time() - cpu_started
+    # The wall clock moved on a little while end_time was converted, allow for it
+    clock.now = round(clock.now)
+    check(logger, minutes, clock, seconds)
+    return {"wakeups": wakeups, "wakeups_per_minute": wakeups / minutes, "simulation_cpu_ms": cpu_seconds * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, nargs="+", default=[5, 60, 120, 480])
+    args = parser.parse_args()
+    emit("sleep_loop_wakeups", {"runs": [{"minutes": minutes, **{loop: simulate(loop, minutes) for loop in ("legacy", "tk", "headless")}} for minutes in args.minutes]})
+
+if __name__ == "__main__":
+    main()
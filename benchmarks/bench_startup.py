@@ -0,0 +1,163 @@
+"""
+Startup cost of AutoLogOff.py, which runs at every login. Measured in fresh interpreters:
+
+    import_ms                 python -X importtime -c "import AutoLogOff", cumulative time of the AutoLogOff import
+    gui_first_dialog_ms       wall time from launching main() to its first dialog (needs a display, else null)
+    headless_ready_ms         wall time from launching main() --headless to the start of the session
+    heavy_modules_at_import   heavy dependencies loaded by merely importing AutoLogOff (must stay empty)
+
+Every figure is the median of --runs launches. Guard against regressions with a saved baseline:
+
+    python benchmarks/bench_startup.py --save-baseline startup_baseline.json
+    python benchmarks/bench_startup.py --baseline startup_baseline.json --tolerance 0.25
+
+Exits with status 1 when a heavy module is loaded at import, when a figure exceeds its baseline by more than the
+tolerance (plus --slack-ms to absorb noise), or when import_ms exceeds --max-import-ms.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from time import perf_counter
+
+from _common import REPO_ROOT, emit
+
+HEAVY_MODULES:tuple[str,...] = ("pandas", "numpy", "cryptography", "smtplib", "ssl", "email.mime", "tkinter", "urllib.request")
+
+# Runs main() and prints a marker as soon as the given function is reached instead of running it
+_CHILD_SCRIPT:str = """
+import os, sys
+sys.path.insert(0, {repo_root!r})
+sys.argv = ["AutoLogOff.py"] + {arguments!r}
+import AutoLogOff
+def reached(*args, **kwargs):
+    sys.stdout.write("REACHED\\n")
+    sys.stdout.flush()
+    os._exit(0)
+setattr(AutoLogOff, {stop_at!r}, reached)
+AutoLogOff.main()
+os._exit(3)
+"""
+
+def parse_importtime(stderr:str) -> dict[str,int]:
+    """{module: cumulative microseconds} from the output of -X importtime."""
+    cumulative:dict[str,int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields:list[str] = line[len("import time:"):].split("|")
+        if (len(fields) != 3) or (not fields[1].strip().isdigit()):
+            continue  # Header line
+        cumulative[fields[2].strip()] = int(fields[1])
+    return cumulative
+
+def measure_import(runs:int) -> dict:
+    totals:list[float] = []
+    slowest:dict[str,list[int]] = {}
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import AutoLogOff"], cwd=REPO_ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing AutoLogOff failed:\n{completed.stderr[-2000:]}")
+        cumulative:dict[str,int] = parse_importtime(completed.stderr)
+        totals.append(cumulative["AutoLogOff"] / 1000)
+        for module, microseconds in cumulative.items():
+            slowest.setdefault(module, []).append(microseconds)
+    medians:dict[str,float] = {module: statistics.median(values) / 1000 for module, values in slowest.items() if module != "AutoLogOff"}
+    return {
+                "import_ms": statistics.median(totals),
+                "slowest_imports_ms": dict(sorted(medians.items(), key=lambda item: item[1], reverse=True)[:10])
+            }
+
+def heavy_modules_at_import() -> list[str]:
+    code:str = f"import sys, json; sys.path.insert(0, {REPO_ROOT!r}); import AutoLogOff; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    return json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+def time_to(stop_at:str, arguments:list[str], runs:int) -> float|None:
+    """Median milliseconds from launching main() to reaching AutoLogOff.<stop_at>, None if it is never reached."""
+    script:str = _CHILD_SCRIPT.format(repo_root=REPO_ROOT, arguments=arguments, stop_at=stop_at)
+    timings:list[float] = []
+    for _ in range(runs):
+        started:float = perf_counter()
+        child = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        reached:bool = child.stdout.readline().strip() == "REACHED"
+        elapsed:float = (perf_counter() - started) * 1000
+        child.wait()
+        if not reached:
+            return None
+        timings.append(elapsed)
+    return statistics.median(timings)
+
+def write_configuration(folder:str) -> str:
+    configuration:dict[str,str|bool|int] = {
+                                                "Logger_Base_Directory": folder,
+                                                "Logger_Filename": "startup",
+                                                "Logger_Archive_Folder": "archive",
+                                                "SMTP_SSL_Host": "127.0.0.1",
+                                                "SMTP_SSL_Port": 465,
+                                                "Sender_Email": "sender@example.com",
+                                                "Sender_Email_Password": "unused",
+                                                "To_Email": "to@example.com",
+                                                "CC_Email": "cc@example.com",
+                                                "Warn_User_Of_Logoff": True,
+                                                "Logoff_Warning_Time_Left": 5,
+                                                "DEBUG": False
+                                           }
+    path:str = os.path.join(folder, "Config.json")
+    with open(path, "w", encoding="utf-8") as config_file:
+        json.dump(configuration, config_file)
+    return path
+
+def check_regressions(results:dict, baseline:dict, tolerance:float, slack_ms:float) -> list[str]:
+    problems:list[str] = []
+    for metric in ("import_ms", "gui_first_dialog_ms", "headless_ready_ms"):
+        current, previous = results.get(metric), baseline.get(metric)
+        if (current is None) or (previous is None):
+            continue
+        limit:float = previous * (1 + tolerance) + slack_ms
+        if current > limit:
+            problems.append(f"{metric} is {current:.1f} ms, over the {limit:.1f} ms allowed by the baseline ({previous:.1f} ms)")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="Write the results here for later comparisons")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Allowed absolute slowdown on top of the tolerance")
+    parser.add_argument("--max-import-ms", type=float, help="Absolute ceiling for import_ms")
+    args = parser.parse_args()
+
+    folder:str = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        config_path:str = write_configuration(folder)
+        results:dict = measure_import(args.runs)
+        results["gui_first_dialog_ms"] = time_to("display_discretion_message", ["--config", config_path], args.runs)
+        results["headless_ready_ms"] = time_to("run_session", ["--config", config_path, "--headless", "--minutes", "1"], args.runs)
+        results["heavy_modules_at_import"] = heavy_modules_at_import()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    problems:list[str] = []
+    if results["heavy_modules_at_import"]:
+        problems.append(f"Importing AutoLogOff loads {results['heavy_modules_at_import']}")
+    if (args.max_import_ms is not None) and (results["import_ms"] > args.max_import_ms):
+        problems.append(f"import_ms is {results['import_ms']:.1f} ms, over --max-import-ms {args.max_import_ms:.1f}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            problems += check_regressions(results, json.load(baseline_file)["results"], args.tolerance, args.slack_ms)
+    results["problems"] = problems
+    results["passed"] = not problems
+
+    document:dict = emit("startup", results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(document, baseline_file, indent=4)
+    sys.exit(0 if results["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
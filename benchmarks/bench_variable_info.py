@@ -0,0 +1,70 @@
+"""
+XML_Logger.save_variable_info on large variables: wall time and peak memory allocated while writing the snapshot,
+per size_mode. Memory is measured in a second, separate run under tracemalloc so it does not inflate the times.
+A peak far below the size of the variable means nothing proportional to it was built along the way.
+
+    python benchmarks/bench_variable_info.py --scale 1.0
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable
+
+from _common import emit
+from xml_logging import XML_Logger
+from variable_info import SIZE_MODES
+
+class _Record:
+    def __init__(self, number:int):
+        self.number = number
+        self.name = f"record {number}"
+        self.tags = ["a", "b", str(number)]
+
+# Builders of the benchmarked variables for a given scale, scale 1.0 is about 250 MB in total
+_VARIABLES:dict[str,Callable[[float],Any]] = {
+                                                "bytes_64mb": lambda scale: os.urandom(int(64 * 1024 * 1024 * scale)),
+                                                "str_32m_chars": lambda scale: "x" * int(32 * 1024 * 1024 * scale),
+                                                "list_1m_ints": lambda scale: list(range(int(1_000_000 * scale))),
+                                                "dict_200k_lists": lambda scale: {f"key {number}": [number, number + 1, number + 2] for number in range(int(200_000 * scale))},
+                                                "list_100k_objects": lambda scale: [_Record(number) for number in range(int(100_000 * scale))]
+                                             }
+
+def save(logger:XML_Logger, name:str, value:Any, size_mode:str) -> None:
+    logger.save_variable_info({}, {name: value}, f"{name}_{size_mode}.json", size_mode=size_mode)
+
+def measure(name:str, value:Any, size_modes:list[str]) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="bench_variable_info_")
+    try:
+        logger:XML_Logger = XML_Logger(log_file="variables", base_dir=base_dir)
+        results:dict = {"shallow_size_bytes": sys.getsizeof(value)}
+        for size_mode in size_modes:
+            started:float = perf_counter()
+            save(logger, name, value, size_mode)
+            seconds:float = perf_counter() - started
+            tracemalloc.start()
+            save(logger, name, value, size_mode)
+            peak:int = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[size_mode] = {"seconds": seconds, "peak_allocated_bytes": peak, "file_bytes": os.path.getsize(os.path.join(base_dir, f"{name}_{size_mode}.json"))}
+        return results
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of every variable")
+    parser.add_argument("--size-modes", nargs="+", default=list(SIZE_MODES), choices=SIZE_MODES)
+    args = parser.parse_args()
+    results:dict = {"scale": args.scale, "variables": {}}
+    for name, build in _VARIABLES.items():
+        value:Any = build(args.scale)
+        results["variables"][name] = measure(name, value, args.size_modes)
+        del value
+    emit("variable_info", results)
+
+if __name__ == "__main__":
+    main()
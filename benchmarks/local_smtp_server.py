@@ -0,0 +1,105 @@
+"""
+Minimal stand-in SMTP server for exercising the email receipts without a real mail server. It accepts any login,
+keeps the messages it receives in memory and can be told to answer slowly or to refuse logins.
+
+    python benchmarks/local_smtp_server.py --port 8025
+
+Then set SMTP_SSL_Host to 127.0.0.1, SMTP_SSL_Port to 8025 and SMTP_Use_SSL to false in the configuration.
+"""
+import argparse
+import threading
+import socketserver
+from time import sleep
+
+class Local_SMTP_Server(socketserver.ThreadingTCPServer):
+    daemon_threads:bool = True
+    allow_reuse_address:bool = True
+
+    def __init__(self, host:str="127.0.0.1", port:int=0, delay:float=0, refuse_login:bool=False):
+        """port 0 picks a free port, read it back from server_address. delay is added before every reply."""
+        super().__init__((host, port), _SMTP_Handler)
+        self.delay = delay
+        self.refuse_login = refuse_login
+        self.messages:list[dict[str,str|list[str]]] = []
+        self.connections:int = 0
+        self.logins:int = 0
+        self._lock:threading.Lock = threading.Lock()
+        self._thread:threading.Thread|None = None
+
+    def start(self) -> "Local_SMTP_Server":
+        """Serves on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="Local_SMTP_Server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+class _SMTP_Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server:Local_SMTP_Server = self.server
+        with server._lock:
+            server.connections += 1
+        self._reply("220 localhost stand-in SMTP ready")
+        sender:str = ""
+        recipients:list[str] = []
+        while True:
+            line:bytes = self.rfile.readline()
+            if not line:
+                return
+            command:str = line.decode("utf-8", errors="replace").strip()
+            verb:str = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 OK")
+            elif verb == "AUTH":
+                if server.refuse_login:
+                    self._reply("535 5.7.8 Authentication credentials invalid")
+                else:
+                    with server._lock:
+                        server.logins += 1
+                    self._reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command[len("MAIL FROM:"):].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[len("RCPT TO:"):].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data:list[bytes] = []
+                while True:
+                    data_line:bytes = self.rfile.readline()
+                    if (not data_line) or (data_line in (b".\r\n", b".\n")):
+                        break
+                    data.append(data_line)
+                with server._lock:
+                    server.messages.append({"from": sender, "to": recipients, "data": b"".join(data).decode("utf-8", errors="replace")})
+                self._reply("250 OK queued")
+            elif verb in ("NOOP", "RSET"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+    def _reply(self, text:str) -> None:
+        if self.server.delay:
+            sleep(self.server.delay)
+        self.wfile.write(f"{text}\r\n".encode("utf-8"))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--delay", type=float, default=0, help="Seconds added before every reply")
+    args = parser.parse_args()
+    server:Local_SMTP_Server = Local_SMTP_Server(port=args.port, delay=args.delay)
+    print(f"Stand-in SMTP server listening on {server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
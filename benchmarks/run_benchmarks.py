@@ -0,0 +1,160 @@
+"""
+Runs the benchmark suite and writes every result into one JSON document, to keep with a release and compare
+the next one against:
+
+    python benchmarks/run_benchmarks.py --output results_1.4.json
+    python benchmarks/run_benchmarks.py --quick --only logger_growth sleep_loop_wakeups
+    python benchmarks/run_benchmarks.py --baseline results_1.4.json --tolerance 0.25 --fail-on-regression
+
+Each benchmark runs in its own interpreter. With a baseline, every numeric figure present in both runs is compared:
+times, sizes, memory and wakeups must not grow, rates (per_second) must not drop, by more than the tolerance.
+Worst case figures ("max") are left out of the comparison as they are too noisy to gate on, and a time must also
+grow by more than --noise-floor-ms, so sub-millisecond figures do not flag scheduler jitter.
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+from time import perf_counter
+from datetime import datetime
+from typing import Any, Iterator
+
+from _common import REPO_ROOT
+
+BENCHMARK_DIRECTORY:str = os.path.dirname(os.path.abspath(__file__))
+
+# name: (script, arguments of the full run, arguments of the --quick run)
+BENCHMARKS:dict[str,tuple[str,list[str],list[str]]] = {
+                                                        "logger_growth": ("bench_logger_growth.py", [], ["--entries", "20000", "--window", "5000"]),
+                                                        "rotation_prune": ("bench_rotation_prune.py", [], ["--archives", "1000", "--repeats", "1"]),
+                                                        "variable_info": ("bench_variable_info.py", [], ["--scale", "0.1"]),
+                                                        "email_receipt": ("bench_email_receipt.py", [], ["--receipts", "20", "--delay", "0", "0.01"]),
+                                                        "sleep_loop_wakeups": ("bench_sleep_loop_wakeups.py", [], []),
+                                                        "backends": ("bench_backends.py", [], ["--entries", "5000"]),
+                                                        "rotation_syscalls": ("bench_rotation_syscalls.py", [], ["--entries", "200"]),
+                                                        "fleet_controller": ("bench_fleet_controller.py", [], ["--sessions", "1000"]),
+                                                        "startup": ("bench_startup.py", [], ["--runs", "3"])
+                                                      }
+
+_LOWER_IS_BETTER:tuple[str,...] = ("_ms", "_us", "_ns", "seconds", "bytes", "wakeups", "p50", "p99", "connections", "syscalls")
+# Milliseconds per unit of a figure, found from the last unit suffix along its path (caller_ms.p50 is in ms)
+_TIME_UNITS:tuple[tuple[str,float],...] = (("_ms", 1.0), ("_us", 1e-3), ("_ns", 1e-6), ("seconds", 1000.0))
+
+def run_benchmark(name:str, quick:bool) -> dict:
+    script, full_arguments, quick_arguments = BENCHMARKS[name]
+    started:float = perf_counter()
+    completed = subprocess.run([sys.executable, os.path.join(BENCHMARK_DIRECTORY, script)] + (quick_arguments if quick else full_arguments),
+                               cwd=REPO_ROOT, capture_output=True, text=True)
+    entry:dict[str,Any] = {"exit_code": completed.returncode, "elapsed_seconds": perf_counter() - started}
+    try:
+        entry["results"] = json.loads(completed.stdout)["results"]
+    except (ValueError, KeyError):
+        entry["results"] = None
+        entry["error"] = completed.stderr[-2000:] or completed.stdout[-2000:]
+    return entry
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def numeric_figures(value:Any, path:str="") -> Iterator[tuple[str,float]]:
+    """(path, number) for every number in nested results. List items are keyed by their first field (sessions, archives...) when it is a number."""
+    if isinstance(value, bool):
+        return
+    if isinstance(value, (int, float)):
+        yield path, value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from numeric_figures(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for position, item in enumerate(value):
+            label:str = str(position)
+            if isinstance(item, dict) and item:
+                first_key, first_value = next(iter(item.items()))
+                if isinstance(first_value, (int, float)) and not isinstance(first_value, bool):
+                    label = f"{first_key}={first_value}"
+            yield from numeric_figures(item, f"{path}[{label}]")
+
+def milliseconds_per_unit(path:str) -> float|None:
+    """How many milliseconds one unit of the figure at path is, None when it is not a time."""
+    for segment in reversed(path.replace("[", ".").split(".")):
+        for suffix, milliseconds in _TIME_UNITS:
+            if segment.endswith(suffix):
+                return milliseconds
+    return None
+
+def compare(results:dict, baseline:dict, tolerance:float, noise_floor_ms:float=1.0) -> list[str]:
+    """Figures that got worse than the baseline by more than tolerance (and, for times, by more than noise_floor_ms)."""
+    regressions:list[str] = []
+    for name, entry in results.items():
+        previous:dict|None = baseline.get(name)
+        if (previous is None) or (entry.get("results") is None) or (previous.get("results") is None):
+            continue
+        before:dict[str,float] = dict(numeric_figures(previous["results"]))
+        for path, current in numeric_figures(entry["results"]):
+            last_segment:str = path.rsplit(".", 1)[-1]
+            if (path not in before) or (last_segment == "max") or (before[path] == 0):
+                continue
+            change:float = (current - before[path]) / abs(before[path])
+            if "per_second" in last_segment:
+                if change < -tolerance:
+                    regressions.append(f"{name}: {path} dropped from {before[path]:.6g} to {current:.6g} ({change:+.0%})")
+            elif last_segment.endswith(_LOWER_IS_BETTER):
+                milliseconds:float|None = milliseconds_per_unit(path)
+                if (milliseconds is not None) and ((current - before[path]) * milliseconds <= noise_floor_ms):
+                    continue
+                if change > tolerance:
+                    regressions.append(f"{name}: {path} grew from {before[path]:.6g} to {current:.6g} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run, all by default")
+    parser.add_argument("--quick", action="store_true", help="Smaller workloads, for a quick check rather than a release record")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change against the baseline")
+    parser.add_argument("--noise-floor-ms", type=float, default=1.0, help="Smallest slowdown of a time reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when a figure regressed or a benchmark failed")
+    args = parser.parse_args()
+
+    results:dict[str,dict] = {}
+    for name in (args.only or BENCHMARKS):
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        results[name] = run_benchmark(name, args.quick)
+        if results[name]["results"] is None:
+            print(f"{name} failed with exit code {results[name]['exit_code']}:\n{results[name]['error']}", file=sys.stderr)
+
+    document:dict[str,Any] = {
+                                "suite": "AutoLogOff",
+                                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                                "git_commit": git_commit(),
+                                "python": platform.python_version(),
+                                "machine": platform.node(),
+                                "quick": args.quick,
+                                "benchmarks": results
+                             }
+    failed:list[str] = [name for name, entry in results.items() if entry["exit_code"] != 0]
+    regressions:list[str] = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline:dict = json.load(baseline_file)
+        document["baseline"] = {"git_commit": baseline.get("git_commit"), "timestamp": baseline.get("timestamp"), "tolerance": args.tolerance, "noise_floor_ms": args.noise_floor_ms}
+        regressions = compare(results, baseline["benchmarks"], args.tolerance, args.noise_floor_ms)
+        document["regressions"] = regressions
+    with open(f"{args.output}.tmp", "w", encoding="utf-8") as output_file:
+        json.dump(document, output_file, indent=4)
+    os.replace(f"{args.output}.tmp", args.output)
+
+    for regression in regressions:
+        print(regression, file=sys.stderr)
+    print(f"{len(results) - len(failed)}/{len(results)} benchmarks succeeded, {len(regressions)} regression(s). Results written to {args.output}", file=sys.stderr)
+    if args.fail_on_regression and (failed or regressions):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
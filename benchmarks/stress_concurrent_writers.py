@@ -0,0 +1,90 @@
+"""
+Launches N processes that each log M entries to the same base_dir and log_file, then checks that all N x M entries
+arrived intact, exactly once, in a well-formed file whose hour index still finds every entry. Exits with status 1
+on any loss or corruption.
+
+    python benchmarks/stress_concurrent_writers.py --processes 8 --entries 2000 --backend xml
+    python benchmarks/stress_concurrent_writers.py --without-lock   # shows what the lock prevents
+"""
+import sys
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from time import perf_counter
+from datetime import datetime, timedelta
+
+from _common import emit
+from xml_logging import XML_Logger
+from log_backends import LOG_BACKENDS
+from log_query import iter_log_entries, query_logs
+
+def write_entries(base_dir:str, backend:str, process_number:int, entries:int, concurrent:bool, asynchronous:bool) -> None:
+    logger:XML_Logger = XML_Logger(log_file="stress", base_dir=base_dir, backend=backend, concurrent=concurrent, asynchronous=asynchronous, batch_size=50)
+    for index in range(entries):
+        logger.log_to_xml(f"process {process_number} entry {index} <&>", basepath=base_dir)
+    logger.close()
+
+def run(processes:int, entries:int, backend:str, concurrent:bool, asynchronous:bool) -> dict:
+    base_dir:str = tempfile.mkdtemp(prefix="stress_concurrent_")
+    try:
+        started:float = perf_counter()
+        workers:list[multiprocessing.Process] = [
+                                                    multiprocessing.Process(target=write_entries, args=(base_dir, backend, number, entries, concurrent, asynchronous))
+                                                    for number in range(processes)
+                                                ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed:float = perf_counter() - started
+
+        logger:XML_Logger = XML_Logger(log_file="stress", base_dir=base_dir, backend=backend)
+        expected:set[str] = {f"process {number} entry {index} <&>" for number in range(processes) for index in range(entries)}
+        problems:list[str] = []
+        try:
+            messages:list[str] = [entry["message"] for entry in iter_log_entries(logger.get_current_log_filename(basepath=base_dir), backend=logger.backend)]
+            indexed:int = sum(1 for _ in query_logs(logger, datetime.now() - timedelta(hours=1), datetime.now() + timedelta(hours=1)))
+        except Exception as e:
+            messages, indexed = [], 0
+            problems.append(f"Log file could not be read: {e!r}")
+
+        missing:int = len(expected - set(messages))
+        duplicated:int = len(messages) - len(set(messages))
+        if missing:
+            problems.append(f"{missing} entries are missing")
+        if duplicated:
+            problems.append(f"{duplicated} entries are duplicated")
+        if len(set(messages) - expected):
+            problems.append("Unexpected (corrupted) entries were read")
+        if indexed != len(expected):
+            problems.append(f"A query through the hour index found {indexed} of {len(expected)} entries")
+
+        return {
+                    "processes": processes,
+                    "entries_per_process": entries,
+                    "backend": backend,
+                    "locked": concurrent,
+                    "asynchronous": asynchronous,
+                    "entries_written": len(messages),
+                    "entries_per_second": (processes * entries) / elapsed,
+                    "problems": problems,
+                    "passed": not problems
+                }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--backend", default="xml", choices=sorted(LOG_BACKENDS))
+    parser.add_argument("--asynchronous", action="store_true", help="Use the batched background writer in every process")
+    parser.add_argument("--without-lock", action="store_true", help="Disable concurrent mode to reproduce the race")
+    args = parser.parse_args()
+    results:dict = run(args.processes, args.entries, args.backend, concurrent=not args.without_lock, asynchronous=args.asynchronous)
+    emit("stress_concurrent_writers", results)
+    sys.exit(0 if results["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
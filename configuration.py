@@ -0,0 +1,199 @@
+"""
+Configuration loading for AutoLogOff. A Configuration_Source reads Config.json (or decrypts Config.encrypted with
+secret.key) once and keeps the result until the file changes, which costs a single os.stat per check, so long
+running sessions and the fleet controller pick up new settings without a restart or a decrypt on every call.
+Values are validated against SETTINGS, compiled once at import, and exposed both as attributes
+(configuration.SMTP_SSL_Host) and, for existing callers, as a read-only mapping (configuration["SMTP_SSL_Host"]).
+
+secret.key may hold several keys, one per line, newest first. Everything is encrypted with the first key and
+decrypted with whichever key matches (MultiFernet), which is how keys are rotated, see Encrypt_Config.py.
+"""
+import os
+import json
+import threading
+import traceback
+import metrics
+from typing import Any, Callable, Iterator, Mapping
+from log_backends import ARCHIVE_EXTENSIONS, LOG_BACKENDS
+
+class Setting:
+    """One configuration key: its type(s), whether it must be present, its default and an extra check on its value."""
+    __slots__ = ("name", "kind", "required", "default", "check")
+
+    def __init__(self, name:str, kind:type|tuple[type,...], required:bool=True, default:Any=None, check:Callable[[Any],bool]|None=None):
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.check = check
+
+SETTINGS:tuple[Setting,...] = (
+                                Setting("Logger_Base_Directory", str),
+                                Setting("Logger_Filename", str),
+                                Setting("Logger_Archive_Folder", str),
+                                Setting("SMTP_SSL_Host", str),
+                                Setting("SMTP_SSL_Port", int),
+                                Setting("Sender_Email", str),
+                                Setting("Sender_Email_Password", str),
+                                Setting("To_Email", str),
+                                Setting("CC_Email", str),
+                                Setting("Warn_User_Of_Logoff", bool),
+                                Setting("Logoff_Warning_Time_Left", int, check=lambda value: value >= 1),
+                                Setting("DEBUG", bool),
+                                Setting("Logger_Asynchronous", bool, required=False, default=True),
+                                Setting("Logger_Archive_Compression", (str, type(None)), required=False, default="gzip", check=lambda value: value in ARCHIVE_EXTENSIONS),
+                                Setting("Logger_Backend", str, required=False, default="xml", check=lambda value: value.lower() in LOG_BACKENDS),
+                                Setting("Logger_Concurrent", bool, required=False, default=False),
+                                Setting("SMTP_Use_SSL", bool, required=False, default=True),
+                                Setting("Email_Outbox_Folder", str, required=False, default="outbox"),
+                                Setting("Email_Outbox_Grace_Seconds", (int, float), required=False, default=5),
+                                Setting("Headless_Warning_Command", (list, type(None)), required=False, default=None, check=lambda value: all(isinstance(item, str) for item in value)),
+                                Setting("Metrics_Enabled", bool, required=False, default=False),
+                                Setting("Metrics_Format", str, required=False, default="json", check=lambda value: value in ("json", "prometheus")),
+                                Setting("Metrics_Folder", str, required=False, default="metrics")
+                              )
+
+# Compiled once: (name, kind, check) for the keys that must be present and valid, and the defaults of the others
+_REQUIRED:tuple[tuple[str,type|tuple[type,...],Callable[[Any],bool]|None],...] = tuple((setting.name, setting.kind, setting.check) for setting in SETTINGS if setting.required)
+_OPTIONAL:tuple[tuple[str,type|tuple[type,...],Callable[[Any],bool]|None],...] = tuple((setting.name, setting.kind, setting.check) for setting in SETTINGS if not setting.required)
+DEFAULTS:dict[str,Any] = {setting.name: setting.default for setting in SETTINGS if not setting.required}
+
+def invalid_keys(values:Mapping[str,Any]) -> list[str]:
+    """Keys that are missing, empty, of the wrong type or fail their check. Optional keys are only checked when present."""
+    invalid:list[str] = []
+    for name, kind, check in _REQUIRED:
+        value = values.get(name)
+        if (value is None) or (value == "") or (not isinstance(value, kind)) or ((check is not None) and (not check(value))):
+            invalid.append(name)
+    for name, kind, check in _OPTIONAL:
+        if name in values:
+            value = values[name]
+            if (not isinstance(value, kind)) or ((check is not None) and (value is not None) and (not check(value))):
+                invalid.append(name)
+    return invalid
+
+class Configuration(Mapping):
+    """Settings read from one configuration file. Read them as attributes or, like the plain dict this replaces, by key. Defaults fill in optional keys."""
+    Logger_Base_Directory:str
+    Logger_Filename:str
+    Logger_Archive_Folder:str
+    SMTP_SSL_Host:str
+    SMTP_SSL_Port:int
+    Sender_Email:str
+    Sender_Email_Password:str
+    To_Email:str
+    CC_Email:str
+    Warn_User_Of_Logoff:bool
+    Logoff_Warning_Time_Left:int
+    DEBUG:bool
+    Logger_Asynchronous:bool
+    Logger_Archive_Compression:str|None
+    Logger_Backend:str
+    Logger_Concurrent:bool
+    SMTP_Use_SSL:bool
+    Email_Outbox_Folder:str
+    Email_Outbox_Grace_Seconds:float
+    Headless_Warning_Command:list[str]|None
+    Metrics_Enabled:bool
+    Metrics_Format:str
+    Metrics_Folder:str
+
+    def __init__(self, values:Mapping[str,Any]):
+        self._values:dict[str,Any] = {**DEFAULTS, **values}
+
+    def __getattr__(self, name:str) -> Any:
+        try:
+            return self.__dict__["_values"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name:str) -> Any:
+        return self._values[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        # Never print the password
+        return f"Configuration({ {name: ('***' if name == 'Sender_Email_Password' else value) for name, value in self._values.items()} })"
+
+class Configuration_Error(ValueError):
+    def __init__(self, path:str, keys:list[str]):
+        super().__init__(f"Missing required keys in configuration: {keys}.")
+        self.path = path
+        self.keys = keys
+
+def load_fernet(key_path:str="secret.key"):
+    """MultiFernet over every key in key_path (one per line, newest first). Encrypts with the first, decrypts with any."""
+    from cryptography.fernet import Fernet, MultiFernet
+    with open(key_path, "rb") as key_file:
+        keys:list[bytes] = [line.strip() for line in key_file.read().splitlines() if line.strip()]
+    if not keys:
+        raise ValueError(f"{key_path} holds no key.")
+    return MultiFernet([Fernet(key) for key in keys])
+
+class Configuration_Source:
+    def __init__(self, path:str="Config.json", key_path:str|None=None):
+        """
+        path is a JSON configuration, or an encrypted one when key_path is given (Config.encrypted with secret.key).
+        Keys in key_path are only read when the configuration itself has changed.
+        """
+        self.path = path
+        self.key_path = key_path
+        self.last_error:Exception|None = None
+        self._configuration:Configuration|None = None
+        self._signature:tuple[int,int,int]|None = None
+        self._lock:threading.Lock = threading.Lock()
+
+    def current(self) -> Configuration:
+        """
+        The configuration as of the file on disk, re-read only when its modification time, size or inode changed.
+        The first load is returned as read so the caller can report invalid keys (see invalid_keys). A later change
+        that does not validate is reported through last_error and the previous configuration is kept.
+        """
+        stat:os.stat_result = os.stat(self.path)
+        signature:tuple[int,int,int] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if signature == self._signature:
+            return self._configuration
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    if self._configuration is not None:
+                        metrics.increment("config_reloads")
+                    with metrics.timed("config_load"):
+                        values:dict[str,Any] = self._read()
+                    invalid:list[str] = invalid_keys(values)
+                    if invalid and (self._configuration is not None):
+                        raise Configuration_Error(self.path, invalid)
+                    self._configuration = Configuration(values)
+                    self.last_error = None
+                except Exception as e:
+                    if self._configuration is None:
+                        raise
+                    traceback.print_exc()
+                    self.last_error = e
+                self._signature = signature
+        return self._configuration
+
+    def _read(self) -> dict[str,Any]:
+        with open(self.path, "rb") as configuration_file:
+            data:bytes = configuration_file.read()
+        if self.key_path is not None:
+            return json.loads(load_fernet(self.key_path).decrypt(data).decode(errors="ignore"))
+        return json.loads(data)
+
+_SOURCES:dict[tuple[str,str|None],Configuration_Source] = {}
+
+def get_source(path:str="Config.json", key_path:str|None=None) -> Configuration_Source:
+    """Shared Configuration_Source per file, so every caller benefits from the same cache."""
+    source_key:tuple[str,str|None] = (os.path.abspath(path), None if key_path is None else os.path.abspath(key_path))
+    if source_key not in _SOURCES:
+        _SOURCES[source_key] = Configuration_Source(path, key_path)
+    return _SOURCES[source_key]
+
+def forget_source(path:str="Config.json", key_path:str|None=None) -> None:
+    """Drops the cached source of a file so the next get_source reads it from scratch, e.g. to verify a freshly written config."""
+    _SOURCES.pop((os.path.abspath(path), None if key_path is None else os.path.abspath(key_path)), None)
@@ -0,0 +1,323 @@
+"""
+On-disk outbox for the login and logoff receipts. Receipts are written to a spool folder and sent by a background
+thread that keeps one authenticated SMTP connection open across messages, sends whatever is queued in one go and
+retries with a growing delay while the server is unreachable. Receipts that could not be sent before the computer
+logged off stay in the spool and are sent by the next session. A receipt the server refuses for good (5xx, refused
+recipients) or whose spool file cannot be read is moved to a dead letter folder so it never holds up the others.
+
+Every log line about a receipt names it, "(receipt <spool file name without .json>)", and starts with the
+"[machine/user]" of its session when it was queued with one, so each failure is logged once per receipt and
+usage_report can count it against the right machine.
+"""
+from __future__ import annotations
+import os
+import json
+import uuid
+import threading
+import traceback
+from time import time, time_ns
+from typing import Any, Callable, Mapping, TYPE_CHECKING
+from xml_logging import XML_Logger
+from metrics import timed, increment
+from configuration import Configuration_Source
+
+if TYPE_CHECKING:
+    import smtplib # smtplib (and ssl) and email.mime are imported by the sender thread, not at startup
+
+# A receipt being sent is renamed <name>.json.sending.<pid>, so no other sender sharing the spool picks it up
+_CLAIM_SUFFIX:str = ".sending."
+
+class Email_Outbox:
+    def __init__(self, configuration:Mapping[str,Any]|Configuration_Source, logger:XML_Logger, spool_directory:str,
+                 smtp_factory:Callable[...,smtplib.SMTP]|None=None, max_batch:int=20,
+                 retry_delays:tuple[float,...]=(5, 30, 120, 600), idle_timeout:float=60, socket_timeout:float=30,
+                 dead_letter_directory:str|None=None, claim_timeout:float=600):
+        """
+        Given a Configuration_Source, the configuration is re-checked before every batch so new SMTP settings are used
+        without a restart (the open connection is replaced when they change).
+
+        smtp_factory(host, port, timeout=...) opens the connection. Without one it is smtplib.SMTP_SSL, or plain
+        smtplib.SMTP when SMTP_Use_SSL is false, which lets the outbox be pointed at a local stand-in server. Connections left unused for idle_timeout
+        seconds are closed, and retry_delays are the waits after consecutive failures (the last one repeats).
+
+        Sender and recipients are read from the configuration when a receipt is sent, not when it is queued, so a
+        corrected To_Email also applies to receipts already waiting. Receipts that fail permanently go to
+        dead_letter_directory (spool_directory/dead_letter by default) and are logged once.
+
+        Sessions may share one spool folder: each receipt is claimed by renaming it before it is sent, and a claim
+        older than claim_timeout seconds, left by a sender that stopped, is put back in the spool.
+        """
+        self._source:Configuration_Source|None = configuration if isinstance(configuration, Configuration_Source) else None
+        self._configuration:Mapping[str,Any]|None = None if self._source is not None else configuration
+        self.logger = logger
+        self.spool_directory = spool_directory
+        self.dead_letter_directory = os.path.join(spool_directory, "dead_letter") if dead_letter_directory is None else dead_letter_directory
+        self.smtp_factory = smtp_factory
+        self.max_batch = max_batch
+        self.retry_delays = retry_delays
+        self.idle_timeout = idle_timeout
+        self.socket_timeout = socket_timeout
+        self.claim_timeout = claim_timeout
+        self._connection:smtplib.SMTP|None = None
+        self._connection_settings:tuple|None = None
+        self._failures:int = 0
+        self._reported:set[str] = set()  # Receipts whose failure to send has been logged, retries only log a WARNING
+        self._wakeup:threading.Event = threading.Event()
+        self._idle:threading.Event = threading.Event()
+        self._stopping:bool = False
+        self._sender:threading.Thread|None = None
+
+    @property
+    def configuration(self) -> Mapping[str,Any]:
+        """The configuration as of now, one os.stat when it comes from a Configuration_Source."""
+        return self._source.current() if self._source is not None else self._configuration
+
+    def start(self) -> None:
+        """Starts the sender thread. Receipts left in the spool by earlier sessions are sent first."""
+        os.makedirs(self.spool_directory, exist_ok=True)
+        if self._sender is None:
+            self._stopping = False
+            self._sender = threading.Thread(target=self._sender_loop, name="Email_Outbox sender", daemon=True)
+            self._sender.start()
+
+    def enqueue(self, subject:str, body:str, session:str|None=None) -> str:
+        """
+        Writes a receipt to the spool and wakes the sender. Never touches the network. Returns the spool file name.
+        session ("machine/user") is put in front of the receipt's log lines.
+        """
+        os.makedirs(self.spool_directory, exist_ok=True)
+        # Names sort in the order the receipts were queued
+        filename:str = f"{time_ns():020d}_{uuid.uuid4().hex}.json"
+        receipt:dict[str,str] = {"subject": subject, "body": body}
+        if session is not None:
+            receipt["session"] = session
+        path:str = os.path.join(self.spool_directory, filename)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as spool_file:
+            json.dump(receipt, spool_file)
+        os.replace(f"{path}.tmp", path)
+        self._idle.clear()
+        self._wakeup.set()
+        return filename
+
+    def pending(self) -> list[str]:
+        """Spool file names still waiting to be sent, oldest first. Receipts being sent (claimed) are not listed."""
+        try:
+            return sorted(filename for filename in os.listdir(self.spool_directory) if filename.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def flush(self, timeout:float|None=None) -> bool:
+        """Waits up to timeout seconds for the spool to be empty. Returns True if everything was sent."""
+        if self._sender is None:
+            return not self.pending()
+        self._wakeup.set()
+        return self._idle.wait(timeout)
+
+    def close(self, timeout:float=5) -> bool:
+        """
+        Gives the sender up to timeout seconds to deliver what is queued, then stops it and closes the connection.
+        Anything still unsent stays in the spool for the next session. Returns True if the spool is empty.
+        """
+        delivered:bool = self.flush(timeout)
+        sender = self._sender
+        if sender is not None:
+            self._stopping = True
+            self._wakeup.set()
+            sender.join(timeout=max(timeout, 1))
+            self._sender = None
+        return delivered
+
+    def _sender_loop(self) -> None:
+        while not self._stopping:
+            wait:float|None = None
+            try:
+                wait = self._send_pending()
+            except Exception:
+                traceback.print_exc()
+                wait = self._retry_delay()
+            if wait is None:
+                self._idle.set()
+                if self.pending():
+                    self._idle.clear()  # Queued while the spool was being checked
+                    continue
+                # Nothing queued, close the connection once it has been idle long enough
+                if (self._connection is not None) and (not self._wakeup.wait(self.idle_timeout)):
+                    self._disconnect()
+                    continue
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(wait)
+            self._wakeup.clear()
+        self._disconnect()
+
+    def _send_pending(self) -> float|None:
+        """Sends queued receipts in batches. Returns how long to wait before retrying, or None once the spool is empty."""
+        self._recover_claims()
+        while not self._stopping:
+            batch:list[str] = self.pending()[:self.max_batch]
+            if not batch:
+                return None
+            try:
+                configuration:Mapping[str,Any] = self.configuration
+                connection:smtplib.SMTP = self._connect(configuration)
+                for filename in batch:
+                    claimed:str|None = self._claim(filename)
+                    if claimed is None:
+                        continue  # Sent by the outbox of another session sharing the spool
+                    receipt:dict[str,str]|None = None
+                    try:
+                        receipt = self._read_receipt(claimed)
+                        self._send_receipt(connection, filename, claimed, receipt, configuration)
+                    except Exception as error:
+                        if not _is_permanent(error):
+                            self._release(filename, claimed)
+                            raise
+                        self._dead_letter(filename, claimed, receipt)
+                self._failures = 0
+            except Exception:
+                self._failures += 1
+                increment("email_failures")
+                self._disconnect()
+                self._report_failure(batch)
+                return self._retry_delay()
+        return None
+
+    def _claim(self, filename:str) -> str|None:
+        """
+        Takes a receipt out of the spool for this sender by renaming it, atomic even when several sessions share the
+        spool. Returns the claimed path, or None when another sender got there first.
+        """
+        claimed:str = os.path.join(self.spool_directory, f"{filename}{_CLAIM_SUFFIX}{os.getpid()}")
+        try:
+            os.replace(os.path.join(self.spool_directory, filename), claimed)
+            os.utime(claimed)  # When it was claimed, see _recover_claims
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _release(self, filename:str, claimed:str) -> None:
+        """Puts a claimed receipt back in the spool to be retried."""
+        try:
+            os.replace(claimed, os.path.join(self.spool_directory, filename))
+        except FileNotFoundError:
+            pass
+
+    def _recover_claims(self) -> None:
+        """Puts back the receipts claimed more than claim_timeout seconds ago, by a sender that stopped before sending them."""
+        try:
+            names:list[str] = [name for name in os.listdir(self.spool_directory) if _CLAIM_SUFFIX in name]
+        except FileNotFoundError:
+            return
+        for name in names:
+            claimed:str = os.path.join(self.spool_directory, name)
+            try:
+                if time() - os.path.getmtime(claimed) > self.claim_timeout:
+                    os.replace(claimed, os.path.join(self.spool_directory, name.split(_CLAIM_SUFFIX)[0]))
+            except FileNotFoundError:
+                pass
+
+    def _read_receipt(self, path:str) -> dict[str,str]:
+        with open(path, "r", encoding="utf-8") as spool_file:
+            return json.load(spool_file)
+
+    def _send_receipt(self, connection:smtplib.SMTP, filename:str, claimed:str, receipt:dict[str,str], configuration:Mapping[str,Any]) -> None:
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        message = MIMEMultipart('alternative')
+        rcpt = [configuration["To_Email"],configuration["CC_Email"]]
+        message['Subject'] = receipt["subject"]
+        message['From'] = configuration["Sender_Email"]
+        message['To'] = configuration["To_Email"]
+        message['Cc'] = configuration["CC_Email"]
+        message.attach(MIMEText(receipt["body"]))
+        with timed("smtp_send"):
+            connection.sendmail(configuration["Sender_Email"], rcpt, message.as_string())
+        increment("emails_sent")
+        try:
+            os.remove(claimed)
+        except FileNotFoundError:
+            pass  # Sent all the same, the claim was taken back as stale meanwhile
+        self._reported.discard(filename)
+        self.logger.log_to_xml(message=f"{_prefix(receipt)}Login email successfully sent to {rcpt} (receipt {filename[:-5]}).",status="SUCCESS",basepath=self.logger.base_dir)
+
+    def _dead_letter(self, filename:str, claimed:str, receipt:dict[str,str]|None) -> None:
+        """Moves a receipt that can never be sent out of the spool and logs why, once. Called while its error is handled."""
+        os.makedirs(self.dead_letter_directory, exist_ok=True)
+        os.replace(claimed, os.path.join(self.dead_letter_directory, filename))
+        self._reported.discard(filename)
+        increment("email_dead_letters")
+        self.logger.log_to_xml(message=f"{_prefix(receipt)}Email failed to send and will not be retried (receipt {filename[:-5]}), moved to {self.dead_letter_directory}. Official error: {traceback.format_exc()}",status="ERROR",basepath=self.logger.base_dir)
+
+    def _report_failure(self, batch:list[str]) -> None:
+        """
+        Logs the failure of a batch, called while its error is handled: an ERROR for every receipt of the batch still
+        waiting whose failure was not logged yet, then a WARNING for the attempt as a whole.
+        """
+        error:str = traceback.format_exc()
+        waiting:list[str] = self.pending()
+        for filename in sorted(set(batch).intersection(waiting).difference(self._reported)):
+            self._reported.add(filename)
+            try:
+                receipt:dict[str,str]|None = self._read_receipt(os.path.join(self.spool_directory, filename))
+            except Exception:
+                receipt = None
+            self.logger.log_to_xml(message=f"{_prefix(receipt)}Email failed to send (receipt {filename[:-5]}), kept in the outbox to be retried. Official error: {error}",status="ERROR",basepath=self.logger.base_dir)
+        self.logger.log_to_xml(message=f"Email attempt {self._failures} failed, {len(waiting)} receipt(s) kept in the outbox. Official error: {error}",status="WARNING",basepath=self.logger.base_dir)
+
+    def _connect(self, configuration:Mapping[str,Any]) -> smtplib.SMTP:
+        """
+        Returns the open connection, checking with NOOP that the server did not drop it, or opens and logs in a new
+        one. A connection opened with different SMTP settings is closed first.
+        """
+        import smtplib
+        settings:tuple = (configuration["SMTP_SSL_Host"], configuration["SMTP_SSL_Port"], configuration["Sender_Email"],
+                          configuration["Sender_Email_Password"], configuration.get("SMTP_Use_SSL", True))
+        if (self._connection is not None) and (settings != self._connection_settings):
+            self._disconnect()
+        if self._connection is not None:
+            try:
+                if self._connection.noop()[0] == 250:
+                    return self._connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        smtp_factory:Callable[...,smtplib.SMTP]|None = self.smtp_factory
+        if smtp_factory is None:
+            smtp_factory = smtplib.SMTP_SSL if configuration.get("SMTP_Use_SSL", True) else smtplib.SMTP
+        with timed("smtp_connect"):
+            connection:smtplib.SMTP = smtp_factory(configuration["SMTP_SSL_Host"], configuration["SMTP_SSL_Port"], timeout=self.socket_timeout)
+            try:
+                connection.login(configuration["Sender_Email"], configuration["Sender_Email_Password"])
+            except Exception:
+                connection.close()
+                raise
+        self._connection = connection
+        self._connection_settings = settings
+        return connection
+
+    def _disconnect(self) -> None:
+        if self._connection is None:
+            return
+        import smtplib
+        try:
+            self._connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self._connection.close()
+        self._connection = None
+
+    def _retry_delay(self) -> float:
+        return self.retry_delays[min(max(self._failures, 1), len(self.retry_delays)) - 1]
+
+def _prefix(receipt:dict[str,str]|None) -> str:
+    """"[machine/user] " for a receipt queued with a session, as fleet_controller starts its own log lines."""
+    session:str|None = None if receipt is None else receipt.get("session")
+    return f"[{session}] " if session else ""
+
+def _is_permanent(error:Exception) -> bool:
+    """Errors that retrying the same receipt cannot fix: a 5xx reply, every recipient refused, an unreadable spool file."""
+    import smtplib
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return isinstance(error, (ValueError, KeyError))  # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
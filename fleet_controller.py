@@ -0,0 +1,242 @@
+"""
+Runs the sessions of a whole room of computers from one asyncio process. Every session's heartbeats, warning and
+logoff sit in one deadline heap (O(log n) to add or remove a session), all of them share one logger and one email
+outbox (one SMTP connection), and the logoff itself is carried out by a pluggable executor.
+
+    python fleet_controller.py --sessions sessions.json --config Config.json --executor my_agents:Ssh_Executor
+    python fleet_controller.py --sessions sessions.json --config Config.json --dry-run
+
+sessions.json is a list of {"machine": ..., "user": ..., "minutes": ...} objects. --executor names a Logoff_Executor
+subclass (see fleet_executors) as module:Class, it is built with the configuration. One of --executor and --dry-run
+is required.
+"""
+import sys
+import json
+import asyncio
+import argparse
+import traceback
+import metrics
+from time import monotonic
+from datetime import datetime, timedelta
+from typing import Callable
+from xml_logging import XML_Logger
+from email_outbox import Email_Outbox
+from session_scheduler import Deadline_Scheduler, Scheduled_Event
+from configuration import get_source
+from fleet_executors import Logoff_Executor, Logoff_Computer_Executor, Fake_Executor, load_executor
+from AutoLogOff import get_configuration_without_encryption, get_logger, get_outbox, _verify_configuration
+
+class Fleet_Session:
+    """One user's session on one machine. state is "running", "logging off", "logged off", "failed" or "cancelled"."""
+    __slots__ = ("machine", "user", "minutes", "end_time", "end_deadline", "state", "heartbeat", "warning", "end")
+
+    def __init__(self, machine:str, user:str, minutes:int, end_time:datetime, end_deadline:float):
+        self.machine = machine
+        self.user = user
+        self.minutes = minutes
+        self.end_time = end_time
+        self.end_deadline = end_deadline
+        self.state:str = "running"
+        # Pending events, kept so the session can be cancelled
+        self.heartbeat:Scheduled_Event|None = None
+        self.warning:Scheduled_Event|None = None
+        self.end:Scheduled_Event|None = None
+
+    @property
+    def key(self) -> tuple[str,str]:
+        return (self.machine, self.user)
+
+    def __repr__(self) -> str:
+        return f"Fleet_Session({self.machine!r}, {self.user!r}, ends {self.end_time:%H:%M:%S}, {self.state})"
+
+class Fleet_Controller:
+    def __init__(self, configuration:dict[str,str|bool|int], logger:XML_Logger, outbox:Email_Outbox|None=None,
+                 executor:Logoff_Executor|None=None, heartbeat_interval:float|None=60, max_concurrent_actions:int=64,
+                 clock:Callable[[],float]=monotonic):
+        """
+        heartbeat_interval is how often each session logs its minutes remaining (None turns the heartbeats off).
+        max_concurrent_actions caps how many warnings and logoffs the executor runs at the same time.
+        outbox is optional, without it no receipts are sent.
+        """
+        self.configuration = configuration
+        self.logger = logger
+        self.outbox = outbox
+        self.executor:Logoff_Executor = Logoff_Computer_Executor(configuration) if executor is None else executor
+        self.heartbeat_interval = heartbeat_interval
+        self.scheduler:Deadline_Scheduler = Deadline_Scheduler(clock=clock)
+        self.sessions:dict[tuple[str,str],Fleet_Session] = {}
+        self._max_concurrent_actions = max_concurrent_actions
+        self._actions:set[asyncio.Task] = set()
+        self._semaphore:asyncio.Semaphore|None = None
+        self._changed:asyncio.Event|None = None
+
+    def add_session(self, machine:str, user:str, minutes:int, end_time:datetime|None=None) -> Fleet_Session:
+        """Starts a session of minutes minutes (ending at end_time when given). A running session for the same machine and user is replaced."""
+        previous:Fleet_Session|None = self.sessions.get((machine, user))
+        if previous is not None:
+            self.cancel_session(previous, reason="replaced by a new session")
+        now:datetime = datetime.now()
+        end_time = now + timedelta(minutes=minutes) if end_time is None else end_time
+        # Read the wall clock once, the deadlines are measured on the monotonic clock from here on
+        end_deadline:float = self.scheduler.clock() + max(0.0, (end_time - now).total_seconds())
+        session:Fleet_Session = Fleet_Session(machine, user, minutes, end_time, end_deadline)
+        self.sessions[session.key] = session
+        self._schedule(session)
+
+        self.logger.log_to_xml(f"[{machine}/{user}] The login time is {now:%I:%M %p}\nYou will be logged off at {end_time:%I:%M %p}", basepath=self.logger.base_dir, status="INFO")
+        self._enqueue_receipt(session, logging_in=True)
+        if self._changed is not None:
+            self._changed.set()  # The new session may be due before whatever run() is waiting for
+        return session
+
+    def cancel_session(self, session:Fleet_Session, reason:str="cancelled") -> None:
+        """Drops the session's pending events, e.g. when the user logged off early. O(1), see Deadline_Scheduler.cancel."""
+        if session.state != "running":
+            return
+        for event in (session.heartbeat, session.warning, session.end):
+            if event is not None:
+                self.scheduler.cancel(event)
+        session.heartbeat = session.warning = session.end = None
+        session.state = "cancelled"
+        if self.sessions.get(session.key) is session:
+            del self.sessions[session.key]
+        self.logger.log_to_xml(f"[{session.machine}/{session.user}] Session {reason}.", basepath=self.logger.base_dir, status="INFO")
+
+    async def run(self, until_idle:bool=False, stop:asyncio.Event|None=None) -> None:
+        """
+        Runs the sessions' events as their deadlines come. Returns when stop is set, or with until_idle once every
+        session has ended and every warning and logoff has finished.
+        """
+        self._semaphore = asyncio.Semaphore(self._max_concurrent_actions)
+        self._changed = asyncio.Event()
+        waiters:list[asyncio.Future] = [asyncio.ensure_future(self._changed.wait())]
+        if stop is not None:
+            waiters.append(asyncio.ensure_future(stop.wait()))
+        try:
+            while (stop is None) or (not stop.is_set()):
+                self.scheduler.run_due()
+                delay:float|None = self.scheduler.time_until_next()
+                if until_idle and (delay is None):
+                    if self._actions:
+                        await asyncio.gather(*self._actions, return_exceptions=True)
+                        continue  # Actions may have added sessions
+                    return
+                await asyncio.wait(waiters, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if waiters[0].done():
+                    self._changed.clear()
+                    waiters[0] = asyncio.ensure_future(self._changed.wait())
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+            self._changed = None
+
+    def _schedule(self, session:Fleet_Session) -> None:
+        now:float = self.scheduler.clock()
+        if (self.heartbeat_interval is not None) and (now < session.end_deadline):
+            session.heartbeat = self.scheduler.schedule_at(now, self._heartbeat, session, now)
+        if self.configuration.get("Warn_User_Of_Logoff") and (self.configuration.get("Logoff_Warning_Time_Left") is not None):
+            warning_deadline:float = session.end_deadline - float(self.configuration["Logoff_Warning_Time_Left"]) * 60
+            if now < session.end_deadline:
+                # A session no longer than the warning is warned at once, as schedule_session does
+                session.warning = self.scheduler.schedule_at(max(now, warning_deadline), self._warn, session)
+        session.end = self.scheduler.schedule_at(session.end_deadline, self._end, session)
+
+    def _heartbeat(self, session:Fleet_Session, deadline:float) -> None:
+        minutes_left = round((session.end_deadline - self.scheduler.clock()) / 60)
+        self.logger.log_to_xml(message=f"[{session.machine}/{session.user}] {minutes_left:,.0f}/{session.minutes} minutes remaining",
+                               status="INFO", basepath=self.logger.base_dir)
+        next_deadline:float = deadline + self.heartbeat_interval
+        session.heartbeat = None
+        if next_deadline < session.end_deadline:
+            session.heartbeat = self.scheduler.schedule_at(next_deadline, self._heartbeat, session, next_deadline)
+
+    def _warn(self, session:Fleet_Session) -> None:
+        session.warning = None
+        minutes_left = round((session.end_deadline - self.scheduler.clock()) / 60)
+        self._start_action(self._run_warning(session, f"Logging off in {minutes_left} minute(s). Save your progress!"))
+
+    def _end(self, session:Fleet_Session) -> None:
+        session.state = "logging off"
+        session.heartbeat = session.end = None
+        self._start_action(self._run_logoff(session))
+
+    def _start_action(self, action) -> None:
+        task:asyncio.Task = asyncio.get_running_loop().create_task(action)
+        self._actions.add(task)
+        task.add_done_callback(self._actions.discard)
+
+    async def _run_warning(self, session:Fleet_Session, message:str) -> None:
+        async with self._semaphore:
+            try:
+                await self.executor.warn(session, "LOGOFF WARNING", message)
+            except Exception:
+                self.logger.log_to_xml(message=f"[{session.machine}/{session.user}] Warning failed. Official error: {traceback.format_exc()}",status="ERROR",basepath=self.logger.base_dir)
+
+    async def _run_logoff(self, session:Fleet_Session) -> None:
+        async with self._semaphore:
+            try:
+                with metrics.timed("fleet_logoff"):
+                    await self.executor.logoff(session)
+            except Exception:
+                session.state = "failed"
+                self.logger.log_to_xml(message=f"[{session.machine}/{session.user}] Logoff failed. Official error: {traceback.format_exc()}",status="ERROR",basepath=self.logger.base_dir)
+            else:
+                session.state = "logged off"
+                self.logger.log_to_xml(message=f"[{session.machine}/{session.user}] Logged off.",status="SUCCESS",basepath=self.logger.base_dir)
+                self._enqueue_receipt(session, logging_in=False)
+        if self.sessions.get(session.key) is session:
+            del self.sessions[session.key]
+
+    def _enqueue_receipt(self, session:Fleet_Session, logging_in:bool) -> None:
+        if self.outbox is None:
+            return
+        try:
+            if logging_in:
+                subject = f"Computer {session.machine} Logged In"
+                body = f"Computer {session.machine} was logged in by {session.user} and should be logged off by {session.end_time:%H:%M}. If it is still on, ask the person to leave as they have violated the computer policy."
+            else:
+                subject = f"Computer {session.machine} Log Off"
+                body = f"Computer {session.machine} successfully logged off {session.user}."
+            self.outbox.enqueue(subject=subject, body=body, session=f"{session.machine}/{session.user}")
+        except Exception:
+            self.logger.log_to_xml(message=f"[{session.machine}/{session.user}] Receipt could not be queued. Official error: {traceback.format_exc()}",status="ERROR",basepath=self.logger.base_dir)
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", required=True, help="JSON list of {machine, user, minutes}")
+    parser.add_argument("--config", default="Config.json")
+    executors = parser.add_mutually_exclusive_group(required=True)
+    executors.add_argument("--executor", help="Logoff_Executor subclass that reaches the machines, as module:Class (fleet_executors:Logoff_Computer_Executor only acts on this computer)")
+    executors.add_argument("--dry-run", action="store_true", help="Use Fake_Executor instead of logging anyone off")
+    args = parser.parse_args(argv)
+
+    configuration:dict[str,str|bool|int] = get_configuration_without_encryption(args.config)
+    metrics.configure(configuration)
+    logger:XML_Logger = get_logger(configuration=configuration)
+    if not _verify_configuration(configuration=configuration, logger=logger):
+        sys.exit(1)
+    try:
+        executor:Logoff_Executor = Fake_Executor() if args.dry_run else load_executor(args.executor, configuration)
+    except Exception:
+        logger.log_to_xml(message=f"Executor {args.executor} could not be loaded. Official error: {traceback.format_exc()}",status="CRITICAL",basepath=logger.base_dir)
+        logger.close()
+        sys.exit(1)
+    outbox:Email_Outbox = get_outbox(configuration=configuration, logger=logger, source=get_source(args.config))
+    outbox.start()
+    controller:Fleet_Controller = Fleet_Controller(configuration, logger, outbox=outbox, executor=executor)
+
+    async def run_sessions() -> None:
+        with open(args.sessions, "r", encoding="utf-8") as sessions_file:
+            for session in json.load(sessions_file):
+                controller.add_session(session["machine"], session["user"], int(session["minutes"]))
+        await controller.run(until_idle=True)
+
+    try:
+        asyncio.run(run_sessions())
+    finally:
+        outbox.close(timeout=configuration.get("Email_Outbox_Grace_Seconds", 5))
+        logger.close()
+        metrics.write_session_metrics(logger.base_dir, configuration)
+
+if __name__ == "__main__":
+    main()
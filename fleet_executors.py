@@ -0,0 +1,72 @@
+"""
+Executors of fleet_controller: they carry out the warnings and logoffs of its sessions. They live in their own module
+so an executor named on the command line (--executor module:Class) and the controller, even when it runs as
+__main__, share one Logoff_Executor class.
+"""
+from __future__ import annotations
+import asyncio
+import platform
+import importlib
+from time import monotonic
+from typing import Callable, TYPE_CHECKING
+from AutoLogOff import logoff_computer, send_headless_warning
+
+if TYPE_CHECKING:
+    from fleet_controller import Fleet_Session
+
+class Logoff_Executor:
+    """Carries out the warnings and logoffs of the controller's sessions. Subclass it to reach the machines."""
+    async def warn(self, session:Fleet_Session, title:str, message:str) -> None:
+        raise NotImplementedError
+
+    async def logoff(self, session:Fleet_Session) -> None:
+        """Raises when the logoff failed."""
+        raise NotImplementedError
+
+class Logoff_Computer_Executor(Logoff_Executor):
+    """
+    Default executor: logoff_computer and send_headless_warning, run on a worker thread so the event loop keeps going.
+    Both act on the computer the controller runs on, so only sessions of that machine (platform.node()) are handled,
+    any other session fails. Subclass Logoff_Executor to reach other machines (ssh, an agent).
+    """
+    def __init__(self, configuration:dict[str,str|bool|int]):
+        self.configuration = configuration
+        self.machine:str = platform.node()
+
+    def _check_local(self, session:Fleet_Session) -> None:
+        if session.machine.lower() != self.machine.lower():
+            raise RuntimeError(f"{session.machine} is not this computer ({self.machine}), Logoff_Computer_Executor only acts locally")
+
+    async def warn(self, session:Fleet_Session, title:str, message:str) -> None:
+        self._check_local(session)
+        await asyncio.to_thread(send_headless_warning, title, message, self.configuration)
+
+    async def logoff(self, session:Fleet_Session) -> None:
+        self._check_local(session)
+        await asyncio.to_thread(logoff_computer, self.configuration["DEBUG"])
+
+class Fake_Executor(Logoff_Executor):
+    """Records what would have happened instead of doing it, with the clock reading at the time. Used by benchmarks."""
+    def __init__(self, clock:Callable[[],float]=monotonic, fail_machines:set[str]|None=None):
+        self.clock = clock
+        self.fail_machines:set[str] = set() if fail_machines is None else fail_machines
+        self.warnings:list[tuple[str,str,float,str]] = []
+        self.logoffs:list[tuple[str,str,float]] = []
+
+    async def warn(self, session:Fleet_Session, title:str, message:str) -> None:
+        self.warnings.append((session.machine, session.user, self.clock(), message))
+
+    async def logoff(self, session:Fleet_Session) -> None:
+        if session.machine in self.fail_machines:
+            raise RuntimeError(f"{session.machine} did not answer")
+        self.logoffs.append((session.machine, session.user, self.clock()))
+
+def load_executor(path:str, configuration:dict[str,str|bool|int]) -> Logoff_Executor:
+    """Builds the executor named by path, "module:Class", with the configuration."""
+    module_name, _, class_name = path.partition(":")
+    if (not module_name) or (not class_name):
+        raise ValueError(f"Executor {path!r} should be given as module:Class")
+    executor_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(executor_class, type) and issubclass(executor_class, Logoff_Executor)):
+        raise TypeError(f"{path} is not a Logoff_Executor subclass")
+    return executor_class(configuration)
@@ -0,0 +1,483 @@
+"""
+Storage formats for XML_Logger. The logger front end builds the timestamp, status and message of every entry and
+hands them to a backend that encodes them and appends them to the day's file:
+
+    xml     the original <logs><log timestamp status><message/></log></logs> format
+    jsonl   one compact JSON object per line
+    binary  length-prefixed frames with the timestamp stored as an integer
+
+All backends only ever append, report the byte offset of the entries they write (for the hour index) and can
+stream entries back from any entry boundary. convert_log turns any of them back into the original XML.
+"""
+import io
+import os
+import gzip
+import json
+import struct
+from typing import Iterator
+from datetime import datetime, timedelta
+from xml.etree import ElementTree as ET
+
+LOGS_OPEN_TAG:bytes = b"<logs>"
+LOGS_CLOSE_TAG:bytes = b"</logs>"
+LOGS_EMPTY_TAG:bytes = b"<logs />"
+TIMESTAMP_FORMAT:str = "%Y-%m-%d %H:%M:%S.%f"
+_TAIL_READ_SIZE:int = 64
+_READ_SIZE:int = 64 * 1024
+
+# Suffix added after the log extension for each archive compression, None keeps archives uncompressed
+ARCHIVE_EXTENSIONS:dict[str|None,str] = {"gzip":".gz", "zstd":".zst", None:""}
+
+def xml_sax_escape(data:str) -> str:
+    """Same as xml.sax.saxutils.escape, which costs urllib.request at import time just to escape three characters."""
+    return data.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+
+def xml_sax_unescape(data:str) -> str:
+    """Same as xml.sax.saxutils.unescape."""
+    return data.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+def open_archive(path:str, mode:str="rb", compression:str|None=None):
+    """
+    Opens an archived log as a binary file object. When compression is not given it is inferred from the extension.
+    zstd needs the optional zstandard package.
+    """
+    if compression is None:
+        compression = next((name for name, extension in ARCHIVE_EXTENSIONS.items() if extension and path.endswith(extension)), None)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+def write_gzip_members(source, destination, boundaries:list[int]) -> dict[int,int]:
+    """
+    Compresses source into destination as one gzip member per region between boundaries (offsets in source, e.g.
+    those of the hour index). Returns {offset in source: offset in destination} of every member, so a reader can start
+    decompressing at the member it needs. gzip readers see the members as one stream.
+    """
+    member_offsets:dict[int,int] = {}
+    starts:list[int] = sorted({0}.union(boundaries))
+    for start, end in zip(starts, starts[1:] + [None]):
+        member_offsets[start] = destination.tell()
+        source.seek(start)
+        with gzip.GzipFile(fileobj=destination, mode="wb", mtime=0) as member:
+            remaining:int|None = None if end is None else end - start
+            while remaining != 0:
+                chunk:bytes = source.read(_READ_SIZE if remaining is None else min(_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                member.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+    return member_offsets
+
+def open_gzip_member(path:str, offset:int, member_offset:int):
+    """
+    Opens a gzip archive written by write_gzip_members from the member that starts at offset (uncompressed), found
+    at member_offset in the file. Nothing before that member is decompressed, seek and tell still use the offsets
+    of the whole uncompressed file.
+    """
+    return io.BufferedReader(_Gzip_Member_Reader(path, offset, member_offset), buffer_size=_READ_SIZE)
+
+class _Gzip_Member_Reader(io.RawIOBase):
+    """Raw reader behind open_gzip_member, shifting positions by the uncompressed offset of the first member read."""
+    def __init__(self, path:str, offset:int, member_offset:int):
+        self._file = open(path, "rb")
+        self._file.seek(member_offset)
+        self._gzip:gzip.GzipFile = gzip.GzipFile(fileobj=self._file, mode="rb")
+        self._base:int = offset
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self._gzip.readinto(buffer)
+
+    def seek(self, offset:int, whence:int=os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            if offset < self._base:
+                raise ValueError(f"Offset {offset} is before the first member read, which starts at {self._base}")
+            offset -= self._base
+        return self._base + self._gzip.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._base + self._gzip.tell()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._gzip.close()
+            self._file.close()
+        super().close()
+
+class Log_Backend:
+    """Interface shared by the storage formats. Records are {"timestamp", "status", "message"} dictionaries."""
+    name:str = ""
+    extension:str = ""
+    first_entry_offset:int = 0  # Offset of the first entry in a file, before it nothing but a header is stored
+
+    def encode(self, timestamp:datetime, status:str, message:str) -> bytes:
+        """Serializes one entry."""
+        raise NotImplementedError
+
+    def append(self, log_file:str, data:bytes) -> tuple[int,bool]:
+        """
+        Appends serialized entries to log_file, creating it if needed. Returns the offset the entries were
+        written at and whether the file was created.
+        """
+        with open(log_file, "ab") as handle:
+            offset:int = handle.tell()
+            handle.write(data)
+        return offset, offset == 0
+
+    def iter_entries(self, handle, start_offset:int=0, end_offset:int|None=None) -> Iterator[dict[str,str]]:
+        """Streams the entries stored between two entry boundaries of an open binary file."""
+        raise NotImplementedError
+
+    def read_complete_entries(self, handle, offset:int) -> tuple[list[dict[str,str]],int]:
+        """
+        Parses the complete entries stored after offset. Returns them with the offset just past the last one,
+        leaving a partly written entry unread.
+        """
+        raise NotImplementedError
+
+    def end_offset(self, handle, hint:int=0) -> int:
+        """Offset just past the last complete entry, i.e. where the next entry will be written. hint is a known entry boundary."""
+        return self.read_complete_entries(handle, hint)[1]
+
+    def build_hour_index(self, handle) -> dict[str,int]:
+        """Builds {HH: offset of the first entry of that hour} for a file written without an hour index."""
+        raise NotImplementedError
+
+class XML_Backend(Log_Backend):
+    """The original XML format, byte for byte what ElementTree.write produced for the whole tree."""
+    name:str = "xml"
+    extension:str = ".xml"
+    first_entry_offset:int = len(LOGS_OPEN_TAG)
+    _ENTRY_START:bytes = b'<log timestamp="'
+    _ENTRY_END:bytes = b"</log>"
+
+    def encode(self, timestamp:datetime, status:str, message:str) -> bytes:
+        log_entry = ET.Element("log")
+        log_entry.set("timestamp", timestamp.strftime(TIMESTAMP_FORMAT))
+        log_entry.set("status", status)
+
+        message_element = ET.SubElement(log_entry, "message")
+        message_element.text = xml_sax_escape(message)
+        return ET.tostring(log_entry)
+
+    def append(self, log_file:str, data:bytes) -> tuple[int,bool]:
+        """Writes over the closing </logs> tag, so the cost only depends on the size of the new entries."""
+        try:
+            handle = open(log_file, "r+b")
+        except FileNotFoundError:
+            handle = open(log_file, "w+b")
+
+        with handle:
+            file_size:int = handle.seek(0, os.SEEK_END)
+            if file_size == 0:
+                write_position:int = 0
+                prefix:bytes = LOGS_OPEN_TAG
+            else:
+                # The closing tag is always within the last few bytes (allowing for trailing whitespace)
+                tail_start:int = max(0, file_size - _TAIL_READ_SIZE)
+                handle.seek(tail_start)
+                tail:bytes = handle.read()
+
+                close_index:int = tail.rfind(LOGS_CLOSE_TAG)
+                if close_index != -1:
+                    write_position:int = tail_start + close_index
+                    prefix:bytes = b""
+                else:
+                    # ElementTree writes a root without children as <logs />
+                    empty_index:int = tail.rfind(LOGS_EMPTY_TAG)
+                    if empty_index == -1:
+                        raise ValueError(f"{log_file} does not end with a </logs> tag and cannot be appended to.")
+                    write_position:int = tail_start + empty_index
+                    prefix:bytes = LOGS_OPEN_TAG
+
+            handle.seek(write_position)
+            handle.write(prefix + data + LOGS_CLOSE_TAG)
+            handle.truncate()
+        return write_position + len(prefix), file_size == 0
+
+    def iter_entries(self, handle, start_offset:int=0, end_offset:int|None=None) -> Iterator[dict[str,str]]:
+        """Uses iterparse and clears every entry once it is read so memory stays flat."""
+        root:ET.Element|None = None
+        for event, element in ET.iterparse(_XML_Region_Reader(handle, start_offset, end_offset), events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+            elif element.tag == "log":
+                yield self._record(element)
+                root.clear()
+
+    def read_complete_entries(self, handle, offset:int) -> tuple[list[dict[str,str]],int]:
+        """The closing </logs> tag is never consumed, it is where the next entry will be written."""
+        handle.seek(offset)
+        if offset == 0:
+            if handle.read(len(LOGS_OPEN_TAG)) == LOGS_OPEN_TAG:
+                offset = len(LOGS_OPEN_TAG)
+            else:
+                handle.seek(0)  # Empty <logs /> root or a file still being created
+
+        records:list[dict[str,str]] = []
+        pending:bytes = b""
+        while True:
+            chunk:bytes = handle.read(_READ_SIZE)
+            if not chunk:
+                break
+            pending += chunk
+            complete_length:int = pending.rfind(self._ENTRY_END)
+            if complete_length == -1:
+                continue
+            complete_length += len(self._ENTRY_END)
+            records.extend(self._record(element) for element in ET.fromstring(LOGS_OPEN_TAG + pending[:complete_length] + LOGS_CLOSE_TAG))
+            offset += complete_length
+            pending = pending[complete_length:]
+        return records, offset
+
+    def end_offset(self, handle, hint:int=0) -> int:
+        size:int = handle.seek(0, os.SEEK_END)
+        tail_start:int = max(hint, size - _READ_SIZE)
+        handle.seek(tail_start)
+        last_entry_end:int = handle.read().rfind(self._ENTRY_END)
+        if last_entry_end != -1:
+            return tail_start + last_entry_end + len(self._ENTRY_END)
+        if tail_start == 0:
+            return 0  # No entries yet
+        return self.read_complete_entries(handle, hint)[1]  # A single entry larger than the tail that was read
+
+    def build_hour_index(self, handle) -> dict[str,int]:
+        """Scans the bytes for entry start tags, nothing is parsed."""
+        hour_index:dict[str,int] = {}
+        match_length:int = len(self._ENTRY_START) + len("YYYY-MM-DD HH")
+        offset:int = 0
+        carry:bytes = b""
+        while True:
+            chunk:bytes = handle.read(1024 * 1024)
+            if not chunk:
+                break
+            data:bytes = carry + chunk
+            data_offset:int = offset - len(carry)
+            position:int = data.find(self._ENTRY_START)
+            while (position != -1) and (position + match_length <= len(data)):
+                hour:str = data[position + match_length - 2:position + match_length].decode("ascii", errors="ignore")
+                hour_index.setdefault(hour, data_offset + position)
+                position = data.find(self._ENTRY_START, position + 1)
+            # Keep enough bytes for a start tag split across two chunks
+            carry = data[position:] if position != -1 else data[-match_length:]
+            offset += len(chunk)
+        return hour_index
+
+    def _record(self, element:ET.Element) -> dict[str,str]:
+        return {
+                "timestamp": element.get("timestamp", ""),
+                "status": element.get("status", ""),
+                # Messages are escaped before ElementTree escapes them again
+                "message": xml_sax_unescape(element.findtext("message", default=""))
+               }
+
+class _XML_Region_Reader:
+    """
+    File-like object serving the bytes [start, end) of an XML log. A region starting after the <logs> tag is
+    given its own <logs> and </logs> so that iterparse always sees a complete document.
+    """
+    def __init__(self, handle, start:int, end:int|None):
+        handle.seek(start)
+        self._handle = handle
+        self._remaining:int|None = None if end is None else max(0, end - start)
+        self._prefix:bytes = b"" if start == 0 else LOGS_OPEN_TAG
+        self._suffix:bytes = b"" if end is None else LOGS_CLOSE_TAG
+
+    def read(self, size:int=-1) -> bytes:
+        if self._prefix:
+            data, self._prefix = self._prefix, b""
+            return data
+        if self._remaining != 0:
+            size = _READ_SIZE if size < 0 else size
+            if self._remaining is not None:
+                size = min(size, self._remaining)
+            data:bytes = self._handle.read(size)
+            if data:
+                if self._remaining is not None:
+                    self._remaining -= len(data)
+                return data
+            self._remaining = 0
+        data, self._suffix = self._suffix, b""
+        return data
+
+class JSONL_Backend(Log_Backend):
+    """One JSON object per line with short keys: {"t": timestamp, "s": status, "m": message}. Messages are stored unescaped."""
+    name:str = "jsonl"
+    extension:str = ".jsonl"
+
+    def encode(self, timestamp:datetime, status:str, message:str) -> bytes:
+        return json.dumps({"t": timestamp.strftime(TIMESTAMP_FORMAT), "s": status, "m": message}, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def iter_entries(self, handle, start_offset:int=0, end_offset:int|None=None) -> Iterator[dict[str,str]]:
+        handle.seek(start_offset)
+        offset:int = start_offset
+        for line in handle:
+            if (end_offset is not None) and (offset >= end_offset):
+                return
+            offset += len(line)
+            if line.endswith(b"\n"):
+                yield self._record(line)
+
+    def read_complete_entries(self, handle, offset:int) -> tuple[list[dict[str,str]],int]:
+        handle.seek(offset)
+        records:list[dict[str,str]] = []
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break  # Still being written
+            records.append(self._record(line))
+            offset += len(line)
+        return records, offset
+
+    def end_offset(self, handle, hint:int=0) -> int:
+        size:int = handle.seek(0, os.SEEK_END)
+        tail_start:int = max(hint, size - _READ_SIZE)
+        handle.seek(tail_start)
+        last_line_end:int = handle.read().rfind(b"\n")
+        if last_line_end != -1:
+            return tail_start + last_line_end + 1
+        return hint if tail_start == hint else self.read_complete_entries(handle, hint)[1]
+
+    def build_hour_index(self, handle) -> dict[str,int]:
+        hour_index:dict[str,int] = {}
+        offset:int = 0
+        for line in handle:
+            if line.endswith(b"\n"):
+                hour_index.setdefault(self._record(line)["timestamp"][11:13], offset)
+            offset += len(line)
+        return hour_index
+
+    def _record(self, line:bytes) -> dict[str,str]:
+        entry:dict[str,str] = json.loads(line)
+        return {"timestamp": entry["t"], "status": entry["s"], "message": entry["m"]}
+
+class Binary_Backend(Log_Backend):
+    """
+    Length-prefixed frames: a little-endian header (message length uint32, microseconds since 1970-01-01 in local
+    time int64, status length uint8) followed by the UTF-8 status and message.
+    """
+    name:str = "binary"
+    extension:str = ".bin"
+    _HEADER:struct.Struct = struct.Struct("<IqB")
+    _EPOCH:datetime = datetime(1970, 1, 1)
+
+    def encode(self, timestamp:datetime, status:str, message:str) -> bytes:
+        status_bytes:bytes = status.encode("utf-8")
+        message_bytes:bytes = message.encode("utf-8")
+        microseconds:int = (timestamp - self._EPOCH) // timedelta(microseconds=1)
+        return self._HEADER.pack(len(message_bytes), microseconds, len(status_bytes)) + status_bytes + message_bytes
+
+    def iter_entries(self, handle, start_offset:int=0, end_offset:int|None=None) -> Iterator[dict[str,str]]:
+        for _, record in self._iter_frames(handle, start_offset, end_offset):
+            yield record
+
+    def read_complete_entries(self, handle, offset:int) -> tuple[list[dict[str,str]],int]:
+        records:list[dict[str,str]] = []
+        for offset, record in self._iter_frames(handle, offset, None):
+            records.append(record)
+        return records, offset
+
+    def end_offset(self, handle, hint:int=0) -> int:
+        """Frames can only be walked from a known boundary, the hour index gives one close to the end. Only headers are read."""
+        size:int = handle.seek(0, os.SEEK_END)
+        offset:int = hint
+        while offset + self._HEADER.size <= size:
+            handle.seek(offset)
+            message_length, _, status_length = self._HEADER.unpack(handle.read(self._HEADER.size))
+            next_offset:int = offset + self._HEADER.size + status_length + message_length
+            if next_offset > size:
+                break  # Still being written
+            offset = next_offset
+        return offset
+
+    def build_hour_index(self, handle) -> dict[str,int]:
+        hour_index:dict[str,int] = {}
+        offset:int = 0
+        for next_offset, record in self._iter_frames(handle, 0, None):
+            hour_index.setdefault(record["timestamp"][11:13], offset)
+            offset = next_offset
+        return hour_index
+
+    def _iter_frames(self, handle, offset:int, end_offset:int|None) -> Iterator[tuple[int,dict[str,str]]]:
+        """Yields (offset after the frame, record) for every complete frame. A partly written frame ends the iteration."""
+        handle.seek(offset)
+        while (end_offset is None) or (offset < end_offset):
+            header:bytes = handle.read(self._HEADER.size)
+            if len(header) < self._HEADER.size:
+                return
+            message_length, microseconds, status_length = self._HEADER.unpack(header)
+            payload:bytes = handle.read(status_length + message_length)
+            if len(payload) < status_length + message_length:
+                return
+            offset += self._HEADER.size + len(payload)
+            yield offset, {
+                            "timestamp": (self._EPOCH + timedelta(microseconds=microseconds)).strftime(TIMESTAMP_FORMAT),
+                            "status": payload[:status_length].decode("utf-8"),
+                            "message": payload[status_length:].decode("utf-8")
+                          }
+
+LOG_BACKENDS:dict[str,type[Log_Backend]] = {backend.name: backend for backend in (XML_Backend, JSONL_Backend, Binary_Backend)}
+
+def get_backend(name:str) -> Log_Backend:
+    """Returns the backend for a Logger_Backend configuration value ("xml", "jsonl" or "binary")."""
+    try:
+        return LOG_BACKENDS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown log backend {name!r}, expected one of {sorted(LOG_BACKENDS)}.") from None
+
+def get_backend_for_path(path:str) -> Log_Backend:
+    """Infers the backend from a current or archived log file name (log_20240101.jsonl.gz -> jsonl)."""
+    for extension in ARCHIVE_EXTENSIONS.values():
+        if extension and path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+    for backend in LOG_BACKENDS.values():
+        if path.endswith(backend.extension):
+            return backend()
+    raise ValueError(f"Cannot tell the log backend of {path}.")
+
+def convert_log(source_path:str, destination_path:str, destination_backend:Log_Backend|None=None, batch_size:int=1000) -> int:
+    """
+    Streams every entry of a current or archived log into a new file in another format (the original XML by default).
+    Returns the number of entries converted.
+    """
+    source_backend:Log_Backend = get_backend_for_path(source_path)
+    destination_backend = XML_Backend() if destination_backend is None else destination_backend
+    if os.path.exists(destination_path):
+        raise FileExistsError(f"{destination_path} already exists.")
+
+    converted:int = 0
+    batch:list[bytes] = []
+    with open_archive(source_path, "rb") as handle:
+        for record in source_backend.iter_entries(handle):
+            batch.append(destination_backend.encode(datetime.fromisoformat(record["timestamp"]), record["status"], record["message"]))
+            if len(batch) >= batch_size:
+                destination_backend.append(destination_path, b"".join(batch))
+                converted += len(batch)
+                batch.clear()
+    if batch or (converted == 0):
+        destination_backend.append(destination_path, b"".join(batch))
+        converted += len(batch)
+    return converted
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a log written by any backend into another format.")
+    parser.add_argument("source", help="Current or archived log file (.xml, .jsonl or .bin, optionally .gz/.zst)")
+    parser.add_argument("destination", help="File to create")
+    parser.add_argument("--to", default="xml", choices=sorted(LOG_BACKENDS), help="Format of the destination (default: xml)")
+    args = parser.parse_args()
+    converted:int = convert_log(args.source, args.destination, destination_backend=get_backend(args.to))
+    print(f"Converted {converted:,} entries from {args.source} to {args.destination}.")
+
+if __name__ == "__main__":
+    main()
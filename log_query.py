@@ -0,0 +1,165 @@
+"""
+Read side of the logs written by XML_Logger. Entries are streamed by the log backend (iterparse for XML, clearing
+every entry once it is read) so memory stays flat, and the hour index kept next to every log file is used to seek
+straight to the hours a query needs instead of scanning each file from the top.
+"""
+import os
+from time import sleep
+from typing import Callable, Iterable, Iterator
+from datetime import date, datetime, timedelta
+from log_backends import ARCHIVE_EXTENSIONS, TIMESTAMP_FORMAT, Log_Backend, get_backend_for_path, open_gzip_member
+from xml_logging import XML_Logger, open_archive, index_path_for, read_hour_index, read_member_offsets, write_hour_index
+
+def iter_log_entries(path:str, start_offset:int=0, end_offset:int|None=None, backend:Log_Backend|None=None) -> Iterator[dict[str,str]]:
+    """
+    Streams the entries of a current or archived log file between two byte offsets as
+    {"timestamp", "status", "message"} dictionaries. Offsets must be entry boundaries, such as those of the hour index.
+    The backend is inferred from the file name when it is not given.
+
+    gzip archives written one member per hour are decompressed from the member holding start_offset. Other
+    compressed archives (zstd, or gzip archived before members were indexed) are decompressed from the top, so
+    there the index saves parsing but not decompression.
+    """
+    backend = get_backend_for_path(path) if backend is None else backend
+    member_offsets:dict[int,int] = read_member_offsets(index_path_for(path)) if (start_offset > 0) and path.endswith(ARCHIVE_EXTENSIONS["gzip"]) else {}
+    member_starts:list[int] = [offset for offset in member_offsets if offset <= start_offset]
+    if member_starts:
+        handle = open_gzip_member(path, max(member_starts), member_offsets[max(member_starts)])
+    else:
+        handle = open_archive(path, "rb")
+    with handle:
+        yield from backend.iter_entries(handle, start_offset, end_offset)
+
+def build_hour_index(path:str, backend:Log_Backend|None=None) -> dict[str,int]:
+    """Builds the hour index of a log file written without one."""
+    backend = get_backend_for_path(path) if backend is None else backend
+    with open_archive(path, "rb") as handle:
+        return backend.build_hour_index(handle)
+
+def load_hour_index(path:str, persist:bool=False, backend:Log_Backend|None=None) -> dict[str,int]:
+    """Reads the hour index of a log file, building it by a scan when it is missing (and saving it when persist is True)."""
+    index_path:str = index_path_for(path)
+    hour_index:dict[str,int] = read_hour_index(index_path)
+    if hour_index:
+        return hour_index
+
+    hour_index = build_hour_index(path, backend=backend)
+    if persist and hour_index:
+        write_hour_index(index_path, hour_index)
+    return hour_index
+
+def hour_region(hour_index:dict[str,int], start_hour:str|None=None, end_hour:str|None=None) -> tuple[int,int|None]:
+    """
+    Byte region holding the entries from start_hour to end_hour (both HH, None meaning the start or end of the file).
+    The region ends one indexed hour late so entries stamped just before an hour boundary but written after it are kept.
+    """
+    hours:list[str] = sorted(hour_index)
+    start_offset:int = 0
+    if start_hour is not None:
+        earlier_hours:list[str] = [hour for hour in hours if hour <= start_hour]
+        if earlier_hours:
+            start_offset = hour_index[earlier_hours[-1]]
+
+    end_offset:int|None = None
+    if end_hour is not None:
+        later_hours:list[str] = [hour for hour in hours if hour > end_hour]
+        if len(later_hours) > 1:
+            end_offset = max(start_offset, hour_index[later_hours[1]])
+    return start_offset, end_offset
+
+def get_log_path_for_day(logger:XML_Logger, day:date, manifest:dict[str,str]|None=None) -> str|None:
+    """Path of the log of a day, whether it is still in base_dir or has been archived. None if there are no logs for that day."""
+    day_str:str = day.strftime("%Y%m%d")
+    current_path:str = logger.get_dated_log_filename(basepath=logger.base_dir, day=day_str)
+    if os.path.exists(current_path):
+        return current_path
+
+    manifest = logger.load_manifest() if manifest is None else manifest
+    if day_str in manifest:
+        archive_path:str = os.path.join(logger.get_archive_directory(), manifest[day_str])
+        if os.path.exists(archive_path):
+            return archive_path
+    return None
+
+def query_logs(logger:XML_Logger, start:datetime, end:datetime, status:str|Iterable[str]|None=None) -> Iterator[dict[str,str]]:
+    """
+    Yields, oldest first, the entries logged between start and end (inclusive) by logger, across the dated log
+    in base_dir and the archived days. status limits the results to one status or a collection of statuses.
+
+        >>> for entry in query_logs(logger, datetime(2024, 5, 7, 14, 0), datetime(2024, 5, 7, 15, 30), status="ERROR"):
+        ...     print(entry["timestamp"], entry["message"])
+    """
+    statuses:set[str]|None = None if status is None else {status} if isinstance(status, str) else set(status)
+    # Timestamps are fixed width so they compare correctly as strings, no per entry strptime is needed
+    start_timestamp:str = start.strftime(TIMESTAMP_FORMAT)
+    end_timestamp:str = end.strftime(TIMESTAMP_FORMAT)
+    manifest:dict[str,str] = logger.load_manifest()
+
+    day:date = start.date()
+    while day <= end.date():
+        path:str|None = get_log_path_for_day(logger, day, manifest)
+        day_is_archived:bool = (path is not None) and (os.path.dirname(os.path.abspath(path)) == os.path.abspath(logger.get_archive_directory()))
+        if path is not None:
+            start_offset, end_offset = hour_region(
+                                                    load_hour_index(path, persist=day_is_archived, backend=logger.backend),
+                                                    start_hour=start.strftime("%H") if day == start.date() else None,
+                                                    end_hour=end.strftime("%H") if day == end.date() else None
+                                                  )
+            for entry in iter_log_entries(path, start_offset, end_offset, backend=logger.backend):
+                if not (start_timestamp <= entry["timestamp"] <= end_timestamp):
+                    continue
+                if (statuses is None) or (entry["status"] in statuses):
+                    yield entry
+        day += timedelta(days=1)
+
+def follow(logger:XML_Logger, poll_interval:float=1.0, from_start:bool=False, stop:Callable[[],bool]|None=None) -> Iterator[dict[str,str]]:
+    """
+    Yields entries as they are appended to the active log of logger, like tail -f. Only the bytes written since
+    the previous poll are read, so a poll costs one stat plus I/O proportional to the new data.
+    When the day changes, whatever is left in the previous day's file is read (from the archive if it was already
+    rotated) before moving on to the new file. Runs until stop() returns True, or forever if stop is None.
+    """
+    path:str = logger.get_current_log_filename(basepath=logger.base_dir)
+    offset:int = 0
+    if not from_start:
+        try:
+            with open(path, "rb") as handle:
+                offset = logger.backend.end_offset(handle, hint=max(read_hour_index(index_path_for(path)).values(), default=0))
+        except FileNotFoundError:
+            pass
+
+    while (stop is None) or (not stop()):
+        try:
+            size:int|None = os.stat(path).st_size
+        except FileNotFoundError:
+            size:int|None = None
+
+        if (size is not None) and (size < offset):
+            offset = 0  # The file was replaced, start over
+        if (size is not None) and (size > offset):
+            with open(path, "rb") as handle:
+                records, offset = logger.backend.read_complete_entries(handle, offset)
+            yield from records
+
+        current_path:str = logger.get_current_log_filename(basepath=logger.base_dir)
+        if (current_path != path) and ((size is None) or os.path.exists(current_path)):
+            # Writers only start today's file once yesterday's entries are written, so yesterday is complete
+            yield from _drain_previous_day(logger, path, offset)
+            path, offset = current_path, 0
+            continue
+
+        sleep(poll_interval)
+
+def _drain_previous_day(logger:XML_Logger, path:str, offset:int) -> list[dict[str,str]]:
+    """Reads what is left after offset in a previous day's log, looking in the archive if it has been rotated."""
+    if not os.path.exists(path):
+        day:str = os.path.basename(path)[len(f"{logger.log_file}_"):-len(logger.backend.extension)]
+        archived:str|None = logger.load_manifest().get(day)
+        if archived is None:
+            return []
+        path = os.path.join(logger.get_archive_directory(), archived)
+    try:
+        with open_archive(path, "rb") as handle:
+            return logger.backend.read_complete_entries(handle, offset)[0]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,196 @@
+"""
+Timers, counters and histograms for the phases of a session (configuration loading, Tk dialogs, SMTP, logger
+writes and rotation). Off by default: timed() then hands back a shared do-nothing context manager and increment()
+returns straight away, so instrumented code pays one global check. When enabled (Metrics_Enabled in the
+configuration or AUTOLOGOFF_METRICS=1) the metrics of the session are written to one JSON or Prometheus text file
+under the logger's base directory, ready to be collected across the fleet.
+"""
+import os
+import json
+import platform
+import threading
+import functools
+from time import perf_counter
+from datetime import datetime
+from typing import Any, Callable, Mapping
+
+# Upper bounds in seconds, as in Prometheus' default histogram buckets
+BUCKETS:tuple[float,...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX:str = "autologoff"
+
+_enabled:bool = False
+_lock:threading.Lock = threading.Lock()
+_counters:dict[str,float] = {}
+_histograms:dict[str,"Histogram"] = {}
+_session_started:datetime = datetime.now()
+
+class Histogram:
+    __slots__ = ("bucket_counts", "count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.bucket_counts:list[int] = [0] * len(BUCKETS)
+        self.count:int = 0
+        self.total:float = 0.0
+        self.minimum:float = float("inf")
+        self.maximum:float = 0.0
+
+    def observe(self, value:float) -> None:
+        for position, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.bucket_counts[position] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def cumulative_buckets(self) -> list[tuple[str,int]]:
+        """(upper bound, observations at or below it) ending with +Inf, as Prometheus expects."""
+        buckets:list[tuple[str,int]] = []
+        running:int = 0
+        for bound, bucket_count in zip(BUCKETS, self.bucket_counts):
+            running += bucket_count
+            buckets.append((repr(bound), running))
+        buckets.append(("+Inf", self.count))
+        return buckets
+
+class _Null_Timer:
+    """What timed() returns while metrics are off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER:_Null_Timer = _Null_Timer()
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name:str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        observe(self.name, perf_counter() - self.started)
+        if exc_type is not None:
+            increment(f"{self.name}_errors")
+        return False
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def configure(configuration:Mapping[str,Any]|None) -> bool:
+    """Turns metrics on when the configuration has Metrics_Enabled or AUTOLOGOFF_METRICS is set. Returns whether they are on."""
+    if os.getenv("AUTOLOGOFF_METRICS", "").lower() in ("1", "true", "yes") or ((configuration is not None) and configuration.get("Metrics_Enabled", False)):
+        enable()
+    return _enabled
+
+def reset() -> None:
+    global _session_started
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _session_started = datetime.now()
+
+def timed(name:str):
+    """with timed("smtp_connect"): ... records the duration of the block in seconds. An exception also counts name_errors."""
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+def timed_calls(name:str) -> Callable:
+    """Decorator form of timed(). Whether metrics are on is checked at every call, not when decorating."""
+    def decorate(function:Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def increment(name:str, amount:float=1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def observe(name:str, value:float) -> None:
+    """Adds a value (a duration in seconds for the built-in timers) to the histogram name."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram:Histogram|None = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value)
+
+def snapshot() -> dict[str,Any]:
+    """Everything recorded so far as plain data."""
+    with _lock:
+        return {
+                    "machine": platform.node(),
+                    "pid": os.getpid(),
+                    "session_started": _session_started.isoformat(timespec="seconds"),
+                    "written": datetime.now().isoformat(timespec="seconds"),
+                    "counters": dict(_counters),
+                    "histograms": {
+                                        name: {
+                                                    "count": histogram.count,
+                                                    "sum": histogram.total,
+                                                    "min": histogram.minimum if histogram.count else None,
+                                                    "max": histogram.maximum if histogram.count else None,
+                                                    "mean": histogram.total / histogram.count if histogram.count else None,
+                                                    "buckets": dict(histogram.cumulative_buckets())
+                                              }
+                                        for name, histogram in _histograms.items()
+                                  }
+               }
+
+def to_prometheus(data:dict[str,Any]) -> str:
+    """Prometheus text exposition of a snapshot(), labelled with the machine and session start."""
+    labels:str = f'machine="{data["machine"]}",session="{data["session_started"]}"'
+    lines:list[str] = []
+    for name, value in sorted(data["counters"].items()):
+        metric:str = f"{METRIC_PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric}{{{labels}}} {value}"]
+    for name, histogram in sorted(data["histograms"].items()):
+        metric = f"{METRIC_PREFIX}_{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        lines += [f'{metric}_bucket{{{labels},le="{bound}"}} {bucket_count}' for bound, bucket_count in histogram["buckets"].items()]
+        lines += [f"{metric}_sum{{{labels}}} {histogram['sum']}", f"{metric}_count{{{labels}}} {histogram['count']}"]
+    return "\n".join(lines) + "\n"
+
+def dump(path:str, metrics_format:str="json") -> str:
+    """Writes snapshot() to path as "json" or "prometheus" text, through a temporary file. Returns path."""
+    data:dict[str,Any] = snapshot()
+    text:str = to_prometheus(data) if metrics_format == "prometheus" else json.dumps(data, indent=4)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(text)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def write_session_metrics(base_dir:str, configuration:Mapping[str,Any]) -> str|None:
+    """
+    Writes this session's metrics to base_dir/Metrics_Folder/<machine>_<session start>_<pid>.json (or .prom with
+    Metrics_Format "prometheus"). Does nothing and returns None while metrics are off.
+    """
+    if not _enabled:
+        return None
+    metrics_format:str = configuration.get("Metrics_Format", "json")
+    filename:str = f"{platform.node()}_{_session_started:%Y%m%d_%H%M%S}_{os.getpid()}{'.prom' if metrics_format == 'prometheus' else '.json'}"
+    return dump(os.path.join(base_dir, configuration.get("Metrics_Folder", "metrics"), filename), metrics_format)
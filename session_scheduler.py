@@ -0,0 +1,130 @@
+"""
+Deadline scheduling for logoff sessions. Events are kept in a heap ordered by their deadline on a monotonic clock,
+so the program only wakes up for the events that matter (the minute heartbeat, the logoff warning and the logoff
+itself) and changes to the system clock never move the logoff time.
+"""
+import heapq
+import itertools
+import traceback
+from time import monotonic, sleep
+from typing import Any, Callable
+
+class Scheduled_Event:
+    """Handle returned by Deadline_Scheduler.schedule_at, pass it to cancel() to drop the event."""
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline:float, callback:Callable[...,Any], args:tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled:bool = False
+
+class Deadline_Scheduler:
+    def __init__(self, clock:Callable[[],float]=monotonic):
+        """clock must never go backwards, time.monotonic by default. Benchmarks pass a fake clock."""
+        self.clock = clock
+        self._heap:list[tuple[float,int,Scheduled_Event]] = []
+        self._sequence = itertools.count()  # Keeps events with the same deadline in the order they were scheduled
+        self._cancelled:int = 0
+
+    def schedule_at(self, deadline:float, callback:Callable[...,Any], *args) -> Scheduled_Event:
+        """Runs callback(*args) once the clock reaches deadline. O(log n)."""
+        event:Scheduled_Event = Scheduled_Event(deadline, callback, args)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), event))
+        return event
+
+    def schedule_in(self, delay:float, callback:Callable[...,Any], *args) -> Scheduled_Event:
+        """Runs callback(*args) delay seconds from now."""
+        return self.schedule_at(self.clock() + delay, callback, *args)
+
+    def cancel(self, event:Scheduled_Event) -> None:
+        """Cancelled events stay in the heap until they reach the top, which keeps cancelling O(1)."""
+        if not event.cancelled:
+            event.cancelled = True
+            self._cancelled += 1
+
+    def next_deadline(self) -> float|None:
+        """Deadline of the earliest pending event, None when nothing is scheduled."""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0][0] if self._heap else None
+
+    def time_until_next(self) -> float|None:
+        """Seconds until the earliest pending event (0 if it is already due), None when nothing is scheduled."""
+        deadline:float|None = self.next_deadline()
+        return None if deadline is None else max(0.0, deadline - self.clock())
+
+    def run_due(self) -> int:
+        """Runs every event whose deadline has passed, including events they schedule that are already due. Returns how many ran."""
+        ran:int = 0
+        while True:
+            deadline:float|None = self.next_deadline()
+            if (deadline is None) or (deadline > self.clock()):
+                return ran
+            event:Scheduled_Event = heapq.heappop(self._heap)[2]
+            event.callback(*event.args)
+            ran += 1
+
+    def run(self, wait:Callable[[float],Any]=sleep) -> None:
+        """Blocks until every event has run, sleeping with wait(seconds) until each deadline. Used where no event loop exists."""
+        while True:
+            delay:float|None = self.time_until_next()
+            if delay is None:
+                return
+            if delay > 0:
+                wait(delay)
+            self.run_due()
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._cancelled
+
+def run_in_tk(scheduler:Deadline_Scheduler, root) -> None:
+    """
+    Runs the scheduler inside root.mainloop(), arming a single root.after() timer for the next deadline so Tk only
+    wakes up when something is due while still serving popups in between. Returns once every event has run. If the
+    window is destroyed along the way the remaining events run on a plain blocking wait instead.
+    """
+    def wake() -> None:
+        try:
+            scheduler.run_due()
+        finally:
+            delay:float|None = scheduler.time_until_next()
+            try:
+                if delay is None:
+                    root.quit()
+                else:
+                    # Tk timers follow the wall clock, re-reading the monotonic clock on every wake corrects any drift
+                    root.after(max(1, int(delay * 1000) + 1), wake)
+            except Exception:
+                pass  # root destroyed, mainloop has returned and the blocking wait below takes over
+
+    try:
+        root.after(0, wake)
+        root.mainloop()
+    except Exception:
+        traceback.print_exc()
+    scheduler.run()
+
+def schedule_session(scheduler:Deadline_Scheduler, end_deadline:float, on_heartbeat:Callable[[float],Any],
+                     on_end:Callable[[],Any]|None=None, warning_seconds:float|None=None, on_warning:Callable[[float],Any]|None=None,
+                     heartbeat_interval:float=60) -> None:
+    """
+    Schedules the events of one session ending at end_deadline (on the scheduler's clock):
+        on_heartbeat(seconds_left) now and every heartbeat_interval seconds until the end
+        on_warning(seconds_left) once, warning_seconds before the end (right away if that moment has already passed)
+        on_end() at the end
+    """
+    def heartbeat(deadline:float) -> None:
+        on_heartbeat(end_deadline - scheduler.clock())
+        next_deadline:float = deadline + heartbeat_interval
+        if next_deadline < end_deadline:
+            scheduler.schedule_at(next_deadline, heartbeat, next_deadline)
+
+    now:float = scheduler.clock()
+    if now < end_deadline:
+        scheduler.schedule_at(now, heartbeat, now)
+    if (warning_seconds is not None) and (on_warning is not None) and (now < end_deadline):
+        # A session no longer than the warning is warned at once, a 5 minute session with a 5 minute warning included
+        scheduler.schedule_at(max(now, end_deadline - warning_seconds), lambda: on_warning(end_deadline - scheduler.clock()))
+    scheduler.schedule_at(end_deadline, on_end if on_end is not None else (lambda: None))
@@ -0,0 +1,6 @@
+import os
+import sys
+
+REPO_ROOT:str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,109 @@
+import os
+import time
+import smtplib
+import threading
+from xml_logging import XML_Logger
+from email_outbox import Email_Outbox
+
+CONFIGURATION:dict = {
+                        "SMTP_SSL_Host": "smtp.example.com",
+                        "SMTP_SSL_Port": 465,
+                        "Sender_Email": "sender@example.com",
+                        "Sender_Email_Password": "password",
+                        "To_Email": "to@example.com",
+                        "CC_Email": "cc@example.com"
+                     }
+
+class Fake_SMTP:
+    """Records the subject of every message sent. refuse maps a subject to the error its sendmail raises."""
+    sent:list[str] = []
+    refuse:dict[str,Exception] = {}
+    connections_to_fail:int = 0
+    lock:threading.Lock = threading.Lock()
+
+    def __init__(self, host:str, port:int, timeout:float|None=None):
+        with Fake_SMTP.lock:
+            if Fake_SMTP.connections_to_fail > 0:
+                Fake_SMTP.connections_to_fail -= 1
+                raise OSError("Connection refused")
+
+    def login(self, user:str, password:str) -> None:
+        pass
+
+    def noop(self) -> tuple[int,bytes]:
+        return (250, b"OK")
+
+    def sendmail(self, sender:str, recipients:list[str], message:str) -> None:
+        subject:str = next(line for line in message.splitlines() if line.startswith("Subject: "))[len("Subject: "):]
+        if subject in Fake_SMTP.refuse:
+            raise Fake_SMTP.refuse[subject]
+        time.sleep(0.005)  # Leaves the other sender time to pick the same receipt
+        with Fake_SMTP.lock:
+            Fake_SMTP.sent.append(subject)
+
+    def quit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def _fake_smtp() -> type[Fake_SMTP]:
+    Fake_SMTP.sent, Fake_SMTP.refuse, Fake_SMTP.connections_to_fail = [], {}, 0
+    return Fake_SMTP
+
+def _log_entries(logger:XML_Logger, status:str) -> list[str]:
+    logger.flush()
+    with open(logger.get_current_log_filename(logger.base_dir), "r", encoding="utf-8") as log_file:
+        return [entry for entry in log_file.read().split("<log ")[1:] if f'status="{status}"' in entry]
+
+def test_outboxes_sharing_a_spool_send_every_receipt_once(tmp_path):
+    smtp = _fake_smtp()
+    logger = XML_Logger(log_file="outbox", base_dir=str(tmp_path), asynchronous=False)
+    spool = str(tmp_path / "outbox")
+    outboxes = [Email_Outbox(CONFIGURATION, logger, spool, smtp_factory=smtp, max_batch=3, retry_delays=(0.05,)) for _ in range(2)]
+    for number in range(20):
+        outboxes[0].enqueue(subject=f"receipt {number}", body="body")
+    for outbox in outboxes:
+        outbox.start()
+    for outbox in outboxes:
+        outbox.close(timeout=10)
+    assert sorted(smtp.sent) == sorted(f"receipt {number}" for number in range(20))
+    assert os.listdir(spool) == []
+    assert _log_entries(logger, "ERROR") == []
+    logger.close()
+
+def test_permanently_refused_and_unreadable_receipts_are_dead_lettered(tmp_path):
+    smtp = _fake_smtp()
+    smtp.refuse["refused"] = smtplib.SMTPRecipientsRefused({"to@example.com": (550, b"No such user")})
+    smtp.refuse["rejected"] = smtplib.SMTPDataError(554, b"Message rejected")
+    logger = XML_Logger(log_file="outbox", base_dir=str(tmp_path), asynchronous=False)
+    outbox = Email_Outbox(CONFIGURATION, logger, str(tmp_path / "outbox"), smtp_factory=smtp, retry_delays=(0.05,))
+    outbox.enqueue(subject="refused", body="body")
+    junk:str = outbox.enqueue(subject="junk", body="body")
+    with open(os.path.join(outbox.spool_directory, junk), "w", encoding="utf-8") as spool_file:
+        spool_file.write("{not json")
+    outbox.enqueue(subject="rejected", body="body")
+    outbox.enqueue(subject="sent", body="body")
+    outbox.start()
+    assert outbox.close(timeout=10)
+    assert smtp.sent == ["sent"]
+    assert len(os.listdir(outbox.dead_letter_directory)) == 3
+    assert len(_log_entries(logger, "ERROR")) == 3
+    logger.close()
+
+def test_each_receipt_failure_is_logged_once_however_many_retries(tmp_path):
+    smtp = _fake_smtp()
+    smtp.connections_to_fail = 3
+    logger = XML_Logger(log_file="outbox", base_dir=str(tmp_path), asynchronous=False)
+    outbox = Email_Outbox(CONFIGURATION, logger, str(tmp_path / "outbox"), smtp_factory=smtp, retry_delays=(0.01,))
+    outbox.enqueue(subject="first", body="body", session="LAB-01/alice")
+    outbox.enqueue(subject="second", body="body", session="LAB-02/bob")
+    outbox.start()
+    assert outbox.close(timeout=10)
+    errors:list[str] = _log_entries(logger, "ERROR")
+    assert len(errors) == 2
+    assert any("[LAB-01/alice] Email failed to send (receipt " in error for error in errors)
+    assert any("[LAB-02/bob] Email failed to send (receipt " in error for error in errors)
+    assert len(_log_entries(logger, "WARNING")) == 3
+    assert len(_log_entries(logger, "SUCCESS")) == 2
+    logger.close()
@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import subprocess
+from conftest import REPO_ROOT
+
+def _write_configuration(directory) -> str:
+    configuration:dict = {
+                            "Logger_Base_Directory": str(directory / "logs"),
+                            "Logger_Filename": "fleet",
+                            "Logger_Archive_Folder": "archive",
+                            "Logger_Asynchronous": False,
+                            "SMTP_SSL_Host": "127.0.0.1",
+                            "SMTP_SSL_Port": 1,
+                            "SMTP_Use_SSL": False,
+                            "Sender_Email": "sender@example.com",
+                            "Sender_Email_Password": "password",
+                            "To_Email": "to@example.com",
+                            "CC_Email": "cc@example.com",
+                            "Warn_User_Of_Logoff": False,
+                            "Logoff_Warning_Time_Left": 1,
+                            "DEBUG": True,
+                            "Email_Outbox_Grace_Seconds": 0
+                         }
+    os.makedirs(configuration["Logger_Base_Directory"])
+    path = directory / "Config.json"
+    path.write_text(json.dumps(configuration), encoding="utf-8")
+    return str(path)
+
+def test_executor_named_on_the_command_line_runs_as_main(tmp_path):
+    """Run as a script, fleet_controller is __main__: the executor it imports must still be a Logoff_Executor."""
+    sessions = tmp_path / "sessions.json"
+    # Another machine, so Logoff_Computer_Executor refuses it instead of logging off the computer running the test
+    sessions.write_text(json.dumps([{"machine": "not-this-computer", "user": "student", "minutes": 0}]), encoding="utf-8")
+    completed = subprocess.run([sys.executable, os.path.join(REPO_ROOT, "fleet_controller.py"), "--sessions", str(sessions),
+                                "--config", _write_configuration(tmp_path), "--executor", "fleet_controller:Logoff_Computer_Executor"],
+                               cwd=REPO_ROOT, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    log:str = "".join(path.read_text(encoding="utf-8") for path in (tmp_path / "logs").glob("fleet_*.xml"))
+    assert "could not be loaded" not in log
+    assert "is not this computer" in log
@@ -0,0 +1,22 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from xml_logging import XML_Logger, index_path_for, read_member_offsets, write_hour_index
+from log_query import query_logs, iter_log_entries
+
+@pytest.mark.parametrize("backend", ["xml", "jsonl", "binary"])
+def test_query_of_a_gzip_archive_reads_from_the_hour_member(tmp_path, backend):
+    logger = XML_Logger(log_file="log", base_dir=str(tmp_path), asynchronous=False, backend=backend, archive_compression="gzip")
+    day = datetime(2024, 5, 7)
+    path = logger.get_dated_log_filename(basepath=logger.base_dir, day="20240507")
+    logger.backend.append(path, b"".join(logger.backend.encode(day + timedelta(minutes=minute), "INFO", f"entry {minute}") for minute in range(24 * 60)))
+    with open(path, "rb") as log_file:
+        write_hour_index(index_path_for(path), logger.backend.build_hour_index(log_file))
+    assert logger._archive_day("20240507")
+
+    archive_path:str = os.path.join(logger.get_archive_directory(), logger.load_manifest()["20240507"])
+    assert len(read_member_offsets(index_path_for(archive_path))) == 24  # One member per hour
+    assert len(list(iter_log_entries(archive_path, backend=logger.backend))) == 24 * 60
+    entries = list(query_logs(logger, datetime(2024, 5, 7, 14, 30), datetime(2024, 5, 7, 15, 29)))
+    assert [entry["message"] for entry in entries] == [f"entry {minute}" for minute in range(14 * 60 + 30, 15 * 60 + 30)]
+    logger.close()
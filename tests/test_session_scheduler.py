@@ -0,0 +1,34 @@
+from session_scheduler import Deadline_Scheduler, schedule_session
+
+class Fake_Clock:
+    def __init__(self, now:float=1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds:float) -> None:
+        self.now += seconds
+
+def _run_session(minutes:float, warning_minutes:float, elapsed_before_scheduling:float=0.0) -> tuple[list[float],list[float]]:
+    """Seconds left at every warning and at every heartbeat of one session, run on a fake clock."""
+    clock:Fake_Clock = Fake_Clock()
+    scheduler:Deadline_Scheduler = Deadline_Scheduler(clock=clock)
+    end_deadline:float = clock() + minutes * 60
+    clock.now += elapsed_before_scheduling  # The end is computed a moment before the session is scheduled
+    warnings:list[float] = []
+    heartbeats:list[float] = []
+    schedule_session(scheduler, end_deadline, on_heartbeat=heartbeats.append, warning_seconds=warning_minutes * 60, on_warning=warnings.append)
+    scheduler.run(wait=clock.sleep)
+    return warnings, heartbeats
+
+def test_warning_is_given_when_the_session_is_as_long_as_the_warning():
+    warnings, _ = _run_session(minutes=5, warning_minutes=5)
+    assert warnings == [300.0]
+    warnings, _ = _run_session(minutes=5, warning_minutes=5, elapsed_before_scheduling=0.001)
+    assert len(warnings) == 1 and round(warnings[0] / 60) == 5
+
+def test_warning_is_given_once_before_the_end():
+    warnings, heartbeats = _run_session(minutes=30, warning_minutes=5)
+    assert warnings == [300.0]
+    assert len(heartbeats) == 30
@@ -0,0 +1,459 @@
+"""
+Usage report over the logs of many machines: sessions, granted and used minutes, early logoffs and email failures,
+per machine and month (or per machine, or one row per session), as CSV or JSON.
+
+    python usage_report.py LAB-01=/mnt/logs/LAB-01 LAB-02=/mnt/logs/LAB-02 --since 2024-05-01 --until 2024-05-31
+    python usage_report.py /mnt/logs/* --group machine --format json --output usage.json --cache usage_cache.json
+
+Every folder is a Logger_Base_Directory: its current logs and those of its archive folder are read, whatever their
+backend or compression. A folder given without MACHINE= is named after its last path component. Logs written by
+fleet_controller name the machine and user in front of every message ("[LAB-07/student] ..."), those sessions are
+reported under that machine.
+
+Files are parsed in a process pool, each one streamed entry by entry and reduced to a short list of session events
+(heartbeats are collapsed into runs), and sessions are put back together from those events in order, so sessions
+running past midnight are followed from one day's file to the next. With --cache the events of every file are
+kept keyed by its modification time and size, and a later run only parses the files that changed or are new,
+typically today's log and yesterday's freshly archived one.
+"""
+import os
+import re
+import sys
+import csv
+import json
+import argparse
+import traceback
+from time import perf_counter
+from typing import Any, Iterable, Iterator
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from log_query import iter_log_entries
+from log_backends import ARCHIVE_EXTENSIONS, LOG_BACKENDS
+
+CACHE_VERSION:int = 2
+
+_LOG_FILENAME = re.compile(r"^(?P<name>.+)_(?P<day>\d{8})(?:%s)(?:%s)?$" % (
+                            "|".join(re.escape(backend.extension) for backend in LOG_BACKENDS.values()),
+                            "|".join(re.escape(extension) for extension in ARCHIVE_EXTENSIONS.values() if extension)))
+# Fleet logs put "[machine/user] " in front of every message about a session
+_PREFIX = re.compile(r"^\[(?P<key>[^\]/]+/[^\]]*)\] ")
+_LOGIN = re.compile(r"^The login time is (?P<login>.+?)\s*\n\s*You will be logged off at (?P<logoff>.+?)\s*$")
+_HEARTBEAT = re.compile(r"^(?P<left>-?[\d,]+)/(?P<granted>\d+) minutes remaining$")
+_RECEIPT = re.compile(r"\(receipt (?P<receipt>[^)\s]+)\)")
+_CLOCK_TIME = re.compile(r"(?P<hour>\d{1,2}):(?P<minute>\d{2})\s*(?P<half>[AaPp])\.?[Mm]\.?")
+
+# Seconds of slack when deciding whether a session ran to its end: the last heartbeat comes a minute before it
+_END_SLACK_SECONDS:float = 90
+
+FIELDS:dict[str,tuple[str,...]] = {
+                                    "session": ("machine", "user", "start", "end", "granted_minutes", "used_minutes", "outcome",
+                                                "heartbeats", "emails_sent", "email_failures", "partial"),
+                                    "month": ("machine", "month", "sessions", "granted_minutes", "used_minutes", "completed", "early_logoffs",
+                                              "in_progress", "logoff_failures", "unknown", "emails_sent", "email_failures", "critical_errors"),
+                                    "machine": ("machine", "first_session", "last_session", "sessions", "granted_minutes", "used_minutes", "completed",
+                                                "early_logoffs", "in_progress", "logoff_failures", "unknown", "emails_sent", "email_failures", "critical_errors")
+                                  }
+
+def parse_machine_argument(argument:str) -> tuple[str,str]:
+    """MACHINE=DIR, or DIR alone which is named after its last path component."""
+    machine, separator, directory = argument.partition("=")
+    if (not separator) or os.path.isdir(argument):
+        directory = argument
+        machine = os.path.basename(os.path.normpath(argument))
+    return machine, directory
+
+def find_log_files(directory:str, archive_folder:str="archive", log_file:str|None=None) -> list[tuple[str,str]]:
+    """
+    (day YYYYMMDD, path) of every current and archived log under a Logger_Base_Directory, oldest day first and, for
+    a day both archived and current (logged to again after it was archived), the archive first.
+    """
+    found:list[tuple[str,int,str]] = []
+    for order, folder in enumerate((os.path.join(directory, archive_folder), directory)):
+        try:
+            entries:list[os.DirEntry] = list(os.scandir(folder))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            match = _LOG_FILENAME.match(entry.name)
+            if (match is None) or ((log_file is not None) and (match["name"] != log_file)) or (not entry.is_file()):
+                continue
+            found.append((match["day"], order, entry.path))
+    return [(day, path) for day, _, path in sorted(found)]
+
+def _clock_minutes(text:str) -> int|None:
+    """Minutes after midnight of a time as written in the login message ("2:15 P.M." or "02:15 PM")."""
+    match = _CLOCK_TIME.search(text)
+    if match is None:
+        return None
+    return (int(match["hour"]) % 12 + (12 if match["half"] in "Pp" else 0)) * 60 + int(match["minute"])
+
+def summarize_file(path:str) -> dict[str,Any]:
+    """
+    Streams one log file and reduces it to session events, in the order they were logged:
+        ["start", timestamp, key, granted minutes or None]
+        ["beats", first timestamp, last timestamp, key, count, minutes left at the last one, granted minutes]
+        ["end", timestamp, key, "logged off" | "logoff failed" | "cancelled"]
+        ["email", timestamp, key, sent, receipt id or None]
+        ["critical", timestamp, key]
+    key is "machine/user" for fleet logs and "" otherwise. Consecutive heartbeats of a session become one "beats"
+    event. The receipt id is the one Email_Outbox puts in its log lines, None for older logs. A file that cannot be read to the end keeps the events read so far and reports the error.
+    """
+    events:list[list] = []
+    open_beats:dict[str,list] = {}  # key -> its "beats" event still being extended
+    entries:int = 0
+    error:str|None = None
+    try:
+        for record in iter_log_entries(path):
+            entries += 1
+            message:str = record["message"]
+            status:str = record["status"]
+            timestamp:str = record["timestamp"]
+            key:str = ""
+            prefix = _PREFIX.match(message)
+            if prefix is not None:
+                key = prefix["key"]
+                message = message[prefix.end():]
+
+            heartbeat = _HEARTBEAT.match(message) if status == "INFO" else None
+            if heartbeat is not None:
+                left:int = int(heartbeat["left"].replace(",", ""))
+                granted:int = int(heartbeat["granted"])
+                beats:list|None = open_beats.get(key)
+                if (beats is not None) and (beats[6] == granted) and (left <= beats[5]):
+                    beats[2], beats[4], beats[5] = timestamp, beats[4] + 1, left
+                else:
+                    open_beats[key] = ["beats", timestamp, timestamp, key, 1, left, granted]
+                    events.append(open_beats[key])
+                continue
+
+            login = _LOGIN.match(message) if status == "INFO" else None
+            if login is not None:
+                open_beats.pop(key, None)
+                login_minutes, logoff_minutes = _clock_minutes(login["login"]), _clock_minutes(login["logoff"])
+                granted = None if (login_minutes is None) or (logoff_minutes is None) else (logoff_minutes - login_minutes) % (24 * 60)
+                events.append(["start", timestamp, key, granted])
+            elif key and (status == "SUCCESS") and (message == "Logged off."):
+                open_beats.pop(key, None)
+                events.append(["end", timestamp, key, "logged off"])
+            elif key and (status == "ERROR") and message.startswith("Logoff failed"):
+                open_beats.pop(key, None)
+                events.append(["end", timestamp, key, "logoff failed"])
+            elif key and (status == "INFO") and message.startswith("Session "):
+                open_beats.pop(key, None)
+                events.append(["end", timestamp, key, "cancelled"])
+            elif (status == "SUCCESS") and message.startswith("Login email successfully sent"):
+                receipt = _RECEIPT.search(message)
+                events.append(["email", timestamp, key, True, None if receipt is None else receipt["receipt"]])
+            elif (status == "ERROR") and (message.startswith("Email failed to send") or message.startswith("Receipt could not be queued")):
+                receipt = _RECEIPT.search(message)
+                events.append(["email", timestamp, key, False, None if receipt is None else receipt["receipt"]])
+            elif status == "CRITICAL":
+                events.append(["critical", timestamp, key])
+    except Exception:
+        error = traceback.format_exc(limit=3)
+    return {"events": events, "entries": entries, "error": error}
+
+def _summarize_job(job:tuple[str,str]) -> tuple[str,dict[str,Any]]:
+    path, _ = job
+    return path, summarize_file(path)
+
+def load_cache(cache_path:str|None) -> dict[str,dict]:
+    """{path: {"mtime_ns", "size", "result"}} from an earlier run, empty when there is none or it is unreadable."""
+    if (cache_path is None) or (not os.path.exists(cache_path)):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            cache:dict = json.load(cache_file)
+        return cache["files"] if cache.get("version") == CACHE_VERSION else {}
+    except Exception:
+        traceback.print_exc()
+        return {}
+
+def save_cache(cache_path:str, files:dict[str,dict]) -> None:
+    """Writes the cache through a temporary file. Entries of files that no longer exist (archived or pruned since) are dropped."""
+    kept:dict[str,dict] = {path: entry for path, entry in files.items() if os.path.exists(path)}
+    with open(f"{cache_path}.tmp", "w", encoding="utf-8") as cache_file:
+        json.dump({"version": CACHE_VERSION, "files": kept}, cache_file, separators=(",", ":"))
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+def summarize_files(paths:list[str], cache:dict[str,dict], workers:int|None=None) -> tuple[dict[str,dict],dict[str,int]]:
+    """
+    Summaries of paths, reusing those in cache whose file has the same modification time and size and parsing the
+    others in a process pool. cache is updated in place. Returns {path: summary} and counts of parsed and cached files.
+    """
+    summaries:dict[str,dict] = {}
+    jobs:list[tuple[str,str]] = []
+    signatures:dict[str,tuple[int,int]] = {}
+    for path in paths:
+        stat:os.stat_result = os.stat(path)
+        signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        cached:dict|None = cache.get(path)
+        if (cached is not None) and ((cached["mtime_ns"], cached["size"]) == signatures[path]):
+            summaries[path] = cached["result"]
+        else:
+            jobs.append((path, ""))
+
+    workers = workers or os.cpu_count() or 1
+    if (workers == 1) or (len(jobs) <= 1):
+        results:Iterable[tuple[str,dict]] = map(_summarize_job, jobs)
+        summaries.update(_store_results(results, cache, signatures))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_summarize_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+            summaries.update(_store_results(results, cache, signatures))
+    return summaries, {"parsed": len(jobs), "cached": len(paths) - len(jobs)}
+
+def _store_results(results:Iterable[tuple[str,dict]], cache:dict[str,dict], signatures:dict[str,tuple[int,int]]) -> Iterator[tuple[str,dict]]:
+    for path, result in results:
+        if result["error"] is None:  # Unreadable files are retried next time
+            cache[path] = {"mtime_ns": signatures[path][0], "size": signatures[path][1], "result": result}
+        yield path, result
+
+class Session:
+    __slots__ = ("machine", "user", "start", "end", "granted_minutes", "last_seen", "last_left", "heartbeats",
+                 "end_kind", "emails_sent", "email_failures", "partial", "outcome")
+
+    def __init__(self, machine:str, user:str, start:datetime, granted_minutes:int|None, partial:bool=False):
+        self.machine = machine
+        self.user = user
+        self.start = start
+        self.end:datetime|None = None
+        self.granted_minutes = granted_minutes
+        self.last_seen:datetime = start
+        self.last_left:int|None = None
+        self.heartbeats:int = 0
+        self.end_kind:str|None = None
+        self.emails_sent:int = 0
+        self.email_failures:int = 0
+        self.partial = partial  # Its login message was not found, e.g. logged the day before the first file read
+        self.outcome:str = "unknown"
+
+    def finish(self, now:datetime, superseded:bool) -> "Session":
+        """
+        Decides how the session ended:
+            completed       logged off by the program at the end of its time
+            early logoff    ended before its time (fleet sessions cancelled, or heartbeats stopping early)
+            logoff failed   the fleet controller could not log the machine off
+            in progress     still within its time and nothing came after it
+            unknown         no granted minutes known
+        superseded is True when another session started on the machine afterwards.
+        """
+        expected_end:datetime|None = None if self.granted_minutes is None else self.start + timedelta(minutes=self.granted_minutes)
+        if self.end_kind == "logged off":
+            self.outcome = "completed"
+        elif self.end_kind == "logoff failed":
+            self.outcome = "logoff failed"
+        elif self.end_kind == "cancelled":
+            self.outcome = "early logoff"
+        elif expected_end is None:
+            self.outcome = "unknown"
+        elif ((self.last_left is not None) and (self.last_left <= 1)) or (self.last_seen >= expected_end - timedelta(seconds=_END_SLACK_SECONDS)):
+            self.outcome = "completed"
+        elif (not superseded) and (expected_end > now):
+            self.outcome = "in progress"
+        else:
+            self.outcome = "early logoff"
+
+        if self.end is None:
+            if self.outcome == "completed":
+                self.end = expected_end if expected_end is not None else self.last_seen
+            elif self.heartbeats:
+                # The last heartbeat covers the minute after it
+                self.end = self.last_seen + timedelta(minutes=1)
+                if (expected_end is not None) and (self.end > expected_end):
+                    self.end = expected_end
+            else:
+                self.end = self.last_seen
+        return self
+
+    @property
+    def used_minutes(self) -> float:
+        return max(0.0, (self.end - self.start).total_seconds() / 60) if self.end is not None else 0.0
+
+    def as_row(self) -> dict[str,Any]:
+        return {
+                    "machine": self.machine,
+                    "user": self.user,
+                    "start": self.start.isoformat(timespec="seconds"),
+                    "end": self.end.isoformat(timespec="seconds") if self.end is not None else None,
+                    "granted_minutes": self.granted_minutes,
+                    "used_minutes": round(self.used_minutes, 1),
+                    "outcome": self.outcome,
+                    "heartbeats": self.heartbeats,
+                    "emails_sent": self.emails_sent,
+                    "email_failures": self.email_failures,
+                    "partial": self.partial
+               }
+
+def reconstruct_sessions(machine:str, summaries:Iterable[dict[str,Any]], now:datetime|None=None) -> tuple[list[Session],list[tuple[str,datetime,str]]]:
+    """
+    Puts the sessions of one log folder back together from its file summaries, oldest file first. Returns the
+    sessions and the events that belong to no session as (machine, timestamp, "emails_sent" | "email_failures" | "critical_errors").
+    A receipt is counted at most once as sent and once as failed, however many times it was retried.
+    """
+    now = datetime.now() if now is None else now
+    sessions:list[Session] = []
+    open_sessions:dict[str,Session] = {}
+    loose:list[tuple[str,datetime,str]] = []
+    counted_receipts:set[tuple[str,bool]] = set()  # (receipt id, sent)
+
+    def machine_and_user(key:str) -> tuple[str,str]:
+        if not key:
+            return machine, ""
+        session_machine, _, user = key.partition("/")
+        return session_machine, user
+
+    def close(key:str, superseded:bool) -> None:
+        session:Session|None = open_sessions.pop(key, None)
+        if session is not None:
+            sessions.append(session.finish(now, superseded))
+
+    for summary in summaries:
+        for event in summary["events"]:
+            kind:str = event[0]
+            key:str = event[3] if kind == "beats" else event[2]
+            timestamp:datetime = datetime.fromisoformat(event[1])
+            session:Session|None = open_sessions.get(key)
+            if kind == "start":
+                close(key, superseded=True)
+                open_sessions[key] = Session(*machine_and_user(key), start=timestamp, granted_minutes=event[3])
+            elif kind == "beats":
+                _, _, last, _, count, left, granted = event
+                if (session is not None) and session.heartbeats and (session.granted_minutes != granted):
+                    close(key, superseded=True)  # Heartbeats of another session whose login message is missing
+                    session = None
+                if session is None:
+                    session = open_sessions[key] = Session(*machine_and_user(key), start=timestamp - timedelta(minutes=granted - left), granted_minutes=granted, partial=True)
+                session.granted_minutes = granted  # Heartbeats carry the exact minutes, the login message only clock times
+                session.heartbeats += count
+                session.last_seen = datetime.fromisoformat(last)
+                session.last_left = left
+            elif kind == "end":
+                if session is not None:
+                    session.end_kind = event[3]
+                    session.end = timestamp
+                    close(key, superseded=False)
+            elif kind == "critical":
+                loose.append((machine_and_user(key)[0], timestamp, "critical_errors"))
+            else:
+                if event[4] is not None:
+                    if (event[4], event[3]) in counted_receipts:
+                        continue  # The same receipt logged again by a later attempt or session
+                    counted_receipts.add((event[4], event[3]))
+                if session is None:
+                    loose.append((machine_and_user(key)[0], timestamp, "emails_sent" if event[3] else "email_failures"))
+                elif event[3]:
+                    session.emails_sent += 1
+                else:
+                    session.email_failures += 1
+    for key in list(open_sessions):
+        close(key, superseded=False)
+    return sessions, loose
+
+def aggregate(sessions:list[Session], loose:list[tuple[str,datetime,str]], group:str) -> list[dict[str,Any]]:
+    """Rows per session, per machine and month ("month") or per machine ("machine"), with the fields of FIELDS[group]."""
+    if group == "session":
+        return [session.as_row() for session in sorted(sessions, key=lambda session: (session.machine, session.start))]
+    rows:dict[tuple[str,...],dict[str,Any]] = {}
+
+    def row_for(machine:str, moment:datetime) -> dict[str,Any]:
+        key:tuple[str,...] = (machine, f"{moment:%Y-%m}") if group == "month" else (machine,)
+        if key not in rows:
+            row:dict[str,Any] = {field: 0 for field in FIELDS[group]}
+            row["machine"] = machine
+            if group == "month":
+                row["month"] = key[1]
+            else:
+                row["first_session"] = row["last_session"] = None
+            rows[key] = row
+        return rows[key]
+
+    outcome_fields:dict[str,str] = {"completed": "completed", "early logoff": "early_logoffs", "in progress": "in_progress", "logoff failed": "logoff_failures", "unknown": "unknown"}
+    for session in sessions:
+        row:dict[str,Any] = row_for(session.machine, session.start)
+        row["sessions"] += 1
+        row["granted_minutes"] += session.granted_minutes or 0
+        row["used_minutes"] += session.used_minutes
+        row[outcome_fields[session.outcome]] += 1
+        row["emails_sent"] += session.emails_sent
+        row["email_failures"] += session.email_failures
+        if group == "machine":
+            start:str = session.start.isoformat(timespec="seconds")
+            row["first_session"] = min(row["first_session"] or start, start)
+            row["last_session"] = max(row["last_session"] or start, start)
+    for machine, timestamp, field in loose:
+        row_for(machine, timestamp)[field] += 1
+    for row in rows.values():
+        row["used_minutes"] = round(row["used_minutes"], 1)
+    return [rows[key] for key in sorted(rows)]
+
+def build_report(machines:list[tuple[str,str]], group:str="month", since:date|None=None, until:date|None=None,
+                 cache_path:str|None=None, workers:int|None=None, archive_folder:str="archive", log_file:str|None=None,
+                 now:datetime|None=None) -> tuple[list[dict[str,Any]],dict[str,Any]]:
+    """
+    Report rows for every (machine, directory) and statistics of the run: files parsed and taken from the cache,
+    sessions, and {path: error} for files that could not be read to the end. Files are selected by the day in
+    their name, starting a day before since so sessions that began the evening before are put together whole.
+    """
+    files:dict[str,list[str]] = {}
+    for machine, directory in machines:
+        files[machine] = [path for day, path in find_log_files(directory, archive_folder=archive_folder, log_file=log_file)
+                          if ((since is None) or (datetime.strptime(day, "%Y%m%d").date() >= since - timedelta(days=1)))
+                          and ((until is None) or (datetime.strptime(day, "%Y%m%d").date() <= until))]
+
+    cache:dict[str,dict] = load_cache(cache_path)
+    summaries, counts = summarize_files([path for paths in files.values() for path in paths], cache, workers)
+    if cache_path is not None:
+        save_cache(cache_path, cache)
+
+    def in_period(moment:datetime) -> bool:
+        return ((since is None) or (moment.date() >= since)) and ((until is None) or (moment.date() <= until))
+
+    sessions:list[Session] = []
+    loose:list[tuple[str,datetime,str]] = []
+    for machine, paths in files.items():
+        machine_sessions, machine_loose = reconstruct_sessions(machine, (summaries[path] for path in paths), now=now)
+        sessions += [session for session in machine_sessions if in_period(session.start)]
+        loose += [event for event in machine_loose if in_period(event[1])]
+    errors:dict[str,str] = {path: summary["error"] for path, summary in summaries.items() if summary["error"] is not None}
+    return aggregate(sessions, loose, group), {**counts, "files": counts["parsed"] + counts["cached"], "sessions": len(sessions), "errors": errors}
+
+def write_report(rows:list[dict[str,Any]], group:str, report_format:str, output) -> None:
+    if report_format == "json":
+        json.dump(rows, output, indent=4)
+        output.write("\n")
+        return
+    writer = csv.DictWriter(output, fieldnames=FIELDS[group], lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+
+def main(argv:list[str]|None=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("machines", nargs="+", metavar="[MACHINE=]DIR", help="Logger_Base_Directory of each machine")
+    parser.add_argument("--group", default="month", choices=sorted(FIELDS), help="One row per machine and month (default), per machine or per session")
+    parser.add_argument("--format", default="csv", choices=("csv", "json"))
+    parser.add_argument("--output", help="File to write the report to, standard output by default")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day reported, YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last day reported, YYYY-MM-DD")
+    parser.add_argument("--cache", help="Keep the events of every file here and only parse new or changed files next time")
+    parser.add_argument("--workers", type=int, help="Processes to use, every core by default")
+    parser.add_argument("--archive-folder", default="archive", help="Logger_Archive_Folder of the machines")
+    parser.add_argument("--log-file", help="Logger_Filename of the machines, any by default")
+    args = parser.parse_args(argv)
+
+    started:float = perf_counter()
+    rows, statistics = build_report([parse_machine_argument(argument) for argument in args.machines], group=args.group,
+                                    since=args.since, until=args.until, cache_path=args.cache, workers=args.workers,
+                                    archive_folder=args.archive_folder, log_file=args.log_file)
+    if args.output:
+        with open(f"{args.output}.tmp", "w", encoding="utf-8", newline="") as output:
+            write_report(rows, args.group, args.format, output)
+        os.replace(f"{args.output}.tmp", args.output)
+    else:
+        write_report(rows, args.group, args.format, sys.stdout)
+    print(f"{statistics['sessions']:,} session(s) from {statistics['files']:,} file(s) ({statistics['parsed']:,} parsed, {statistics['cached']:,} cached) in {perf_counter() - started:.2f}s", file=sys.stderr)
+    for path, error in statistics["errors"].items():
+        print(f"    {path}: {error.strip().splitlines()[-1]}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
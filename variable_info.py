@@ -0,0 +1,196 @@
+"""
+Variable snapshots for XML_Logger.save_variable_info. Every variable is described by its type, a SHA-256 of its
+value, its size and a short preview, and the rows are streamed to a JSON file in pandas' orient='table' layout
+(pandas.read_json(path, orient="table") reads it back). Nothing proportional to a variable's size is built in
+memory: buffers are hashed in place, containers are hashed piece by piece and previews are truncated before they
+are rendered.
+"""
+import os
+import sys
+import json
+import reprlib
+import hashlib
+from typing import Any, Iterator
+from itertools import islice
+from collections import deque
+
+_HASH_CHUNK_SIZE:int = 64 * 1024
+SIZE_MODES:tuple[str,...] = ("shallow", "sampled", "deep")
+
+_FIELDS:list[dict[str,str]] = [
+                                    {"name": "index", "type": "integer"},
+                                    {"name": "Variable Name", "type": "string"},
+                                    {"name": "Type", "type": "string"},
+                                    {"name": "Hash", "type": "string"},
+                                    {"name": "Size (bytes)", "type": "integer"},
+                                    {"name": "Preview", "type": "string"}
+                              ]
+
+# str() of the built-in containers, rendered piece by piece: (opening, closing, empty, recursive)
+_CONTAINER_REPR:dict[type,tuple[str,str,str,str]] = {
+                                                        list: ("[", "]", "[]", "[...]"),
+                                                        tuple: ("(", ")", "()", "(...)"),
+                                                        dict: ("{", "}", "{}", "{...}"),
+                                                        set: ("{", "}", "set()", "set(...)"),
+                                                        frozenset: ("frozenset({", "})", "frozenset()", "frozenset(...)")
+                                                   }
+
+class _Preview_Repr(reprlib.Repr):
+    """reprlib only truncates str before rendering it, bytes and bytearray would be rendered whole first."""
+    repr_bytes = reprlib.Repr.repr_str
+    repr_bytearray = reprlib.Repr.repr_str
+
+def _repr_pieces(value:Any, active:set[int]) -> Iterator[str]:
+    """Yields repr(value) in pieces, descending into the built-in containers instead of rendering them at once."""
+    value_type:type = type(value)
+    if value_type not in _CONTAINER_REPR:
+        yield repr(value)
+        return
+    opening, closing, empty, recursive = _CONTAINER_REPR[value_type]
+    if not value:
+        yield empty
+        return
+    if id(value) in active:
+        yield recursive
+        return
+    active.add(id(value))
+    try:
+        yield opening
+        first:bool = True
+        for item in (value.items() if value_type is dict else value):
+            if not first:
+                yield ", "
+            first = False
+            if value_type is dict:
+                yield from _repr_pieces(item[0], active)
+                yield ": "
+                yield from _repr_pieces(item[1], active)
+            else:
+                yield from _repr_pieces(item, active)
+        if (value_type is tuple) and (len(value) == 1):
+            yield ","
+        yield closing
+    finally:
+        active.discard(id(value))
+
+def _str_pieces(value:Any) -> Iterator[str]:
+    """str(value) in pieces: strings are sliced, built-in containers are rendered item by item, anything else whole."""
+    if type(value) is str:
+        for start in range(0, len(value), _HASH_CHUNK_SIZE):
+            yield value[start:start + _HASH_CHUNK_SIZE]
+    elif type(value) in _CONTAINER_REPR:
+        yield from _repr_pieces(value, set())
+    else:
+        yield str(value)
+
+def hash_value(value:Any) -> str:
+    """
+    SHA-256 of a variable. Objects exposing the buffer protocol (bytes, bytearray, array, mmap, numpy arrays) are
+    hashed over their raw memory without a copy. Anything else is hashed over str(value), the same digest as
+    hashlib.sha256(str(value).encode()) but fed in pieces, so large strings and containers are never rendered whole.
+    """
+    digest = hashlib.sha256()
+    if not isinstance(value, str):
+        try:
+            view:memoryview = memoryview(value)
+        except TypeError:
+            pass
+        else:
+            with view:
+                digest.update(view if view.c_contiguous else view.tobytes())
+            return digest.hexdigest()
+    pending:list[str] = []
+    pending_length:int = 0
+    for piece in _str_pieces(value):
+        pending.append(piece)
+        pending_length += len(piece)
+        if pending_length >= _HASH_CHUNK_SIZE:
+            digest.update("".join(pending).encode("utf-8"))
+            pending, pending_length = [], 0
+    digest.update("".join(pending).encode("utf-8"))
+    return digest.hexdigest()
+
+def size_of(value:Any, size_mode:str="shallow", sample_size:int=100) -> int:
+    """
+    Bytes used by a variable:
+        shallow  sys.getsizeof of the object itself
+        deep     the object plus everything reachable through containers and instance __dict__s, shared objects counted once
+        sampled  like deep, but containers longer than sample_size are estimated from their first sample_size items
+    """
+    if size_mode == "shallow":
+        return sys.getsizeof(value)
+    if size_mode not in SIZE_MODES:
+        raise ValueError(f"size_mode must be one of {SIZE_MODES}, not {size_mode!r}.")
+    sample:int|None = sample_size if size_mode == "sampled" else None
+    seen:set[int] = set()
+    total:float = 0
+    stack:list[tuple[Any,float]] = [(value, 1.0)]
+    while stack:
+        current, weight = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current) * weight
+        if isinstance(current, dict):
+            items, length, flatten = current.items(), len(current), True
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            items, length, flatten = current, len(current), False
+        elif hasattr(current, "__dict__") and not isinstance(current, type):
+            stack.append((vars(current), weight))
+            continue
+        else:
+            continue
+        if (sample is not None) and (length > sample):
+            items, weight = islice(items, sample), weight * length / sample
+        for item in items:
+            if flatten:
+                stack.append((item[0], weight))
+                stack.append((item[1], weight))
+            else:
+                stack.append((item, weight))
+    return int(total)
+
+def iter_variables(globals_dict:dict[str,Any], locals_dict:dict[str,Any]) -> Iterator[tuple[str,Any]]:
+    """Variables of both scopes, locals winning over globals, without special names, callables and modules."""
+    for name, value in {**globals_dict, **locals_dict}.items():
+        if name.startswith('__') and name.endswith('__'):
+            continue
+        if callable(value):
+            continue
+        if isinstance(value, type(sys)):  # Skip modules
+            continue
+        yield name, value
+
+def write_variable_info(path:str, variables:Iterator[tuple[str,Any]], size_mode:str="shallow", sample_size:int=100, preview_length:int=80) -> int:
+    """Streams one row per variable to path (written to a temporary file and moved into place). Returns the number of rows."""
+    preview = _Preview_Repr()
+    preview.maxstring = preview.maxother = preview_length
+    temporary_path:str = f"{path}.tmp"
+    rows:int = 0
+    with open(temporary_path, "w", encoding="utf-8") as output:
+        output.write('{\n    "schema": ')
+        output.write(json.dumps({"fields": _FIELDS, "primaryKey": ["index"], "pandas_version": "1.4.0"}))
+        output.write(',\n    "data": [')
+        for name, value in variables:
+            try:
+                value_hash:str = hash_value(value)
+            except Exception:
+                value_hash = "Unhashable"
+            try:
+                value_preview:str = preview.repr(value)
+            except Exception:
+                value_preview = f"<{type(value).__name__}>"
+            row:dict[str,str|int] = {
+                                        "index": rows,
+                                        "Variable Name": name,
+                                        "Type": type(value).__name__,
+                                        "Hash": value_hash,
+                                        "Size (bytes)": size_of(value, size_mode, sample_size),
+                                        "Preview": value_preview
+                                    }
+            output.write(",\n        " if rows else "\n        ")
+            output.write(json.dumps(row))
+            rows += 1
+        output.write("\n    ]\n}\n" if rows else "]\n}\n")
+    os.replace(temporary_path, path)
+    return rows
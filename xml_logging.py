@@ -1,136 +1,498 @@
 import os
-import sys
+import json
+import queue
+import atexit
 import shutil
-import hashlib
+import importlib.util
+import threading
 import traceback
+from time import monotonic
 from typing import Any
-from pandas import DataFrame
-from xml.sax.saxutils import escape as xml_sax_escape
 from datetime import datetime,timedelta
-from xml.etree import ElementTree as ET
+from metrics import timed, timed_calls, increment
+from variable_info import iter_variables, write_variable_info
+from log_backends import ARCHIVE_EXTENSIONS, Log_Backend, get_backend, open_archive, write_gzip_members
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Markers placed on the asynchronous queue next to the (filename, entry) records
+_FLUSH_REQUEST = object()
+_CLOSE_REQUEST = object()
+
+# How long to wait before archiving again after a failed attempt
+_ARCHIVE_RETRY_INTERVAL:timedelta = timedelta(minutes=5)
+
+def index_path_for(path:str) -> str:
+    """Path of the hour index kept next to a current or archived log file (log_20240101.jsonl[.gz] -> log_20240101.jsonl.idx)."""
+    for extension in ARCHIVE_EXTENSIONS.values():
+        if extension and path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+    return f"{path}.idx"
+
+def read_hour_index(index_path:str) -> dict[str,int]:
+    """Reads an hour index into {HH: byte offset of the first entry of that hour}. A missing index gives an empty dict."""
+    hour_index:dict[str,int] = {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                fields:list[str] = line.split()
+                if len(fields) >= 2:
+                    hour_index.setdefault(fields[0], int(fields[1]))
+    except FileNotFoundError:
+        pass
+    return hour_index
+
+def read_member_offsets(index_path:str) -> dict[int,int]:
+    """
+    Reads the third field of the index of a gzip archive written one member per hour: {offset of the hour in the
+    uncompressed log: offset of its gzip member in the archive}. Empty for other files.
+    """
+    member_offsets:dict[int,int] = {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                fields:list[str] = line.split()
+                if len(fields) == 3:
+                    member_offsets[int(fields[1])] = int(fields[2])
+    except FileNotFoundError:
+        pass
+    return member_offsets
+
+def write_hour_index(index_path:str, hour_index:dict[str,int], member_offsets:dict[int,int]|None=None) -> None:
+    """
+    Replaces an hour index as a whole, through a temporary file so readers never see half of it. Lines are
+    "HH OFFSET", followed by the compressed offset of the hour's gzip member when member_offsets is given.
+    """
+    with open(f"{index_path}.tmp", "w", encoding="utf-8") as index_file:
+        if member_offsets is None:
+            index_file.write("".join(f"{hour} {offset}\n" for hour, offset in sorted(hour_index.items())))
+        else:
+            index_file.write("".join(f"{hour} {offset} {member_offsets[offset]}\n" for hour, offset in sorted(hour_index.items())))
+    os.replace(f"{index_path}.tmp", index_path)
+
+class Inter_Process_Lock:
+    """
+    Exclusive advisory lock (flock on POSIX, msvcrt.locking on Windows) on a small lock file, so that several
+    processes can safely write the same logs. Also excludes the threads of the current process.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self._thread_lock:threading.Lock = threading.Lock()
+        self._handle = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if self._handle is None:
+                self._handle = open(self.path, "a+b")
+            if os.name == "nt":
+                self._handle.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after 10 seconds, keep waiting for the other process
+            else:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if os.name == "nt":
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
 
 class XML_Logger:
-    def __init__(self,log_file:str,archive_folder="archive",log_retention_days=30,base_dir=os.path.dirname(os.path.abspath(__file__))):
+    def __init__(self,log_file:str,archive_folder="archive",log_retention_days=30,base_dir=os.path.dirname(os.path.abspath(__file__)),
+                 asynchronous:bool=False,queue_size:int=10000,batch_size:int=500,flush_interval:float=1.0,archive_compression:str|None="gzip",
+                 backend:str|Log_Backend="xml",concurrent:bool=False):
+        """
+        Set concurrent to True when several processes log to the same base_dir and log_file (for example every
+        session of a terminal server). Appends, rotation and retention are then serialized with an advisory file lock.
+
+        Entries are stored by backend: "xml" (the original format), "jsonl" or "binary", see log_backends.
+
+        Archived days are compressed with archive_compression ("gzip", "zstd" or None) and listed in a manifest
+        next to them, so retention never has to scan the archive folder. Without the optional zstandard package
+        "zstd" falls back to gzip and a WARNING entry is logged.
+
+        When asynchronous is True, log_to_xml only queues the entry and a background writer thread appends
+        queued entries to disk in batches of up to batch_size, or after flush_interval seconds, whichever comes first.
+        Call flush() or close() before the process ends so that no queued entries are lost.
+        """
         self.log_file = log_file
         self.archive_folder = archive_folder
         self.log_retention_days = log_retention_days
         self.base_dir = base_dir
+        if archive_compression not in ARCHIVE_EXTENSIONS:
+            raise ValueError(f"Unknown archive compression {archive_compression!r}, expected one of {list(ARCHIVE_EXTENSIONS)}.")
+        compression_warning:str|None = None
+        if (archive_compression == "zstd") and (importlib.util.find_spec("zstandard") is None):
+            # Only checked for here, zstandard is imported by open_archive when a day is archived
+            compression_warning = "zstandard is not installed, archived logs are compressed with gzip instead of zstd."
+            archive_compression = "gzip"
+        self.archive_compression = archive_compression
+        self.backend:Log_Backend = get_backend(backend) if isinstance(backend, str) else backend
+        self.asynchronous = asynchronous
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._current_day:str|None = None
+        self._next_rollover:datetime|None = None
+        self._rotation_lock:threading.Lock = threading.Lock()
+        self._indexed_hours:dict[str,str|None] = {}
+        self.concurrent = concurrent
+        self._file_lock = Inter_Process_Lock(os.path.join(base_dir, f"{log_file}.lock")) if concurrent else threading.Lock()
+        self._queue:queue.Queue|None = None
+        self._writer:threading.Thread|None = None
+        if asynchronous:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._writer_loop, name="XML_Logger writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+        if compression_warning is not None:
+            self.log_to_xml(compression_warning, basepath=base_dir, status="WARNING")
 
-    def save_variable_info(self,globals_dict:dict[str,Any],locals_dict:dict[str,Any],variable_save_path:str) -> None:
+    def save_variable_info(self,globals_dict:dict[str,Any],locals_dict:dict[str,Any],variable_save_path:str,
+                           size_mode:str="shallow",sample_size:int=100,preview_length:int=80) -> None:
+        """
+        Save the name, type, SHA-256, size and a short preview of every variable in globals_dict and locals_dict to
+        base_dir/variable_save_path as orient='table' JSON. Rows are written one at a time and no variable is ever
+        rendered whole, see variable_info. size_mode is "shallow" (sys.getsizeof), "sampled" or "deep".
+        """
         try:
-            # Combine them, prioritizing locals (to avoid duplicates)
-            all_vars:dict[str,Any] = {**globals_dict, **locals_dict}
-            
-            # Filter out modules, functions, and built-ins
-            variable_info:list[dict[str,str|int|float|list|set|dict|bytes]] = []
-            for name, value in all_vars.items():
-                # Skip special variables, modules, and callables
-                if name.startswith('__') and name.endswith('__'):
-                    continue
-                if callable(value):
-                    continue
-                if isinstance(value, type(sys)):  # Skip modules
-                    continue
-                    
-                # Get variable details
-                var_type:str = type(value).__name__
-                try:
-                    var_hash:str = hashlib.sha256(str(value).encode('utf-8')).hexdigest()
-                except Exception:
-                    var_hash:str = "Unhashable"
-                
-                var_size:int = sys.getsizeof(value)
-                
-                variable_info.append({
-                    "Variable Name": name,
-                    "Type": var_type,
-                    "Hash": var_hash,
-                    "Size (bytes)": var_size
-                })
-            
-            # Convert to a DataFrame for nice tabular output
-            df:DataFrame = DataFrame(variable_info)
-            df.to_json(os.path.join(self.base_dir,variable_save_path),orient='table',indent=4)
+            write_variable_info(os.path.join(self.base_dir,variable_save_path), iter_variables(globals_dict, locals_dict),
+                                size_mode=size_mode, sample_size=sample_size, preview_length=preview_length)
         except Exception as e:
             traceback.print_exc()
             print(str(e))
 
     def get_current_log_filename(self,basepath:str) -> str:
         """Generates a log filename based on the current date."""
-        return f"{basepath}/{self.log_file}_{datetime.now().strftime('%Y%m%d')}.xml"
+        return self.get_dated_log_filename(basepath=basepath, day=datetime.now().strftime('%Y%m%d'))
+
+    def get_dated_log_filename(self,basepath:str,day:str) -> str:
+        """Generates the log filename for a day formatted as YYYYMMDD."""
+        return f"{basepath}/{self.log_file}_{day}{self.backend.extension}"
+
+    def get_archive_directory(self) -> str:
+        """Archive folder resolved against base_dir (an absolute archive_folder is used as is)."""
+        return os.path.join(self.base_dir, self.archive_folder)
 
     def rotate_logs(self):
-        """Checks if the log file date has changed and archives it if needed."""
-        current_date = datetime.now().strftime("%Y%m%d")
-        
-        # Get the last modified date of the existing log file
-        if os.path.exists(self.log_file):
-            modified_time = datetime.fromtimestamp(os.path.getmtime(self.log_file)).strftime("%Y%m%d")
+        """
+        Archives the dated log files of previous days once the day changes.
+        Until midnight passes this is a single in-memory comparison, no filesystem calls are made.
+        A failed archive is printed and retried a few minutes later, logging carries on meanwhile.
+        """
+        now:datetime = datetime.now()
+        if (self._next_rollover is not None) and (now < self._next_rollover):
+            return
 
-            if modified_time != current_date:  # If the log is from a previous day, archive it
-                # Ensure archive folder exists
-                if not os.path.exists(self.archive_folder):
-                    os.makedirs(self.archive_folder)
+        with self._rotation_lock:
+            if (self._next_rollover is not None) and (now < self._next_rollover):
+                return  # Another thread rotated while this one was waiting
 
-                # Move the old log file to archive with a date-based name
-                archive_filename = f"{self.archive_folder}/{self.log_file}_{modified_time}.xml"
-                shutil.move(self.log_file, archive_filename)
+            previous_day:str|None = self._current_day
+            self._current_day = now.strftime("%Y%m%d")
+            self._next_rollover = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
 
-                # Perform cleanup of old logs
-                self.delete_old_logs()
+            try:
+                with self._file_lock, timed("log_rotation"):
+                    if previous_day is None:
+                        # First rotation in this process, pick up days left behind by earlier runs
+                        stale_days:list[str] = self._find_unarchived_days()
+                    else:
+                        stale_days:list[str] = [previous_day]
 
-    def delete_old_logs(self):
-        """Deletes logs that are older than LOG_RETENTION_DAYS."""
-        cutoff_date:datetime = datetime.now() - timedelta(days=self.log_retention_days)
+                    archived:bool = False
+                    for day in stale_days:
+                        if day != self._current_day:
+                            archived = self._archive_day(day) or archived
 
-        if not os.path.exists(self.archive_folder):
-            return  # No logs to delete
+                    if archived:
+                        # Perform cleanup of old logs
+                        self.delete_old_logs()
+            except Exception:
+                # Archiving must never cost the entry being logged. Days left in base_dir are found again by the scan
+                # of the next attempt
+                traceback.print_exc()
+                self._current_day = None
+                self._next_rollover = now + _ARCHIVE_RETRY_INTERVAL
 
-        for filename in os.listdir(self.archive_folder):
-            if filename.startswith(f"{self.log_file}") and filename.endswith(".xml"):
-                try:
-                    # Extract date from filename
-                    date_str:str = filename.replace(f"{self.log_file}", "").replace(".xml", "")
-                    log_date:datetime = datetime.strptime(date_str, "%Y%m%d")
+    def _find_unarchived_days(self) -> list[str]:
+        """Lists the days of the dated log files still sitting in base_dir."""
+        prefix:str = f"{self.log_file}_"
+        extension:str = self.backend.extension
+        try:
+            filenames:list[str] = os.listdir(self.base_dir)
+        except FileNotFoundError:
+            return []
+
+        days:list[str] = []
+        for filename in filenames:
+            day:str = filename[len(prefix):-len(extension)]
+            if filename.startswith(prefix) and filename.endswith(extension) and (len(day) == 8) and day.isdigit():
+                days.append(day)
+        return sorted(days)
+
+    @timed_calls("log_archive")
+    def _archive_day(self, day:str) -> bool:
+        """
+        Compresses the log file of the given day from base_dir into the archive folder and records it in the manifest.
+        Returns False if there was no file for that day.
+        """
+        log_filename:str = self.get_dated_log_filename(basepath=self.base_dir, day=day)
+        if not os.path.exists(log_filename):
+            return False
 
-                    # Delete files older than retention period
-                    if log_date < cutoff_date:
-                        file_path:str = os.path.join(self.archive_folder, filename)
-                        os.remove(file_path)
+        # Ensure archive folder exists
+        archive_directory:str = self.get_archive_directory()
+        os.makedirs(archive_directory, exist_ok=True)
 
-                except ValueError:
-                    # Ignore files that don't match the expected date format
-                    pass
+        manifest:dict[str,str] = self.load_manifest()
+        previous_archive:str|None = manifest.get(day)
+        if (previous_archive is not None) and os.path.exists(os.path.join(archive_directory, previous_archive)):
+            # Another process logged to this day after it had been archived
+            self._merge_archived_entries(os.path.join(archive_directory, previous_archive), log_filename)
 
+        # Compress the old log file into the archive with a date-based name
+        archive_filename:str = os.path.basename(self.get_dated_log_filename(basepath=archive_directory, day=day)) + ARCHIVE_EXTENSIONS[self.archive_compression]
+        archive_path:str = os.path.join(archive_directory, archive_filename)
+        if self.archive_compression == "gzip":
+            # One gzip member per hour, whose compressed offsets go in the index so queries only decompress the hours they read
+            with open(log_filename, "rb") as source:
+                hour_index:dict[str,int] = read_hour_index(index_path_for(log_filename)) or self.backend.build_hour_index(source)
+                with open(f"{archive_path}.tmp", "wb") as destination:
+                    member_offsets:dict[int,int] = write_gzip_members(source, destination, list(hour_index.values()))
+            os.replace(f"{archive_path}.tmp", archive_path)
+            os.remove(log_filename)
+            write_hour_index(index_path_for(archive_path), hour_index, member_offsets)
+            if os.path.exists(index_path_for(log_filename)):
+                os.remove(index_path_for(log_filename))
+        else:
+            with open(log_filename, "rb") as source, open_archive(f"{archive_path}.tmp", "wb", compression=self.archive_compression) as destination:
+                shutil.copyfileobj(source, destination)
+            os.replace(f"{archive_path}.tmp", archive_path)
+            os.remove(log_filename)
+            if os.path.exists(index_path_for(log_filename)):
+                # Offsets in the hour index refer to the uncompressed log so the index is kept as is
+                os.replace(index_path_for(log_filename), index_path_for(archive_path))
+        self._indexed_hours.pop(log_filename, None)
+        if (previous_archive is not None) and (previous_archive != archive_filename):
+            os.remove(os.path.join(archive_directory, previous_archive))  # Archived with another compression
+
+        manifest[day] = archive_filename
+        self._save_manifest(manifest)
+        return True
+
+    def _merge_archived_entries(self, archive_path:str, log_filename:str) -> None:
+        """Rewrites log_filename with the entries of an existing archive of the same day in front of its own."""
+        merged_filename:str = f"{log_filename}.merge"
+        if os.path.exists(merged_filename):
+            os.remove(merged_filename)  # Left behind by an interrupted merge
+
+        for source_path in (archive_path, log_filename):
+            with open_archive(source_path, "rb") as source:
+                batch:list[bytes] = []
+                for record in self.backend.iter_entries(source):
+                    batch.append(self.backend.encode(datetime.fromisoformat(record["timestamp"]), record["status"], record["message"]))
+                    if len(batch) >= self.batch_size:
+                        self.backend.append(merged_filename, b"".join(batch))
+                        batch.clear()
+                if batch:
+                    self.backend.append(merged_filename, b"".join(batch))
+
+        with open(merged_filename, "rb") as merged:
+            write_hour_index(index_path_for(log_filename), self.backend.build_hour_index(merged))
+        os.replace(merged_filename, log_filename)
+
+    def get_manifest_path(self) -> str:
+        """The manifest maps each archived day (YYYYMMDD) to its file name in the archive folder."""
+        return os.path.join(self.get_archive_directory(), f"{self.log_file}_manifest.json")
+
+    def load_manifest(self) -> dict[str,str]:
+        """
+        Reads the archive manifest. Archive folders written before the manifest existed are scanned once
+        and the manifest is created from the files found.
+        """
+        try:
+            with open(self.get_manifest_path(), "r", encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            pass
+
+        archive_directory:str = self.get_archive_directory()
+        if not os.path.exists(archive_directory):
+            return {}
+
+        manifest:dict[str,str] = {}
+        prefix:str = f"{self.log_file}_"
+        for filename in os.listdir(archive_directory):
+            for extension in ARCHIVE_EXTENSIONS.values():
+                if filename.startswith(prefix) and filename.endswith(f"{self.backend.extension}{extension}"):
+                    day:str = filename[len(prefix):-len(f"{self.backend.extension}{extension}")]
+                    if (len(day) == 8) and day.isdigit():
+                        manifest[day] = filename
+        self._save_manifest(manifest)
+        return manifest
+
+    def _save_manifest(self, manifest:dict[str,str]) -> None:
+        """Writes the manifest to a temporary file first so a crash never leaves a half written manifest."""
+        manifest_path:str = self.get_manifest_path()
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(dict(sorted(manifest.items())), manifest_file, indent=4)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @timed_calls("log_prune")
+    def delete_old_logs(self):
+        """Deletes logs that are older than LOG_RETENTION_DAYS. Only the manifest is read, the archive folder is never listed."""
+        cutoff_day:str = (datetime.now() - timedelta(days=self.log_retention_days)).strftime("%Y%m%d")
+
+        manifest:dict[str,str] = self.load_manifest()
+        expired_days:list[str] = [day for day in manifest if day <= cutoff_day]
+        if not expired_days:
+            return
+
+        for day in expired_days:
+            archive_path:str = os.path.join(self.get_archive_directory(), manifest.pop(day))
+            for path in (archive_path, index_path_for(archive_path)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Already removed by hand (or never indexed), only the manifest entry was left
+        self._save_manifest(manifest)
+
+    @timed_calls("log_call")
     def log_to_xml(self, message:str, basepath:str, status="INFO"):
         """
-        Logs a message to an XML file, ensuring daily log rotation and old log cleanup.
+        Logs a message to the day's log file (XML unless another backend is configured), ensuring daily log rotation and old log cleanup.
         """
+        entry:tuple[str,bytes] = self._build_entry(message=message, status=status)
+        if self._writer is not None:
+            # The writer thread rotates after each batch so a queued entry never recreates an archived file
+            # Blocks only when the queue is full, which keeps memory bounded if the disk falls behind
+            self._queue.put((self.get_current_log_filename(basepath=basepath), entry))
+            return
+
         self.rotate_logs()  # Check if the date has changed and archive if necessary
 
-        # Get the correct filename for today's log
-        current_log_file = self.get_current_log_filename(basepath=basepath)
+        # Only the new entry is written to today's log, the rest of the file is never read back
+        self._append_entries(self.get_current_log_filename(basepath=basepath), [entry])
+
+    def flush(self) -> None:
+        """Blocks until every entry queued so far has been written to disk. Does nothing in synchronous mode."""
+        if self._writer is None:
+            return
+        self._queue.put(_FLUSH_REQUEST)
+        self._queue.join()
+
+    def close(self) -> None:
+        """Writes every queued entry and stops the writer thread. Later calls to log_to_xml write synchronously."""
+        writer = self._writer
+        if writer is None:
+            return
+        self._queue.put(_CLOSE_REQUEST)
+        writer.join()
+        self._writer = None
+        atexit.unregister(self.close)
+
+    def _writer_loop(self) -> None:
+        """Drains the queue in batches so that many small log calls become one larger write."""
+        while True:
+            batch:list = [self._queue.get()]
+            deadline:float = monotonic() + self.flush_interval
+            while (len(batch) < self.batch_size) and (batch[-1] is not _FLUSH_REQUEST) and (batch[-1] is not _CLOSE_REQUEST):
+                timeout:float = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
 
-        # Create file if it does not exist
-        if not os.path.exists(current_log_file):
-            root = ET.Element("logs")
-            tree = ET.ElementTree(root)
-            tree.write(current_log_file)
+            try:
+                self._write_batch([item for item in batch if (item is not _FLUSH_REQUEST) and (item is not _CLOSE_REQUEST)])
+                self.rotate_logs()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
 
-        # Load existing XML file
-        tree = ET.parse(current_log_file)
-        root = tree.getroot()
+            if batch[-1] is _CLOSE_REQUEST:
+                return
 
-        # Create log entry
-        log_entry = ET.SubElement(root, "log")
-        log_entry.set("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"))
-        log_entry.set("status", status)
+    def _write_batch(self, batch:list[tuple[str,tuple[str,bytes]]]) -> None:
+        """Appends queued entries, grouping consecutive entries for the same file into a single write."""
+        index:int = 0
+        while index < len(batch):
+            log_file:str = batch[index][0]
+            entries:list[tuple[str,bytes]] = []
+            while (index < len(batch)) and (batch[index][0] == log_file):
+                entries.append(batch[index][1])
+                index += 1
+            self._append_entries(log_file, entries)
+
+    def _build_entry(self, message:str, status:str) -> tuple[str,bytes]:
+        """Serializes a single entry with the backend. Returns the hour (HH) of its timestamp along with the entry."""
+        timestamp:datetime = datetime.now()
+        return f"{timestamp.hour:02d}", self.backend.encode(timestamp, status, message)
+
+    def _append_entries(self, log_file:str, entries:list[tuple[str,bytes]]) -> None:
+        """
+        Appends already serialized (hour, entry) entries to log_file. Backends only ever append,
+        so the cost only depends on the size of the new entries, not on the size of the file.
+        """
+        with self._file_lock, timed("log_append"):
+            offset, new_file = self.backend.append(log_file, b"".join(entry for _, entry in entries))
+            self._index_entries(log_file, offset=offset, entries=entries, new_file=new_file)
+        increment("log_entries", len(entries))
+
+    def _index_entries(self, log_file:str, offset:int, entries:list[tuple[str,bytes]], new_file:bool) -> None:
+        """
+        Records in the hour index the byte offset of the first entry of every new hour, so readers can seek
+        straight to the hour they need. Index lines are "HH OFFSET" and are only ever appended.
+        """
+        index_path:str = index_path_for(log_file)
+        index_lines:list[str] = []
+        if new_file:
+            last_hour:str|None = None
+            index_mode:str = "w"  # Drop an index left behind by a log file that was removed
+        else:
+            index_mode:str = "a"
+            if log_file in self._indexed_hours:
+                last_hour:str|None = self._indexed_hours[log_file]
+            else:
+                hour_index:dict[str,int] = read_hour_index(index_path)
+                if hour_index:
+                    last_hour:str|None = max(hour_index)
+                else:
+                    # Entries written before indexing started are covered by a marker from midnight
+                    last_hour:str|None = "00"
+                    index_lines.append(f"00 {self.backend.first_entry_offset}\n")
 
-        message_element = ET.SubElement(log_entry, "message")
-        message_element.text = xml_sax_escape(message)
+        for hour, entry in entries:
+            if (last_hour is None) or (hour > last_hour):
+                index_lines.append(f"{hour} {offset}\n")
+                last_hour = hour
+            offset += len(entry)
 
-        # Write changes back to the file
-        tree.write(current_log_file)
+        self._indexed_hours[log_file] = last_hour
+        if index_lines:
+            with open(index_path, index_mode, encoding="utf-8") as index_file:
+                index_file.write("".join(index_lines))
 
     def __str__(self):
         return f"XML Logger saves to {os.path.join(self.base_dir,self.log_file)}. Archives to {self.archive_folder}."